@@ -17,9 +17,9 @@ def CalculateRMatrix(root_file_name, sampler1_name, sampler2_name, size=4, avera
     +-----------------+---------------------------------------------------------+
     | root_file_name  | Input root file name (raw output)                       |
     +-----------------+---------------------------------------------------------+
-    | sampler1_name   | First sampler name to take coordinates for calculation  |
+    | sampler1_name   | First sampler name or index to take coordinates from    |
     +-----------------+---------------------------------------------------------+
-    | sampler2_name   | Second sampler name to take coordinates for calculation |
+    | sampler2_name   | Second sampler name or index to take coordinates from   |
     +-----------------+---------------------------------------------------------+
     | size (int)      | 4 (x, x', y, y') or 6 (x,x',y,y',T,E)                   |
     +-----------------+---------------------------------------------------------+
@@ -29,23 +29,28 @@ def CalculateRMatrix(root_file_name, sampler1_name, sampler2_name, size=4, avera
     """
 
     root_file = _Data.Load(root_file_name)
-    sampler1_data = _Data.SamplerData(root_file, sampler1_name)
-    sampler2_data = _Data.SamplerData(root_file, sampler2_name)
-
-    sampler1_x  = sampler1_data.data['x']
-    sampler1_xp = sampler1_data.data['xp']
-    sampler1_y  = sampler1_data.data['y']
-    sampler1_yp = sampler1_data.data['yp']
-
-    sampler2_x  = sampler2_data.data['x']
-    sampler2_xp = sampler2_data.data['xp']
-    sampler2_y  = sampler2_data.data['y']
-    sampler2_yp = sampler2_data.data['yp']
-
-    sampler1_time = sampler1_data.data['T']
-    sampler2_time = sampler2_data.data['T']
-    sampler1_energy = sampler1_data.data['energy']
-    sampler2_energy = sampler2_data.data['energy']
+    samplerNames = _Data._SamplerNames(root_file)
+    sampler1_name = samplerNames[_Data._SamplerIndexFromIndexOrName(samplerNames, sampler1_name)]
+    sampler2_name = samplerNames[_Data._SamplerIndexFromIndexOrName(samplerNames, sampler2_name)]
+    samplers = _Data.SamplersData(root_file, [sampler1_name, sampler2_name],
+                                  params=['x', 'xp', 'y', 'yp', 'T', 'energy'])
+    sampler1_data = samplers[sampler1_name.rstrip('.')]
+    sampler2_data = samplers[sampler2_name.rstrip('.')]
+
+    sampler1_x  = sampler1_data['x']
+    sampler1_xp = sampler1_data['xp']
+    sampler1_y  = sampler1_data['y']
+    sampler1_yp = sampler1_data['yp']
+
+    sampler2_x  = sampler2_data['x']
+    sampler2_xp = sampler2_data['xp']
+    sampler2_y  = sampler2_data['y']
+    sampler2_yp = sampler2_data['yp']
+
+    sampler1_time = sampler1_data['T']
+    sampler2_time = sampler2_data['T']
+    sampler1_energy = sampler1_data['energy']
+    sampler2_energy = sampler2_data['energy']
 
     if average :
         sampler1_x  = sampler1_x - sampler1_x.mean()
@@ -101,30 +106,35 @@ def CalculateTaylorMapOrder2(root_file_name, sampler1_name, sampler2_name, avera
     +-----------------+---------------------------------------------------------+
     | root_file_name  | Input root file name (raw output)                       |
     +-----------------+---------------------------------------------------------+
-    | sampler1_name   | First sampler name to take coordinates for calculation  |
+    | sampler1_name   | First sampler name or index to take coordinates from    |
     +-----------------+---------------------------------------------------------+
-    | sampler2_name   | Second sampler name to take coordinates for calculation |
+    | sampler2_name   | Second sampler name or index to take coordinates from   |
     +-----------------+---------------------------------------------------------+
     """
 
     root_file = _Data.Load(root_file_name)
-    sampler1_data = _Data.SamplerData(root_file, sampler1_name)
-    sampler2_data = _Data.SamplerData(root_file, sampler2_name)
-
-    sampler1_x  = sampler1_data.data['x']
-    sampler1_xp = sampler1_data.data['xp']
-    sampler1_y  = sampler1_data.data['y']
-    sampler1_yp = sampler1_data.data['yp']
-
-    sampler2_x  = sampler2_data.data['x']
-    sampler2_xp = sampler2_data.data['xp']
-    sampler2_y  = sampler2_data.data['y']
-    sampler2_yp = sampler2_data.data['yp']
-
-    sampler1_time = sampler1_data.data['T']
-    sampler2_time = sampler2_data.data['T']
-    sampler1_energy = sampler1_data.data['energy']
-    sampler2_energy = sampler2_data.data['energy']
+    samplerNames = _Data._SamplerNames(root_file)
+    sampler1_name = samplerNames[_Data._SamplerIndexFromIndexOrName(samplerNames, sampler1_name)]
+    sampler2_name = samplerNames[_Data._SamplerIndexFromIndexOrName(samplerNames, sampler2_name)]
+    samplers = _Data.SamplersData(root_file, [sampler1_name, sampler2_name],
+                                  params=['x', 'xp', 'y', 'yp', 'T', 'energy'])
+    sampler1_data = samplers[sampler1_name.rstrip('.')]
+    sampler2_data = samplers[sampler2_name.rstrip('.')]
+
+    sampler1_x  = sampler1_data['x']
+    sampler1_xp = sampler1_data['xp']
+    sampler1_y  = sampler1_data['y']
+    sampler1_yp = sampler1_data['yp']
+
+    sampler2_x  = sampler2_data['x']
+    sampler2_xp = sampler2_data['xp']
+    sampler2_y  = sampler2_data['y']
+    sampler2_yp = sampler2_data['yp']
+
+    sampler1_time = sampler1_data['T']
+    sampler2_time = sampler2_data['T']
+    sampler1_energy = sampler1_data['energy']
+    sampler2_energy = sampler2_data['energy']
 
     if average :
         sampler1_x  = sampler1_x - sampler1_x.mean()
@@ -180,18 +190,22 @@ def CalculateEnergyGain(root_file_name, sampler1_name, sampler2_name) :
     +-----------------+---------------------------------------------------------+
     | root_file_name  | Input root file name (raw output)                       |
     +-----------------+---------------------------------------------------------+
-    | sampler1_name   | First sampler name to take coordinates for calculation  |
+    | sampler1_name   | First sampler name or index to take coordinates from    |
     +-----------------+---------------------------------------------------------+
-    | sampler2_name   | Second sampler name to take coordinates for calculation |
+    | sampler2_name   | Second sampler name or index to take coordinates from   |
     +-----------------+---------------------------------------------------------+
     """
 
     root_file = _Data.Load(root_file_name)
-    sampler1_data = _Data.SamplerData(root_file, sampler1_name)
-    sampler2_data = _Data.SamplerData(root_file, sampler2_name)
-
-    if sampler1_data.data['n'][0] == sampler2_data.data['n'][0] :
-        deltaE = sampler2_data.data['energy'] - sampler1_data.data['energy']
+    samplerNames = _Data._SamplerNames(root_file)
+    sampler1_name = samplerNames[_Data._SamplerIndexFromIndexOrName(samplerNames, sampler1_name)]
+    sampler2_name = samplerNames[_Data._SamplerIndexFromIndexOrName(samplerNames, sampler2_name)]
+    samplers = _Data.SamplersData(root_file, [sampler1_name, sampler2_name], params=['n', 'energy'])
+    sampler1_data = samplers[sampler1_name.rstrip('.')]
+    sampler2_data = samplers[sampler2_name.rstrip('.')]
+
+    if sampler1_data['n'][0] == sampler2_data['n'][0] :
+        deltaE = sampler2_data['energy'] - sampler1_data['energy']
     else :
         deltaE = _np.array([0.0])
 
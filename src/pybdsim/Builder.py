@@ -9,6 +9,8 @@ the gmad files required.
 Classes:
 Element - beam line element that always has name,type and length
 Machine - a list of elements
+MachineVariant - a machine with some parameters changed that shares the rest with a Machine
+ElementTable - a compact table of elements that can be used in a Machine
 
 """
 import pybdsim.XSecBias
@@ -19,13 +21,13 @@ from . import Writer as _Writer
 from . import _General
 from ._General import IsFloat as _IsFloat
 
-import bisect as _bisect
 try: # Deprecated, removed in Python 3.10
     from collections import MutableMapping as _MutableMapping
 except ImportError: # Python 3.10 onwards.
     from collections.abc import MutableMapping as _MutableMapping
 from collections import OrderedDict as _OrderedDict
 import math as _math
+import re as _re
 import numpy as _np
 import copy as _copy
 import textwrap as _textwrap
@@ -111,8 +113,12 @@ class ElementBase(_MutableMapping):
     and the representation that allows modification of existing parameters
     of an already declared item.
 
+    The string (BDSIM syntax) is cached as writing a large machine converts
+    every element and usually only a few have changed since the last time.
+    Any change to the parameters or attributes resets it.
     """
     def __init__(self, name, isMultipole=False, **kwargs):
+        self._string = None
         self._store = dict()
         self.name         = name
         self['name']      = name
@@ -124,7 +130,17 @@ class ElementBase(_MutableMapping):
     def __getitem__(self, key):
         return self._store[key]
 
+    def __setattr__(self, key, value):
+        self.__dict__[key] = value
+        self.__dict__['_string'] = None
+
+    def __str__(self):
+        if self._string is None:
+            self.__dict__['_string'] = repr(self)
+        return self._string
+
     def __setitem__(self, key, value):
+        self.__dict__['_string'] = None
         if (key == "name" or key == "category") and value:
             self._store[key] = value
         elif value == "":
@@ -158,6 +174,7 @@ class ElementBase(_MutableMapping):
         return self._keysextra
 
     def __delitem__(self, key):
+        self.__dict__['_string'] = None
         del self._store[key]
         try: # it may be in _store, but not necessarily in _keyextra
             self._keysextra.remove(key)
@@ -272,23 +289,17 @@ class Element(ElementBase):
             self.length += float(ll)
 
     def __repr__(self):
-        s = "{}: {}".format(self.name, self.category)
-        if self._keysextra:
-            for key in sorted(self._keysextra):
-                if (type(self[key]) == tuple
-                    and (self.category != 'thinmultipole')
-                    and (self.category != 'multipole') and self._isMultipole==False):
-                    s += (', ' + key + '=' + str(self[key][0])
-                          + '*' + str(self[key][1]))
-                elif (type(self[key]) == tuple
-                      and ((self.category == 'thinmultipole')
-                           or (self.category == 'multipole') or self._isMultipole)):
-                    s += (', ' + key + '=' + '{'
-                          + (','.join([str(s) for s in self[key]]))+'}')
-                else:
-                    s += ", {}={}".format(key, self[key])
-        s += ';\n'
-        return s
+        multipole = self._isMultipole or self.category in ('thinmultipole', 'multipole')
+        parts = ["{}: {}".format(self.name, self.category)]
+        for key in sorted(self._keysextra):
+            value = self._store[key]
+            if type(value) == tuple and not multipole:
+                parts.append(key + '=' + str(value[0]) + '*' + str(value[1]))
+            elif type(value) == tuple:
+                parts.append(key + '={' + ','.join([str(v) for v in value]) + '}')
+            else:
+                parts.append("{}={}".format(key, value))
+        return ', '.join(parts) + ';\n'
 
     def _split_length(self, points):
         """
@@ -305,7 +316,7 @@ class Element(ElementBase):
             raise TypeError("Element has no length, cannot be split.")
         accumulated_length = 0.0
         split_elements = []
-        This = type(self) # This class, we use to construct the output.
+        This = getattr(self, '_elementClass', type(self)) # This class (not a table view), we use to construct the output.
         if This == Element:
             raise TypeError("Only a specific element can be split.")
         # Not length or name.  We change these here.  We leave
@@ -1034,6 +1045,429 @@ class XSecBias(GmadObject):
         GmadObject.__init__(self, "xsecBias",name,**kwargs)
 
 
+class _RowStore(_MutableMapping):
+    """
+    The parameters of one row of an ElementTable as a dictionary. This is
+    the _store of an element view.
+    """
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row   = row
+
+    def __getitem__(self, key):
+        return self._table._Get(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._table._Set(self._row, key, value)
+
+    def __delitem__(self, key):
+        self._table._Delete(self._row, key)
+
+    def __iter__(self):
+        return iter(self._table._Keys(self._row))
+
+    def __len__(self):
+        return len(self._table._Keys(self._row))
+
+
+class _ElementView(object):
+    """
+    Mixin for an element that is a view of one row of an ElementTable. The view
+    classes derive from this and the element class (e.g. Quadrupole), so they
+    behave as that element, but all parameters are read from and written to the table.
+    """
+    def __setattr__(self, key, value):
+        # unlike ElementBase, use the properties below to set attributes in the table
+        object.__setattr__(self, key, value)
+
+    @property
+    def _store(self):
+        return _RowStore(self._table, self._row)
+
+    @property
+    def _keysextra(self):
+        # a copy - the keys are changed through _store
+        return set(self._table._Keys(self._row)[2:])
+
+    def __str__(self):
+        # not cached to keep the table compact
+        return repr(self)
+
+    @property
+    def _string(self):
+        return None
+
+    @_string.setter
+    def _string(self, value):
+        pass
+
+    @property
+    def name(self):
+        return self._table._names[self._row]
+
+    @name.setter
+    def name(self, value):
+        self._table._Set(self._row, 'name', value)
+
+    @property
+    def category(self):
+        return self._table._categories[self._table._category[self._row]]
+
+    @category.setter
+    def category(self, value):
+        self._table._Set(self._row, 'category', value)
+
+    @property
+    def length(self):
+        return float(self._table._length[self._row])
+
+    @length.setter
+    def length(self, value):
+        self._table._length[self._row] = value
+
+    @property
+    def _isMultipole(self):
+        return bool(self._table._multipole[self._row])
+
+    @_isMultipole.setter
+    def _isMultipole(self, value):
+        self._table._multipole[self._row] = value
+
+    def ToElement(self):
+        """
+        Return an ordinary (independent) element with the same parameters.
+        """
+        return _RebuildElement(self._elementClass, self._State())
+
+    def _State(self):
+        return {'_string'      : None,
+                '_store'       : dict(self._store),
+                'name'         : self.name,
+                '_isMultipole' : self._isMultipole,
+                '_keysextra'   : self._keysextra,
+                'category'     : self.category,
+                'length'       : self.length}
+
+    def __copy__(self):
+        return self.ToElement()
+
+    def __deepcopy__(self, memo):
+        return self.ToElement()
+
+    def __reduce_ex__(self, protocol):
+        return (_RebuildElement, (self._elementClass, self._State()))
+
+
+def _RebuildElement(cls, state):
+    element = cls.__new__(cls)
+    element.__dict__.update(state)
+    return element
+
+
+_elementViewClasses = {}
+
+def _ElementViewClass(cls):
+    """
+    Return the view class for the element class cls.
+    """
+    if cls not in _elementViewClasses:
+        def __new__(viewcls, *args, **kwargs):
+            # making a new element from a view (e.g. when splitting) makes an ordinary element
+            if args or kwargs:
+                return cls(*args, **kwargs)
+            return object.__new__(viewcls)
+        _elementViewClasses[cls] = type(cls.__name__, (_ElementView, cls),
+                                        {'__new__' : __new__, '_elementClass' : cls,
+                                         '__module__' : cls.__module__})
+    return _elementViewClasses[cls]
+
+
+class ElementTable(_MutableMapping):
+    """
+    A compact table of elements that can be used in place of the dictionary
+    of elements in a Machine (see Machine.Compact). It behaves as a dictionary
+    of {name : element}, but the elements are stored as a struct of arrays:
+    a numpy array each for the category, class and length and for each
+    common floating point parameter (e.g. k1, angle, aper1), with a sparse
+    dictionary per element for any other parameters (e.g. integers, strings,
+    values with units). An element taken from the table is a thin view of its
+    row, so changing it changes the table.
+
+    :param elements: dictionary of elements (e.g. Machine.elements) to fill the table with.
+    :type elements: dict
+    :param minFraction: fraction of the elements a floating point parameter must be set
+                        in to be stored as a column. Others are stored sparsely.
+    :type minFraction: float
+
+    >>> t = ElementTable(machine.elements)
+    >>> t['qf1']['k1'] = 0.2
+    >>> t.Sum('angle', machine.sequence)
+    >>> t.LengthByCategory(machine.sequence)
+
+    Only Element instances are stored in the table. Anything else (or an element with
+    extra attributes) is kept as it is.
+
+    Machine-wide quantities are computed with numpy for a list of names, where
+    repeated names (e.g. machine.sequence) are counted each time.
+    """
+    _elementAttributes = {'_string', '_store', 'name', '_isMultipole', '_keysextra', 'category', 'length'}
+
+    def __init__(self, elements=None, minFraction=0.01):
+        elements = {} if elements is None else elements
+        self._names      = []  # name of each row
+        self._index      = {}  # name : row
+        self._n          = 0
+        self._classes    = []
+        self._class      = _np.zeros(0, dtype=_np.int16)
+        self._categories = []
+        self._category   = _np.zeros(0, dtype=_np.int16)
+        self._length     = _np.zeros(0)
+        self._multipole  = _np.zeros(0, dtype=bool)
+        self._columns    = {}  # parameter : numpy array with nan where not set
+        self._sparse     = {}  # parameter : {row : value}
+        self._strings    = {}  # one copy of each string value
+        self._objects    = {}  # row : object stored as it is
+
+        # choose the parameters to store as columns
+        counts = {}
+        for element in elements.values():
+            if isinstance(element, Element):
+                for key, value in element._store.items():
+                    if type(value) is float:
+                        counts[key] = counts.get(key, 0) + 1
+        self._Reserve(len(elements))
+        for key, count in counts.items():
+            if count >= minFraction * len(elements):
+                self._columns[key] = _np.full(len(self._length), _np.nan)
+        for name, element in elements.items():
+            self[name] = element
+
+    def _Reserve(self, n):
+        """
+        Grow the arrays to hold at least n rows.
+        """
+        capacity = len(self._length)
+        if n <= capacity:
+            return
+        capacity = max(n, 2*capacity, 16)
+        def Grow(a, fill):
+            result = _np.full(capacity, fill, dtype=a.dtype)
+            result[:len(a)] = a
+            return result
+        self._class     = Grow(self._class, 0)
+        self._category  = Grow(self._category, 0)
+        self._length    = Grow(self._length, 0.0)
+        self._multipole = Grow(self._multipole, False)
+        for key in self._columns:
+            self._columns[key] = Grow(self._columns[key], _np.nan)
+
+    @staticmethod
+    def _Code(values, value):
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    def __getitem__(self, name):
+        row = self._index[name]
+        if row in self._objects:
+            return self._objects[row]
+        view = object.__new__(_ElementViewClass(self._classes[self._class[row]]))
+        view.__dict__['_table'] = self
+        view.__dict__['_row'] = row
+        return view
+
+    def __setitem__(self, name, element):
+        if isinstance(element, _ElementView) and element._table is self and element._row == self._index.get(name):
+            return # the same row
+        if isinstance(element, _ElementView):
+            element = element.ToElement()
+        if name in self._index:
+            row = self._index[name]
+            self._ClearRow(row)
+        else:
+            row = self._n
+            self._Reserve(row + 1)
+            self._n += 1
+            self._names.append(name)
+            self._index[name] = row
+
+        if (not isinstance(element, Element) or element.name != name
+            or not self._elementAttributes.issuperset(element.__dict__)):
+            # kept as it is, but with its category and length for the queries
+            self._objects[row] = element
+            self._category[row] = self._Code(self._categories, getattr(element, 'category', ''))
+            self._length[row] = getattr(element, 'length', 0.0)
+            return
+        self._class[row]     = self._Code(self._classes, type(element))
+        self._category[row]  = self._Code(self._categories, element.category)
+        self._length[row]    = element.length
+        self._multipole[row] = bool(element._isMultipole)
+        for key, value in element._store.items():
+            if key not in ('name', 'category'):
+                self._Set(row, key, value)
+
+    def _ClearRow(self, row):
+        for column in self._columns.values():
+            column[row] = _np.nan
+        for values in self._sparse.values():
+            values.pop(row, None)
+        self._objects.pop(row, None)
+
+    def __delitem__(self, name):
+        row = self._index.pop(name)
+        self._ClearRow(row)
+        self._names[row] = None
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def _Get(self, row, key):
+        if key == 'name':
+            return self._names[row]
+        if key == 'category':
+            return self._categories[self._category[row]]
+        if key in self._columns:
+            value = self._columns[key][row]
+            if value == value: # not nan
+                return float(value)
+        values = self._sparse.get(key)
+        if values is None or row not in values:
+            raise KeyError(key)
+        return values[row]
+
+    def _Set(self, row, key, value):
+        if key == 'name':
+            del self._index[self._names[row]]
+            self._index[value] = row
+            self._names[row] = value
+        elif key == 'category':
+            self._category[row] = self._Code(self._categories, value)
+        elif key in self._columns and type(value) is float and value == value:
+            self._columns[key][row] = value
+            if key in self._sparse:
+                self._sparse[key].pop(row, None)
+        else:
+            if key in self._columns:
+                self._columns[key][row] = _np.nan
+            if type(value) is str:
+                # e.g. apertureType is usually the same for many elements
+                value = self._strings.setdefault(value, value)
+            self._sparse.setdefault(key, {})[row] = value
+
+    def _Delete(self, row, key):
+        if key in self._columns and self._columns[key][row] == self._columns[key][row]:
+            self._columns[key][row] = _np.nan
+        elif row in self._sparse.get(key, ()):
+            del self._sparse[key][row]
+        else:
+            raise KeyError(key)
+
+    def _Keys(self, row):
+        """
+        The keys of the parameters set for row, starting with 'name' and 'category'.
+        """
+        keys = ['name', 'category']
+        keys.extend(key for key, column in self._columns.items() if column[row] == column[row])
+        keys.extend(key for key, values in self._sparse.items() if row in values)
+        return keys
+
+    def Rows(self, names=None):
+        """
+        Return a numpy array of the row of each name (default all elements in order).
+        """
+        if names is None:
+            return _np.fromiter(self._index.values(), dtype=_np.int64, count=len(self._index))
+        index = self._index
+        return _np.fromiter((index[name] for name in names), dtype=_np.int64, count=len(names))
+
+    def Column(self, parameter, names=None):
+        """
+        Return a numpy array of the numerical value of parameter for each name (default
+        all elements in order). The value is nan if it isn't set or isn't a number.
+        """
+        rows = self.Rows(names)
+        if parameter in self._columns:
+            result = self._columns[parameter][rows]
+        else:
+            result = _np.full(len(rows), _np.nan)
+        # parameters stored sparsely, e.g. integers or values with units
+        sparse = self._sparse.get(parameter)
+        if sparse:
+            def Number(value):
+                if type(value) == tuple:
+                    value = value[0]
+                return value if isinstance(value, _numbers.Number) else _np.nan
+            values = _np.full(len(self._length), _np.nan)
+            values[list(sparse.keys())] = [Number(v) for v in sparse.values()]
+            notSet = _np.isnan(result)
+            result[notSet] = values[rows[notSet]]
+        return result
+
+    def SetColumn(self, parameter, values, names=None):
+        """
+        Set parameter to the floating point values (one per name or a single value)
+        for each name (default all elements in order).
+        """
+        rows = self.Rows(names)
+        if parameter not in self._columns:
+            self._columns[parameter] = _np.full(len(self._length), _np.nan)
+        sparse = self._sparse.get(parameter, {})
+        for row in rows:
+            sparse.pop(row, None)
+        self._columns[parameter][rows] = values
+
+    def Lengths(self, names=None):
+        """
+        Return a numpy array of the length of each name (default all elements in order).
+        """
+        return self._length[self.Rows(names)]
+
+    def Categories(self, names=None):
+        """
+        Return a numpy array of the category of each name (default all elements in order).
+        """
+        return _np.array(self._categories, dtype=object)[self._category[self.Rows(names)]]
+
+    def NamesOfCategory(self, category):
+        """
+        Return a list of the names of the elements (in order) in category or list of categories.
+        """
+        categories = [category] if isinstance(category, str) else category
+        codes = [self._categories.index(c) for c in categories if c in self._categories]
+        rows = self.Rows()
+        names = self._names
+        return [names[row] for row in rows[_np.isin(self._category[rows], codes)]]
+
+    def Sum(self, parameter, names=None):
+        """
+        Return the sum of parameter for the names (default all elements). Repeated
+        names (e.g. Machine.sequence) are counted each time.
+
+        >>> totalAngle = t.Sum('angle', machine.sequence)
+        """
+        return float(_np.nansum(self.Column(parameter, names)))
+
+    def LengthByCategory(self, names=None):
+        """
+        Return a dictionary of {category : total length} for the names (default all elements).
+        Repeated names (e.g. Machine.sequence) are counted each time.
+        """
+        rows = self.Rows(names)
+        codes = self._category[rows]
+        n = len(self._categories)
+        totals = _np.bincount(codes, weights=self._length[rows], minlength=n)
+        present = _np.bincount(codes, minlength=n) > 0
+        return {self._categories[i] : float(totals[i]) for i in _np.flatnonzero(present)}
+
+
 class Machine(object):
     """
     A class represents an accelerator lattice as a sequence of
@@ -1074,13 +1508,83 @@ class Machine(object):
         self.options   = None
         self.energy0   = energy0
         self.energy    = []
-        self.lenint    = []
         self.sr        = sr
         self.energy.append(energy0)
         self.charge    = charge
         self.objects   = []  # list of non-sequence objects e.g crystals, lasers, placements etc.
         self.includesPre  = []
         self.includesPost = []
+        # length of each item in the sequence, the cumulative length up to the end of each
+        # item (valid for the first _lenintValid items) and the positions of each name in the
+        # sequence (None if it must be rebuilt) and the number of occurrences of each name
+        self._lengths     = []
+        self._lenint      = _np.zeros(0)
+        self._lenintValid = 0
+        self._positions   = {}
+        self._counts      = {}
+
+    @property
+    def lenint(self):
+        """
+        Cumulative length (numpy.array) at the end of each item in the sequence.
+        """
+        n = len(self._lengths)
+        if self._lenintValid < n or len(self._lenint) != n:
+            valid = min(self._lenintValid, len(self._lenint), n)
+            start = self._lenint[valid - 1] if valid > 0 else 0.0
+            # sum in order from the last valid value so the result is the same as a running sum
+            new = _np.cumsum(_np.concatenate(([start], self._lengths[valid:])))[1:]
+            self._lenint = _np.concatenate((self._lenint[:valid], new))
+            self._lenintValid = n
+        return self._lenint
+
+    def _SequenceChanged(self, index=0):
+        """
+        Mark the cumulative length from index onwards and the positions of names as invalid.
+        """
+        self._lenintValid = min(self._lenintValid, index)
+        self._positions = None
+
+    def _Count(self, names, change=1):
+        """
+        Add change to the number of occurrences of each name in the sequence.
+        """
+        for name in names:
+            n = self._counts.get(name, 0) + change
+            if n > 0:
+                self._counts[name] = n
+            else:
+                self._counts.pop(name, None)
+
+    def _Positions(self):
+        if self._positions is None:
+            self._positions = {}
+            for i, name in enumerate(self.sequence):
+                self._positions.setdefault(name, []).append(i)
+        return self._positions
+
+    def IndicesOf(self, name):
+        """
+        Return a list of the indices in the sequence of the element with name.
+        """
+        return list(self._Positions().get(name, []))
+
+    def IndexAtS(self, s):
+        """
+        Return the index in the sequence of the item at S (in m) from the start of the
+        machine. An item spans from the cumulative length before it (inclusive) to the
+        end of it. Raises ValueError if s is outside the machine.
+        """
+        lenint = self.lenint
+        if s < 0 or len(lenint) == 0 or s > lenint[-1]:
+            raise ValueError("S = {} is outside the machine".format(s))
+        return min(int(_np.searchsorted(lenint, s, side='right')), len(lenint) - 1)
+
+    def ElementAtS(self, s):
+        """
+        Return the element at S (in m) from the start of the machine.
+        """
+        return self.elements[self.sequence[self.IndexAtS(s)]]
 
     def __repr__(self):
         s = ''
@@ -1112,6 +1616,29 @@ class Machine(object):
         print('Number of elements in sequence: ',len(self.sequence),' <- returning this')
         return len(self.sequence)
 
+    def Compact(self, minFraction=0.01):
+        """
+        Store the elements in an ElementTable to use much less memory for a large
+        machine. The elements are then views of the table (see ElementTable) and
+        machine-wide quantities can be calculated with numpy, e.g.
+
+        >>> t = m.Compact()
+        >>> t.Sum('angle', m.sequence)
+        >>> t.LengthByCategory(m.sequence)
+
+        Returns the table, which is also self.elements.
+        """
+        if not isinstance(self.elements, ElementTable):
+            self.elements = ElementTable(self.elements, minFraction)
+        return self.elements
+
+    def Variant(self):
+        """
+        Return a MachineVariant of this machine (e.g. for one error seed) that
+        records only the changed parameters instead of copying the machine.
+        """
+        return MachineVariant(self)
+
     def __add__(self,other):
         if isinstance(other, Machine):
             result = _copy.deepcopy(self)
@@ -1145,7 +1672,7 @@ class Machine(object):
         if not isinstance(item, (Element, Line)):
             msg = "Only Elements or Lines can be added to the machine"
             raise TypeError(msg)
-        elif item.name not in list(self.elements.keys()):
+        elif item.name not in self.elements:
             #hasn't been used before - define it
             if type(item) is Line:
                 for element in item:
@@ -1159,9 +1686,12 @@ class Machine(object):
         # add to the sequence - optional as we may be appending a parent definition to the list
         # of objects to write before the main definitions.
         if addToSequence:
+            if self._positions is not None:
+                self._positions.setdefault(item.name, []).append(len(self.sequence))
             self.sequence.append(item.name)
+            self._Count([item.name])
+            self._lengths.append(item.length)
             self.length += item.length
-            self.lenint.append(self.length)
 
         # list of elements that produce SR
         elementsSR = ["sbend", "rbend"]
@@ -1202,6 +1732,8 @@ class Machine(object):
         """
         Returns a list of names of elements that are of the specified category.
         """
+        if isinstance(self.elements, ElementTable):
+            return self.elements.NamesOfCategory(category)
         return [k for k,e in self.elements.items() if e.category == category]
 
     def ReplaceWithElement(self, name, newelement, warnAboutLengthDifference=True):
@@ -1209,23 +1741,29 @@ class Machine(object):
         Replace an element in the machine with a new element object (one of the individual
         element pybdsim.Builder classes that inherit the Element class).
         """
-        if name not in self.sequence:
+        if name not in self._counts:
             msg = "{} not found in machine sequence.".format(name)
             raise ValueError(msg)
         if not isinstance(newelement, Element):
             msg = "new element is not a pybdsim.Builder.Element instance."
             raise TypeError(msg)
-        if self.elements[name].length != newelement.length and warnAboutLengthDifference:
-            msg = "Warning: Length of new element is not the same length as existing element {}".format(name)
-            print(msg)
-            currlength = self.elements[name].length
-            self.length -= currlength
-            self.length += newelement.length
-            for i,ename in enumerate(self.sequence):
-                if ename == name:
-                    self.lenint[i] = newelement.length
+        if self.elements[name].length != newelement.length:
+            if warnAboutLengthDifference:
+                msg = "Warning: Length of new element is not the same length as existing element {}".format(name)
+                print(msg)
+            self._UpdateLengths(name, newelement.length)
         self.elements[name] = newelement
 
+    def _UpdateLengths(self, name, length):
+        """
+        Update the length of every occurrence of name in the sequence and the machine length.
+        """
+        positions = self._Positions()[name]
+        for i in positions:
+            self.length += length - self._lengths[i]
+            self._lengths[i] = length
+        self._lenintValid = min(self._lenintValid, positions[0])
+
     def ReplaceElementCategory(self, category, newcategory):
         """
         Change category of all elements of a given category. All parameters of the element
@@ -1238,24 +1776,13 @@ class Machine(object):
     def UpdateElement(self, name, parameter, value):
         """
         Update a parameter for a specified element name. Modifying element length will produce a warning.
-        If a value for that parameter already exists, the value will be overwritten.
-        """
-        if parameter == 'length':
-            msg = 'Caution: modifying an element length will change the machine length.'
-            print(msg)
-            # update total machine length
-            currlength = self.elements[name][parameter]
-            self.length -= currlength
-            self.elements[name][parameter] = value
-            self.length += value
-            for i,ename in enumerate(self.sequence):
-                if ename == name:
-                    self.lenint[i] = value
-        elif name in list(self.elements.keys()):
-            self.elements[name][parameter] = value
-        else:
+        If a value for that parameter already exists, the value will be overwritten. Updating 'l' (or
+        'length') also updates the length of every occurrence of the element and the machine length.
+        """
+        if name not in self.elements:
             msg = 'Unknown element {}'.format(name)
             raise ValueError(msg)
+        self._ApplyUpdates([name], parameter, [value])
 
     def UpdateElements(self, names, parameter, value, namelocation='all'):
         """
@@ -1263,36 +1790,156 @@ class Machine(object):
         names or a string where all elements with names containing that string will be updated. namelocation
         specifies if names string can be at the 'beginning', 'end', or anywhere ('all') in an elements name.
         """
-        # TODO: better method for name matching. Keep basic for now.
         if isinstance(names, str):
             if namelocation.lower() == 'all':
-                elements = [name for name in list(self.elements.keys()) if names in name]
+                elements = [name for name in self.elements if names in name]
             elif namelocation.lower() == 'start':
-                elements = [name for name in list(self.elements.keys()) if names in name[:len(names)]]
+                elements = [name for name in self.elements if name.startswith(names)]
             elif namelocation.lower() == 'end':
-                elements = [name for name in list(self.elements.keys()) if names in name[-len(names):]]
+                elements = [name for name in self.elements if name.endswith(names)]
             else:
                 msg = 'Unknown string location {}'.format(namelocation)
                 raise ValueError(msg)
-            for name in elements:
-                self.UpdateElement(name, parameter, value)
         else:
-            for name in names:
-                self.UpdateElement(name, parameter, value)
+            elements = list(names)
+            for name in elements:
+                if name not in self.elements:
+                    msg = 'Unknown element {}'.format(name)
+                    raise ValueError(msg)
+        self._ApplyUpdates(elements, parameter, [value]*len(elements))
 
     def UpdateCategoryParameter(self, category, parameter, value):
         """
         Update parameter for all elements of a given category.
         """
         names = self.GetNamesOfType(category)
-        self.UpdateElements(names, parameter, value)
+        self._ApplyUpdates(names, parameter, [value]*len(names))
 
     def UpdateGlobalParameter(self, parameter, value):
         """
         Update parameter for all elements of a given category.
         """
         names = list(self.elements.keys())
-        self.UpdateElements(names, parameter, value)
+        self._ApplyUpdates(names, parameter, [value]*len(names))
+
+    def SelectElements(self, pattern=None, category=None, sRange=None, predicate=None):
+        """
+        Return a list of the names of the elements that match all of the given criteria.
+
+        :param pattern: regular expression searched for in each name, e.g. '^qf' or 'q[fd]1'.
+        :type pattern: str
+        :param category: category or list of categories, e.g. 'quadrupole'.
+        :type category: str, list(str)
+        :param sRange: (sStart, sEnd) in m. Elements with an occurrence in the sequence that
+                       overlaps this range are selected. A thin element is selected if it is
+                       inside the range.
+        :type sRange: tuple(float, float)
+        :param predicate: function taking an element and returning True if it should be selected.
+        :type predicate: callable
+
+        The names are in the order of their first occurrence in the sequence if sRange is given,
+        otherwise in the order the elements were defined. Each name appears once.
+        """
+        if sRange is not None:
+            sStart, sEnd = sRange
+            ends    = self.lenint
+            lengths = _np.asarray(self._lengths, dtype=float)
+            starts  = ends - lengths
+            overlap = (ends > sStart) & (starts < sEnd)
+            thin    = (lengths == 0) & (starts >= sStart) & (starts <= sEnd)
+            names = list(dict.fromkeys(self.sequence[i] for i in _np.flatnonzero(overlap | thin)))
+        else:
+            names = list(self.elements.keys())
+
+        if pattern is not None:
+            regex = _re.compile(pattern)
+            names = [name for name in names if regex.search(name)]
+        if category is not None:
+            if isinstance(self.elements, ElementTable):
+                selected = set(self.elements.NamesOfCategory(category))
+                names = [name for name in names if name in selected]
+            else:
+                categories = {category} if isinstance(category, str) else set(category)
+                names = [name for name in names if self.elements[name].category in categories]
+        if predicate is not None:
+            names = [name for name in names if predicate(self.elements[name])]
+        return names
+
+    def BatchUpdate(self, parameter, value, pattern=None, category=None, sRange=None, predicate=None, names=None):
+        """
+        Update parameter for all elements matching the selection in one pass.
+
+        :param parameter: name of the parameter to set, e.g. 'k1' or 'offsetX'.
+        :type parameter: str
+        :param value: a single value for all elements, a list or array of values with one per
+                      selected element (in the order of SelectElements) or a function taking
+                      the element and returning the new value.
+        :type value: float, str, tuple, list, numpy.array, callable
+        :param names: explicit list of element names to update instead of a selection.
+        :type names: list(str)
+
+        pattern, category, sRange and predicate are as in SelectElements.
+
+        >>> m.BatchUpdate('k1', lambda e: e['k1']*1.01, category='quadrupole')
+        >>> m.BatchUpdate('offsetX', numpy.random.normal(0, 1e-4, n), pattern='^q')
+
+        Returns a dictionary of {name : (oldValue, newValue)} for each updated element, where
+        oldValue is None if the parameter wasn't set. Updating 'l' (or 'length') also updates the
+        length of every occurrence of the element and the machine length.
+        """
+        if names is None:
+            names = self.SelectElements(pattern, category, sRange, predicate)
+        else:
+            names = list(names)
+            for name in names:
+                if name not in self.elements:
+                    msg = 'Unknown element {}'.format(name)
+                    raise ValueError(msg)
+
+        if callable(value):
+            values = [value(self.elements[name]) for name in names]
+        elif isinstance(value, (list, _np.ndarray)):
+            if len(value) != len(names):
+                msg = "{} values given for {} selected elements".format(len(value), len(names))
+                raise ValueError(msg)
+            values = list(value)
+        else:
+            values = [value]*len(names)
+        return self._ApplyUpdates(names, parameter, values)
+
+    def _ApplyUpdates(self, names, parameter, values):
+        """
+        Set parameter to the corresponding value for each name and update the lengths
+        in the sequence once at the end if the length was changed.
+        """
+        isLength = parameter in ('l', 'length')
+        if isLength and names:
+            print('Caution: modifying an element length will change the machine length.')
+        report = {}
+        lengthChanged = []
+        for name, value in zip(names, values):
+            if isinstance(value, _np.generic):
+                value = value.item()
+            element = self.elements[name]
+            old = element._store.get(parameter)
+            element[parameter] = value
+            report[name] = (old, element._store.get(parameter))
+            if isLength:
+                length = float(value[0] if type(value) == tuple else value)
+                if length != element.length:
+                    element.length = length
+                    lengthChanged.append(name)
+
+        if lengthChanged:
+            positions = self._Positions()
+            first = len(self._lengths)
+            for name in lengthChanged:
+                for i in positions.get(name, []):
+                    self._lengths[i] = self.elements[name].length
+                    first = min(first, i)
+            self._lenintValid = min(self._lenintValid, first)
+            self.length = float(self.lenint[-1]) if self._lengths else 0.0
+        return report
 
     def Insert(self, newElement, index = 0, after = False, substitute = False):
         """
@@ -1309,10 +1956,10 @@ class Machine(object):
             if index >= len(self.sequence):
                 raise ValueError("Index out of range")
         if isinstance(index, str):
-            if index not in self.sequence:
+            if index not in self._counts:
                 raise ValueError("Element name not found in sequence")
             else:
-                index = self.sequence.index(index)
+                index = self._Positions()[index][0]
                 if after:
                     index += 1
 
@@ -1322,14 +1969,20 @@ class Machine(object):
                 if not substitute:
                     raise ValueError(f"New element {newElement.name} already exists in elements. If you want to overwrite it, set substitute=True")
             self.elements[newElement.name] = newElement
-            
-            # Modify sequence
-            self.sequence.insert(index, newElement.name)
+            name = newElement.name
         elif isinstance(newElement, str):
             if newElement not in self.elements.keys():
                 raise ValueError(f"New element {newElement} not found in elements")
-            # Modify sequence
-            self.sequence.insert(index, newElement)
+            name = newElement
+        else:
+            return
+
+        # Modify sequence
+        self.sequence.insert(index, name)
+        self._Count([name])
+        self._lengths.insert(index, self.elements[name].length)
+        self.length += self.elements[name].length
+        self._SequenceChanged(index)
 
     def InsertAndReplace(self, newElement, sLocation = 0, element_name = None):
         """
@@ -1339,7 +1992,7 @@ class Machine(object):
         s = sLocation
 
         def CheckName(name):
-            if name in self.sequence:
+            if name in self._counts:
                 raise ValueError("This new element by name is already in this machine - name uniquely")
         if type(ne) is list:
             l = _np.array([e.length for e in ne]).sum()
@@ -1350,7 +2003,7 @@ class Machine(object):
             CheckName(ne.name)
 
         if sLocation == 0 and element_name :
-            s = _np.array(self.lenint)[_np.array(self.sequence) == element_name][0]
+            s = self.lenint[self._Positions()[element_name][0]]
         if sLocation != 0 and element_name :
             print("Using sLocation and not element_name")
 
@@ -1373,8 +2026,9 @@ class Machine(object):
         newElements = {}
 
         # first boundary
-        indSStart = _bisect.bisect_left(self.lenint, sStart)
-        if self.lenint[indSStart] == sStart:
+        lenint = self.lenint
+        indSStart = int(_np.searchsorted(lenint, sStart, side='left'))
+        if lenint[indSStart] == sStart:
             indFirstReplace = indSStart + 1 # exactly matches on a boundary
         else:
             if sStart == 0:
@@ -1382,7 +2036,7 @@ class Machine(object):
             else:
                 indFirstReplace = indSStart
                 elToSplit = self.elements[self.sequence[indSStart]]
-                sElStart  = self.lenint[indSStart] - elToSplit.length # easier than boundary indexing issues
+                sElStart  = lenint[indSStart] - elToSplit.length # easier than boundary indexing issues
                 newElsStart = elToSplit.split([sStart - sElStart])
                 firstPart = newElsStart[0]
                 newSequence.append(firstPart.name)
@@ -1397,28 +2051,42 @@ class Machine(object):
             newElements[ne.name] = ne
 
         # second boundary
-        indSEnd = _bisect.bisect(self.lenint, sEnd)
-        if self.lenint[indSEnd] == sEnd:
+        indSEnd = int(_np.searchsorted(lenint, sEnd, side='right'))
+        if lenint[indSEnd] == sEnd:
             indLastReplace = indSEnd - 1 # exactly matches on a boundary
         else:
             indLastReplace = indSEnd
             elToSplit = self.elements[self.sequence[indSEnd]]
-            sElStart  = self.lenint[indSEnd] - elToSplit.length
+            sElStart  = lenint[indSEnd] - elToSplit.length
             newElsEnd = elToSplit.split([sEnd - sElStart])
             secondPart = newElsEnd[1]
             newSequence.append(secondPart.name)
             newElements[secondPart.name] = secondPart 
 
         # do operation
+        redefined = [n for n,e in newElements.items() if n in self.elements and self.elements[n].length != e.length]
+        self._Count(self.sequence[indFirstReplace:indLastReplace+1], -1)
+        self._Count(newSequence)
         self.sequence[indFirstReplace:indLastReplace+1] = newSequence
         self.elements.update(newElements)
-        self.RegenerateLenInt()
+        newLengths = [newElements[n].length for n in newSequence]
+        self.length += sum(newLengths) - sum(self._lengths[indFirstReplace:indLastReplace+1])
+        self._lengths[indFirstReplace:indLastReplace+1] = newLengths
+        self._SequenceChanged(indFirstReplace)
+        # any other occurrences of a redefined element change length too
+        for name in redefined:
+            self._UpdateLengths(name, newElements[name].length)
 
     def RegenerateLenInt(self):
-        ltot = [0.0]
-        for name in self.sequence:
-            ltot.append(ltot[-1] + self.elements[name].length)
-        self.lenint = ltot[1:]
+        """
+        Recalculate the cumulative length of all items in the sequence, e.g. after
+        modifying the sequence or element lengths directly.
+        """
+        self._lengths = [self.elements[name].length for name in self.sequence]
+        self._counts = {}
+        self._Count(self.sequence)
+        self._SequenceChanged(0)
+        self.length = float(self.lenint[-1]) if self._lengths else 0.0
 
     def SynchrotronRadiationRescale(self):
         """
@@ -1855,6 +2523,160 @@ class Machine(object):
                             rmat41=r41, rmat42=r42, rmat43=r43, rmat44=r44,
                             **kwargs))
 
+class MachineVariant(object):
+    """
+    A variant of a Machine with some element parameters changed, e.g. for one
+    seed of an error study. Only the changed values are stored and everything
+    else is shared with the base machine, so many variants can be made quickly
+    without copying it.
+
+    >>> m = pybdsim.Builder.Machine()
+    >>> ... # build machine
+    >>> v = m.Variant() # or MachineVariant(m)
+    >>> v.BatchUpdate('offsetX', numpy.random.normal(0, 1e-4, n), category='quadrupole')
+    >>> v.UpdateElement('qf1', 'k1', 0.21)
+    >>> v.Write('seed1.gmad')
+
+    The written components are the elements of the base machine followed by an
+    element modifier for each changed element (e.g. 'qf1: k1=0.21;'). All other
+    attributes (sequence, beam, options, samplers...) are those of the base machine
+    and modifying the base machine changes every variant of it.
+
+    The changes are stored as {parameter : {name : value}} in self.changes. The
+    length of elements can't be changed as the sequence is shared.
+    """
+    def __init__(self, machine):
+        self.base    = machine
+        self.changes = {}
+
+    def __getattr__(self, name):
+        # anything not in the variant comes from the base machine
+        if name in ("base", "changes"):
+            raise AttributeError(name)
+        return getattr(self.base, name)
+
+    def __repr__(self):
+        s =  'pybdsim.Builder.MachineVariant instance\n'
+        s += str(len(self.ModifiedNames())) + ' of ' + str(len(self.base.elements)) + ' elements modified\n'
+        return s
+
+    def ModifiedNames(self):
+        """
+        Return a list of the names of the modified elements in the order they were first modified.
+        """
+        names = {}
+        for values in self.changes.values():
+            names.update(dict.fromkeys(values))
+        return list(names)
+
+    @property
+    def modifiers(self):
+        """
+        An ElementModifier for each modified element with the changed parameters.
+        """
+        result = _OrderedDict()
+        for parameter, values in self.changes.items():
+            for name, value in values.items():
+                if name in result:
+                    result[name][parameter] = value
+                else:
+                    result[name] = ElementModifier(name, self.base.elements[name]._isMultipole, **{parameter : value})
+        # a value may not be stored, e.g. an empty string
+        return _OrderedDict((name, m) for name, m in result.items() if m._keysextra)
+
+    def GetElement(self, name):
+        """
+        Return the element with name with the changes in this variant applied. This
+        is a copy if it has been changed, so modifying it doesn't change the variant.
+        """
+        element = self.base.elements[name]
+        result = None
+        for parameter, values in self.changes.items():
+            if name in values:
+                if result is None:
+                    result = _copy.copy(element)
+                    result._store = dict(element._store)
+                    result._keysextra = set(element._keysextra)
+                result[parameter] = values[name]
+        return element if result is None else result
+
+    def UpdateElement(self, name, parameter, value):
+        """
+        Set a parameter of the element with name in this variant only.
+        """
+        self.BatchUpdate(parameter, [value], names=[name])
+
+    def BatchUpdate(self, parameter, value, pattern=None, category=None, sRange=None, predicate=None, names=None):
+        """
+        Update parameter for all elements matching the selection in this variant only.
+        The arguments are as in Machine.BatchUpdate. The selection is made with the base
+        machine and a function for value is given each element with the changes in this
+        variant applied (see GetElement).
+
+        Returns a dictionary of {name : (oldValue, newValue)} for each updated element.
+        """
+        if parameter in ('l', 'length'):
+            raise ValueError("The length of an element cannot be changed in a variant of a machine")
+        if names is None:
+            names = self.base.SelectElements(pattern, category, sRange, predicate)
+        else:
+            names = list(names)
+            for name in names:
+                if name not in self.base.elements:
+                    msg = 'Unknown element {}'.format(name)
+                    raise ValueError(msg)
+
+        if callable(value):
+            values = [value(self.GetElement(name)) for name in names]
+        elif isinstance(value, (list, _np.ndarray)):
+            if len(value) != len(names):
+                msg = "{} values given for {} selected elements".format(len(value), len(names))
+                raise ValueError(msg)
+            values = value.tolist() if isinstance(value, _np.ndarray) else list(value)
+        else:
+            values = [value]*len(names)
+
+        changes = self.changes.setdefault(parameter, {})
+        elements = self.base.elements
+        report = {}
+        for name, value in zip(names, values):
+            if isinstance(value, _np.generic):
+                value = value.item()
+            old = changes[name] if name in changes else elements[name]._store.get(parameter)
+            changes[name] = value
+            report[name] = (old, value)
+        return report
+
+    def Reset(self, names=None):
+        """
+        Remove the changes to the elements with names (default all) so they are as
+        in the base machine.
+        """
+        if names is None:
+            self.changes.clear()
+        else:
+            for values in self.changes.values():
+                for name in names:
+                    values.pop(name, None)
+
+    def Write(self, filename, verbose=False, overwrite=True):
+        """
+        Write the variant to a series of gmad files.
+
+        kwargs:
+        overwrite : Do not append an integer to the basefilename if
+        already exists, instead overwrite existing files.
+
+        Unlike Machine.Write, the synchrotron radiation rescaling (Machine.sr) is
+        not applied, as it would change the base machine shared by all variants.
+        Write the base machine first (or call SynchrotronRadiationRescale) instead.
+        """
+        if self.base.sr:
+            print("Warning: the synchrotron radiation rescaling is not applied when writing a MachineVariant")
+        verboseresult = verbose or self.base.verbose
+        writer = _Writer.Writer()
+        writer.WriteMachine(self, filename, verbose=verboseresult, overwrite=overwrite)
+
 # General scripts below this point
 
 def PrepareApertureModel(rowDictionary, default='circular', warningName=""):
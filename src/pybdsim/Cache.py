@@ -0,0 +1,284 @@
+"""
+An on-disk cache of columns extracted from BDSIM output files.
+
+Extracting the same columns (e.g. sampler data) from the same ROOT files
+many times is slow. When enabled, the data loaders in pybdsim.Data and
+pybdsim.DataUproot store what they extract here and reuse it the next
+time the same columns are requested from an unchanged file.
+
+>>> pybdsim.Cache.Enable("~/.cache/pybdsim", maxSize=20e9)
+>>> d1 = pybdsim.Data.SamplerData(d, "d1")   # extracted from the file and stored
+>>> d1 = pybdsim.Data.SamplerData(d, "d1")   # read from the cache
+
+Each entry is a directory of numpy .npy files (one per column) that are
+memory-mapped copy-on-write when read, so only the pages used are read from
+disk and the arrays can be modified as usual without changing the cache.
+Nothing is ever unpickled from the cache, as it may be shared: object columns
+of strings are stored as string arrays and jagged columns (an array of 1D
+numeric arrays) as a flat array of values plus offsets. Columns with any other
+objects are not cached. Entries are keyed on the absolute path, modification
+time and size of the input file(s) and the columns requested, so a modified
+file is never served from the cache. The least recently used entries are
+removed when the total size exceeds maxSize (checked with a running total of
+the size, so the directory is only scanned when something must be removed).
+Entries are written to a temporary directory and renamed into place, so the
+cache may be shared by concurrent processes.
+
+Classes:
+ColumnCache - a cache in a given directory.
+
+"""
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import shutil as _shutil
+import uuid as _uuid
+
+import numpy as _np
+
+_defaultCache = None
+_formatVersion = 2 # part of every key so entries in an old format are never read
+
+def Enable(directory=None, maxSize=10e9):
+    """
+    Enable the column cache used by the data loaders.
+
+    :param directory: directory to store the cache in. Default is ~/.cache/pybdsim.
+    :type directory: str, None
+    :param maxSize: maximum total size of the cache in bytes.
+    :type maxSize: float
+    """
+    global _defaultCache
+    _defaultCache = ColumnCache(directory, maxSize)
+    return _defaultCache
+
+def Disable():
+    """
+    Disable the column cache. The contents on disk are kept.
+    """
+    global _defaultCache
+    _defaultCache = None
+
+def GetCache():
+    """
+    Return the enabled ColumnCache instance or None if caching is disabled.
+    """
+    return _defaultCache
+
+
+def _EncodeObjectColumn(a):
+    """
+    Return an object array of str as a str array, a 1D object array of 1D numeric
+    arrays as a tuple of (flat values, offsets) or None if it can't be stored
+    without pickling.
+    """
+    if all(isinstance(v, str) for v in a.flat):
+        return a.astype(str)
+    if a.ndim != 1:
+        return None
+    parts = []
+    for v in a:
+        v = _np.asarray(v)
+        if v.ndim != 1 or v.dtype.kind not in "biufc":
+            return None
+        parts.append(v)
+    counts  = _np.array([len(v) for v in parts], dtype=_np.int64)
+    offsets = _np.zeros(len(parts) + 1, dtype=_np.int64)
+    _np.cumsum(counts, out=offsets[1:])
+    values = _np.concatenate(parts) if parts else _np.zeros(0)
+    return values, offsets
+
+
+class ColumnCache:
+    """
+    A cache of named numpy arrays stored on disk.
+
+    :param directory: directory to store the cache in. Default is ~/.cache/pybdsim.
+    :type directory: str, None
+    :param maxSize: maximum total size of the cache in bytes.
+    :type maxSize: float
+
+    >>> c = ColumnCache("/tmp/mycache")
+    >>> key = c.Key(["output.root"], "d1", ["x", "y"])
+    >>> c.Put(key, {"x" : x, "y" : y})
+    >>> columns = c.Get(key) # None if not present
+    """
+    _metaFileName = "meta.json"
+
+    def __init__(self, directory=None, maxSize=10e9):
+        if directory is None:
+            directory = _os.path.join("~", ".cache", "pybdsim")
+        self.directory = _os.path.abspath(_os.path.expanduser(directory))
+        self.maxSize   = float(maxSize)
+        self._size     = None # running total size, found when first needed
+        _os.makedirs(self.directory, exist_ok=True)
+
+    def Key(self, filenames, *spec):
+        """
+        Return a key for the input file(s) and any further specification
+        (e.g. tree, branch and column names). The path, modification time and
+        size of each file are included so a changed file gives a new key.
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        parts = []
+        for fn in filenames:
+            fn = _os.path.abspath(fn)
+            st = _os.stat(fn)
+            parts.append([fn, st.st_mtime_ns, st.st_size])
+        parts.append([str(s) if not isinstance(s, (list, tuple)) else [str(v) for v in s] for s in spec])
+        parts.append(_formatVersion)
+        return _hashlib.sha1(_json.dumps(parts).encode()).hexdigest()
+
+    def _EntryPath(self, key):
+        return _os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return _os.path.isfile(_os.path.join(self._EntryPath(key), self._metaFileName))
+
+    def Get(self, key):
+        """
+        Return a dictionary of {name : numpy.array} for key or None if it isn't
+        in the cache. Numeric arrays are memory-mapped copy-on-write, so they can be
+        modified without changing the cache. Object columns are returned as object
+        arrays of str or of numpy arrays (views of one flat array) as they were stored.
+        """
+        path = self._EntryPath(key)
+        metaPath = _os.path.join(path, self._metaFileName)
+        try:
+            with open(metaPath) as f:
+                meta = _json.load(f)
+            result = {}
+            for i, (name, kind) in enumerate(zip(meta["columns"], meta["kinds"])):
+                fn = _os.path.join(path, str(i) + ".npy")
+                if kind == "array":
+                    result[name] = _np.load(fn, mmap_mode="c")
+                elif kind == "str":
+                    result[name] = _np.load(fn).astype(object)
+                elif kind == "jagged":
+                    values  = _np.load(fn, mmap_mode="c")
+                    offsets = _np.load(_os.path.join(path, str(i) + "_offsets.npy"))
+                    column  = _np.empty(len(offsets) - 1, dtype=object)
+                    for j in range(len(column)):
+                        column[j] = values[offsets[j]:offsets[j+1]]
+                    result[name] = column
+                else:
+                    return None
+        except (OSError, ValueError, KeyError):
+            # missing, or removed by another process while reading
+            return None
+        try:
+            _os.utime(metaPath) # mark as recently used
+        except OSError:
+            pass
+        return result
+
+    def Put(self, key, columns):
+        """
+        Store a dictionary of {name : numpy.array} under key. If another process
+        has already stored the same key, that entry is kept. Nothing is stored if
+        a column contains objects other than str or 1D numeric arrays.
+        """
+        path = self._EntryPath(key)
+        if key in self:
+            return
+        arrays = {}
+        for name, column in columns.items():
+            a = _np.asarray(column)
+            if a.dtype == object:
+                a = _EncodeObjectColumn(a)
+                if a is None:
+                    return
+            arrays[name] = a
+        tmpPath = _os.path.join(self.directory, ".tmp-" + _uuid.uuid4().hex)
+        _os.makedirs(tmpPath)
+        try:
+            names = list(arrays.keys())
+            kinds = []
+            for i, name in enumerate(names):
+                a = arrays[name]
+                fn = _os.path.join(tmpPath, str(i))
+                if isinstance(a, tuple):
+                    kinds.append("jagged")
+                    _np.save(fn + ".npy", a[0], allow_pickle=False)
+                    _np.save(fn + "_offsets.npy", a[1], allow_pickle=False)
+                else:
+                    kinds.append("str" if a.dtype.kind == "U" else "array")
+                    _np.save(fn + ".npy", a, allow_pickle=False)
+            with open(_os.path.join(tmpPath, self._metaFileName), "w") as f:
+                _json.dump({"columns" : names, "kinds" : kinds}, f)
+            size = sum(e.stat().st_size for e in _os.scandir(tmpPath))
+            try:
+                _os.rename(tmpPath, path)
+            except OSError:
+                # another process got there first
+                _shutil.rmtree(tmpPath, ignore_errors=True)
+                return
+        except:
+            _shutil.rmtree(tmpPath, ignore_errors=True)
+            raise
+        if self._size is None:
+            self._size = self.Size()
+        else:
+            self._size += size
+        if self._size > self.maxSize:
+            self.Evict()
+
+    def Entries(self):
+        """
+        Return a list of (lastUsedTime, sizeInBytes, key) for each entry.
+        """
+        result = []
+        for key in _os.listdir(self.directory):
+            if key.startswith("."):
+                continue
+            path = self._EntryPath(key)
+            try:
+                lastUsed = _os.path.getmtime(_os.path.join(path, self._metaFileName))
+                size = sum(e.stat().st_size for e in _os.scandir(path))
+            except OSError:
+                continue
+            result.append((lastUsed, size, key))
+        return result
+
+    def Size(self):
+        """
+        Total size in bytes of all entries.
+        """
+        return sum(e[1] for e in self.Entries())
+
+    def Remove(self, key):
+        """
+        Remove one entry. It's first renamed so other processes never see a
+        partial entry. Arrays already memory-mapped remain valid.
+        """
+        tmpPath = _os.path.join(self.directory, ".tmp-" + _uuid.uuid4().hex)
+        try:
+            _os.rename(self._EntryPath(key), tmpPath)
+        except OSError:
+            return
+        _shutil.rmtree(tmpPath, ignore_errors=True)
+        self._size = None # found again when next needed
+
+    def Evict(self, maxSize=None):
+        """
+        Remove the least recently used entries until the total size is below
+        maxSize (default self.maxSize). This scans the whole cache, so the running
+        total size is also updated with entries from other processes.
+        """
+        maxSize = self.maxSize if maxSize is None else maxSize
+        entries = sorted(self.Entries())
+        total = sum(e[1] for e in entries)
+        for lastUsed, size, key in entries:
+            if total <= maxSize:
+                break
+            self.Remove(key)
+            total -= size
+        self._size = total
+
+    def Clear(self):
+        """
+        Remove all entries.
+        """
+        for e in self.Entries():
+            self.Remove(e[2])
@@ -8,6 +8,7 @@ Data - read various output files
 
 """
 from . import _General
+from . import Cache as _Cache
 
 from collections import defaultdict as _defaultdict
 import copy as _copy
@@ -74,7 +75,7 @@ def LoadROOTLibraries():
     else:
         _libsLoaded = True
 
-def Load(filepath, messageio = True):
+def Load(filepath, messageio = True, lazy = False):
     """
     Load the data with the appropriate loader.
 
@@ -82,6 +83,9 @@ def Load(filepath, messageio = True):
     BDSIM file   - uses ROOT, returns BDSIM DataLoader instance.
     REBDSIM file - uses ROOT, returns RebdsimFile instance.
 
+    If lazy is True, histograms in a REBDSIM file are only loaded and
+    converted when first accessed. See RebdsimFile.
+
     """
     if "*" not in filepath:
         if not _os.path.exists(filepath):
@@ -95,7 +99,7 @@ def Load(filepath, messageio = True):
         return _LoadAscii(filepath)
     elif extension == 'root':
         try:
-            return _LoadRoot(filepath, messageio)
+            return _LoadRoot(filepath, messageio, lazy)
         except NameError:
             #raise error rather than return None, saves later scripting errors.
             raise IOError('Root loader not available.')
@@ -173,7 +177,7 @@ def _ROOTFileType(filepath):
     f.Close()
     return result
 
-def _LoadRoot(filepath, messageio):
+def _LoadRoot(filepath, messageio, lazy=False):
     """
     Inspect file and check it's a BDSIM file of some kind and load.
     """
@@ -206,10 +210,10 @@ def _LoadRoot(filepath, messageio):
         return d
     elif fileType == "REBDSIM":
         print('REBDSIM analysis file - using RebdsimFile')
-        return RebdsimFile(filepath)
+        return RebdsimFile(filepath, lazy=lazy)
     elif fileType == "REBDSIMCOMBINE":
         print('REBDSIMCOMBINE analysis file - using RebdsimFile')
-        return RebdsimFile(filepath)
+        return RebdsimFile(filepath, lazy=lazy)
     else:
         raise IOError("This file type "+fileType+" isn't supported")
 
@@ -500,6 +504,68 @@ def ParseSpectraName(hname):
 
     return name+"_"+nth,pdgid,flag
 
+class _LazyHistogramDict(dict):
+    """
+    A dictionary of histograms by path where each one is only loaded (or
+    converted) the first time it's accessed and then kept.
+
+    :param loadFunction: function(path) returning the histogram or raising KeyError.
+    :type loadFunction: function
+    :param keysFunction: function() returning a list of all the paths.
+    :type keysFunction: function
+    :param containsFunction: optional function(path) returning whether the path is valid without loading it.
+    :type containsFunction: function, None
+
+    Only item access loads a histogram. Listing the keys may require mapping
+    the whole file, and values() and items() load every histogram.
+    """
+    def __init__(self, loadFunction, keysFunction, containsFunction=None):
+        super().__init__()
+        self._loadFunction     = loadFunction
+        self._keysFunction     = keysFunction
+        self._containsFunction = containsFunction
+
+    def __missing__(self, key):
+        value = self._loadFunction(key)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        if self._containsFunction:
+            return self._containsFunction(key)
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._keysFunction())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __repr__(self):
+        return "<" + self.__class__.__name__ + " " + str(len(self)) + " histograms, " + str(dict.__len__(self)) + " loaded>"
+
+
 class RebdsimFile:
     """
     Class to represent data in rebdsim output file.
@@ -522,8 +588,20 @@ class RebdsimFile:
 
     If histogramsOnly is true, only the basic ROOT libraries are needed
     (i.e. import ROOT) and no Model data will be loaded - only ROOT histograms.
+
+    If lazy is true, the directories of the file are only mapped when the
+    list of histograms is needed and each histogram is only loaded and
+    converted the first time it's accessed, e.g. :code:`d.histogramspy[path]`.
+    The spectra are also only prepared when first accessed. This is much
+    faster for files with many histograms when only a few are used. The
+    convert argument has no effect in this case.
+
+    >>> d = pybdsim.Data.Load("rebdsim_output.root", lazy=True)
+    >>> eloss = d.histogramspy['Event/MergedHistograms/ElossHisto']
     """
-    def __init__(self, filename, convert=True, histogramsOnly=False):
+    _histogramTypes = {1 : "TH1D", 2 : "TH2D", 3 : "TH3D", 4 : "BDSBH4D"}
+
+    def __init__(self, filename, convert=True, histogramsOnly=False, lazy=False):
         if not histogramsOnly:
             LoadROOTLibraries()
         self.filename = filename
@@ -532,23 +610,25 @@ class RebdsimFile:
             self.header = Header(TFile=self._f)
         else:
             self.header = Header()
-        self.histograms = {}
-        self.histograms1d = {}
-        self.histograms2d = {}
-        self.histograms3d = {}
-        self.histograms4d = {}
-        self.histogramspy = {}
-        self.histograms1dpy = {}
-        self.histograms2dpy = {}
-        self.histograms3dpy = {}
-        self.histograms4dpy = {}
-        self.spectra = _defaultdict(Spectra)
-        self._Map("", self._f)
-        if convert:
-            self.ConvertToPybdsimHistograms()
-
-        # even if the header isn't loaded, the default will be -1
-        if self.header.dataVersion > 7:
+        self.lazy = lazy
+        self._paths = None
+        self._spectra = None
+        if lazy:
+            self._PrepareLazyHistograms()
+        else:
+            self.histograms = {}
+            self.histograms1d = {}
+            self.histograms2d = {}
+            self.histograms3d = {}
+            self.histograms4d = {}
+            self.histogramspy = {}
+            self.histograms1dpy = {}
+            self.histograms2dpy = {}
+            self.histograms3dpy = {}
+            self.histograms4dpy = {}
+            self._Map("", self._f)
+            if convert:
+                self.ConvertToPybdsimHistograms()
             self._PopulateSpectraDictionaries()
 
         def _prepare_data(branches, treedata):
@@ -573,6 +653,73 @@ class RebdsimFile:
             if 'Model' in trees or 'ModelTree' in trees:
                 self.model = GetModelForPlotting(self._f)
 
+    @property
+    def spectra(self):
+        if self._spectra is None:
+            self._PopulateSpectraDictionaries()
+        return self._spectra
+
+    @spectra.setter
+    def spectra(self, value):
+        self._spectra = value
+
+    def _PrepareLazyHistograms(self):
+        self.histograms   = _LazyHistogramDict(self._GetHistogram, lambda: list(self._HistogramPaths()))
+        self.histogramspy = _LazyHistogramDict(lambda path: self._ConvertHistogram(path, self.histograms[path]),
+                                               self.histograms.keys, self.histograms.__contains__)
+        for n, typeName in self._histogramTypes.items():
+            rootDict = _LazyHistogramDict(lambda path, t=typeName: self._GetHistogram(path, t),
+                                          lambda t=typeName: [p for p, c in self._HistogramPaths().items() if t in c])
+            pyDict   = _LazyHistogramDict(lambda path, r=rootDict: self.histogramspy[path] if path in r else r[path],
+                                          rootDict.keys, rootDict.__contains__)
+            setattr(self, "histograms" + str(n) + "d", rootDict)
+            setattr(self, "histograms" + str(n) + "dpy", pyDict)
+
+    def _GetHistogram(self, path, typeName=None):
+        """
+        Get one histogram from the file by its full path without mapping the
+        file. Raises a KeyError if there's no histogram (of typeName) there.
+        """
+        hob = self._f.Get(path) if path else None
+        if not hob:
+            raise KeyError(path)
+        className = str(hob.ClassName())
+        typeNames = [typeName] if typeName else self._histogramTypes.values()
+        if not any(t in className for t in typeNames):
+            raise KeyError(path)
+        return hob
+
+    def _ConvertHistogram(self, path, hist):
+        className = str(hist.ClassName())
+        for typeName, pyType in [("TH1D", TH1), ("TH2D", TH2), ("TH3D", TH3), ("BDSBH4D", BDSBH4D)]:
+            if typeName in className:
+                return pyType(hist)
+        raise KeyError(path)
+
+    def _HistogramPaths(self):
+        """
+        Return a dictionary of {path : className} for every histogram in the
+        file. The file is only mapped once.
+        """
+        if self._paths is None:
+            self._paths = {}
+            self._MapPaths("", self._f, self._paths)
+        return self._paths
+
+    def _MapPaths(self, currentDirName, currentDir, result):
+        keys = currentDir.GetListOfKeys()
+        keyClasses = [(str(keys.At(i).GetName()), str(keys.At(i).GetClassName())) for i in range(keys.GetEntries())]
+        for typeName in self._histogramTypes.values():
+            for h, className in keyClasses:
+                if typeName in className:
+                    name = currentDirName + '/' + h
+                    result[name.strip('/')] = className # protect against starting /
+        for d, className in keyClasses:
+            if "Directory" in className:
+                dName = currentDirName + '/' + d
+                dName = dName.strip('/') # protect against starting /
+                self._MapPaths(dName, currentDir.Get(d), result)
+
     def _Map(self, currentDirName, currentDir):
         h1d = self._ListType(currentDir, "TH1D")
         h2d = self._ListType(currentDir, "TH2D")
@@ -667,18 +814,20 @@ class RebdsimFile:
             self.histogramspy[path] = hpy
 
     def _PopulateSpectraDictionaries(self):
-        for path,hist in self.histograms1d.items():
-            hname = str(hist.GetName())
-            if 'Spectra' in hname:
-                try:
-                    sname,pdgid,flag = ParseSpectraName(hname)
-                    # self.spectra is a defaultdict(Spectra) which is our own class that has an append method
-                    self.spectra[sname].append(pdgid, hist, path, sname, flag)
-                except ValueError as e:
-                    print(e)
-                    continue # could be old data with the word "Spectra" in the name
-        newspectra = {k:v for k,v in self.spectra.items()}
-        self.spectra = newspectra # turn back into a regular dictionary to highlight bad key access to users
+        spectra = _defaultdict(Spectra)
+        # even if the header isn't loaded, the default will be -1
+        if self.header.dataVersion > 7:
+            for path in self.histograms1d.keys():
+                hname = path.split('/')[-1] # the name of the histogram without loading it
+                if 'Spectra' in hname:
+                    try:
+                        sname,pdgid,flag = ParseSpectraName(hname)
+                        # spectra is a defaultdict(Spectra) which is our own class that has an append method
+                        spectra[sname].append(pdgid, self.histograms1d[path], path, sname, flag)
+                    except ValueError as e:
+                        print(e)
+                        continue # could be old data with the word "Spectra" in the name
+        self._spectra = dict(spectra) # turn back into a regular dictionary to highlight bad key access to users
 
 def CreateEmptyRebdsimFile(outputFileName, nOriginalEvents=1):
     """
@@ -1084,6 +1233,60 @@ def ReplaceZeroWithMinimum(hist, value=1e-20):
     r.contents[hist.contents==0] = value
     return r
 
+def _ROOTBufferToNumpy(buffer, size, dtype=_np.float64):
+    """
+    View a C array from ROOT (e.g. TArrayD::GetArray()) of a known size as a
+    numpy array without copying.
+    """
+    try:
+        buffer.reshape((size,))
+    except AttributeError:
+        pass
+    return _np.frombuffer(buffer, dtype=dtype, count=size)
+
+def _AxisEdges(axis):
+    """
+    Return all the bin edges of a ROOT TAxis as a numpy array. For variable
+    binning the edges are copied in bulk from the axis, otherwise they are
+    calculated from the range and number of bins.
+    """
+    n = axis.GetNbins()
+    xbins = axis.GetXbins()
+    if xbins.GetSize() == n + 1:
+        return _ROOTBufferToNumpy(xbins.GetArray(), n + 1).copy()
+    return _np.linspace(axis.GetXmin(), axis.GetXmax(), n + 1)
+
+def _HistogramContentsAndErrors(hist, nDimensions):
+    """
+    Return the contents and errors of a ROOT TH1, TH2 or TH3 including the
+    under and overflow bins as numpy arrays indexed [x,y,z]. These are copied
+    in bulk from the internal arrays of the histogram rather than bin by bin.
+
+    Returns None, None if this isn't possible (e.g. an unusual histogram type
+    or error option) and the caller should loop over the bins instead.
+    """
+    dtype = None
+    for arrayType, arrayDType in [("TArrayD", _np.float64), ("TArrayF", _np.float32),
+                                  ("TArrayI", _np.int32), ("TArrayS", _np.int16)]:
+        if isinstance(hist, getattr(_ROOT, arrayType)):
+            dtype = arrayDType
+            break
+    if dtype is None or hist.GetBinErrorOption() != _ROOT.TH1.kNormal:
+        return None, None
+
+    nBins = [hist.GetNbinsX(), hist.GetNbinsY(), hist.GetNbinsZ()][:nDimensions]
+    shape = [n + 2 for n in nBins][::-1] # ROOT global bin numbering has x fastest
+    nCells = int(hist.GetNcells())
+    contents = _ROOTBufferToNumpy(hist.GetArray(), nCells, dtype).astype(_np.float64)
+    contents = _np.ascontiguousarray(contents.reshape(shape).T)
+    if hist.GetSumw2N() == nCells:
+        sumw2 = _ROOTBufferToNumpy(hist.GetSumw2().GetArray(), nCells)
+        errors = _np.ascontiguousarray(_np.sqrt(sumw2.reshape(shape).T))
+    else:
+        errors = _np.sqrt(_np.abs(contents))
+    return contents, errors
+
+
 class ROOTHist:
     """
     Base class for histogram wrappers.
@@ -1155,14 +1358,12 @@ class TH1(ROOTHist):
         self.xunderflow = hist.GetBinContent(0)
         self.xoverflow  = hist.GetBinContent(self.nbinsx+1)
 
-        for i in range(self.nbinsx):
-            xaxis = hist.GetXaxis()
-            self.xwidths[i]   = xaxis.GetBinWidth(i)
-            self.xlowedge[i]  = xaxis.GetBinLowEdge(i+1)
-            self.xhighedge[i] = self.xlowedge[i] + self.xwidths[i]
-            self.xcentres[i]  = xaxis.GetBinCenter(i+1)
+        self.xedges     = _AxisEdges(hist.GetXaxis())
+        self.xlowedge   = self.xedges[:-1].copy()
+        self.xhighedge  = self.xedges[1:].copy()
+        self.xwidths    = self.xhighedge - self.xlowedge
+        self.xcentres   = 0.5*(self.xlowedge + self.xhighedge)
         self.xrange = (self.xlowedge[0], self.xhighedge[-1])
-        self.xedges = _np.append(self.xlowedge, self.xhighedge[-1])
 
         if extractData:
             self._GetContents()
@@ -1208,6 +1409,11 @@ class TH1(ROOTHist):
         return integral, error.value
 
     def _GetContents(self):
+        contents, errors = _HistogramContentsAndErrors(self.hist, 1)
+        if contents is not None:
+            self.contents = contents[1:-1]
+            self.errors   = errors[1:-1]
+            return
         for i in range(self.nbinsx):
             self.contents[i] = self.hist.GetBinContent(i+1)
             self.errors[i]   = self.hist.GetBinError(i+1)
@@ -1247,14 +1453,12 @@ class TH2(TH1):
         self.yunderflow = "not implemented"
         self.yoverflow  = "not implemented"
 
-        for i in range(self.nbinsy):
-            yaxis = hist.GetYaxis()
-            self.ywidths[i]   = yaxis.GetBinWidth(i+1)
-            self.ylowedge[i]  = yaxis.GetBinLowEdge(i+1)
-            self.yhighedge[i] = self.ylowedge[i] + self.ywidths[i]
-            self.ycentres[i]  = yaxis.GetBinCenter(i+1)
+        self.yedges    = _AxisEdges(hist.GetYaxis())
+        self.ylowedge  = self.yedges[:-1].copy()
+        self.yhighedge = self.yedges[1:].copy()
+        self.ywidths   = self.yhighedge - self.ylowedge
+        self.ycentres  = 0.5*(self.ylowedge + self.yhighedge)
         self.yrange = (self.ylowedge[0], self.yhighedge[-1])
-        self.yedges = _np.append(self.ylowedge, self.yhighedge[-1])
 
         if extractData:
             self._GetContents()
@@ -1293,6 +1497,11 @@ class TH2(TH1):
         return r
 
     def _GetContents(self):
+        contents, errors = _HistogramContentsAndErrors(self.hist, 2)
+        if contents is not None:
+            self.contents = contents[1:-1, 1:-1]
+            self.errors   = errors[1:-1, 1:-1]
+            return
         for i in range(self.nbinsx) :
             for j in range(self.nbinsy) :
                 self.contents[i,j] = self.hist.GetBinContent(i+1,j+1)
@@ -1362,14 +1571,12 @@ class TH3(TH2):
         self.contents = _np.zeros((self.nbinsx, self.nbinsy, self.nbinsz))
         self.errors   = _np.zeros((self.nbinsx, self.nbinsy, self.nbinsz))
 
-        for i in range(self.nbinsz):
-            zaxis = hist.GetZaxis()
-            self.zwidths[i]   = zaxis.GetBinWidth(i+1)
-            self.zlowedge[i]  = zaxis.GetBinLowEdge(i+1)
-            self.zhighedge[i] = self.zlowedge[i] + self.zwidths[i]
-            self.zcentres[i]  = zaxis.GetBinCenter(i+1)
+        self.zedges    = _AxisEdges(hist.GetZaxis())
+        self.zlowedge  = self.zedges[:-1].copy()
+        self.zhighedge = self.zedges[1:].copy()
+        self.zwidths   = self.zhighedge - self.zlowedge
+        self.zcentres  = 0.5*(self.zlowedge + self.zhighedge)
         self.zrange = (self.zlowedge[0], self.zhighedge[-1])
-        self.zedges = _np.append(self.zlowedge, self.zhighedge[-1])
 
         if extractData:
             self._GetContents()
@@ -1382,6 +1589,11 @@ class TH3(TH2):
         return self.zrange[1] - self.zrange[0]
 
     def _GetContents(self):
+        contents, errors = _HistogramContentsAndErrors(self.hist, 3)
+        if contents is not None:
+            self.contents = contents[1:-1, 1:-1, 1:-1]
+            self.errors   = errors[1:-1, 1:-1, 1:-1]
+            return
         for i in range(self.nbinsx):
             for j in range(self.nbinsy):
                 for k in range(self.nbinsz):
@@ -1660,6 +1872,54 @@ class TH3(TH2):
         return integral, error.value
 
     
+_bh4dHelpersDeclared = False
+
+def _DeclareBH4DHelpers():
+    """
+    Declare (once) a small C++ function to ROOT's interpreter that copies
+    the storage of a BDSBH4D boost histogram into a numpy buffer in one call.
+    """
+    global _bh4dHelpersDeclared
+    if _bh4dHelpersDeclared:
+        return
+    _ROOT.gInterpreter.Declare("""
+namespace pybdsim
+{
+  template <typename H>
+  void BH4DToArray(const H& h, int nx, int ny, int nz, int ne, double* out)
+  {
+    long long i = 0;
+    for (int x = 0; x < nx; ++x)
+      for (int y = 0; y < ny; ++y)
+        for (int z = 0; z < nz; ++z)
+          for (int e = 0; e < ne; ++e)
+            {out[i++] = static_cast<double>(h.at(x, y, z, e));}
+  }
+}
+""")
+    _bh4dHelpersDeclared = True
+
+def _BDSBH4DToNumpy(hist, hist_type="h"):
+    """
+    Return the contents of a BDSBH4D histogram (hist_type 'h') or its errors
+    ('h_err') as a numpy array of shape (nx,ny,nz,ne) without under or overflow.
+    The bins are copied in C++ in one call if possible, otherwise bin by bin.
+    """
+    shape = (int(hist.h_nxbins), int(hist.h_nybins), int(hist.h_nzbins), int(hist.h_nebins))
+    histo4d = _np.zeros(shape)
+    ho = getattr(hist, hist_type)
+    if _useRoot:
+        try:
+            _DeclareBH4DHelpers()
+            _ROOT.pybdsim.BH4DToArray(ho, *shape, histo4d)
+            return histo4d
+        except (AttributeError, TypeError):
+            pass # e.g. the template can't be instantiated for this histogram - use the loop
+    for x, y, z, e in _itertools.product(*[range(n) for n in shape]):
+        histo4d[x, y, z, e] = ho.at(x, y, z, e)
+    return histo4d
+
+
 class BDSBH4D():
     """
     Wrapper for a BDSBH instance. Converts to numpy data.
@@ -1741,70 +2001,27 @@ class BDSBH4D():
             self.errorsAreErrorOnMean = True
 
     def _GetBinsInfo(self, hist):
-        x_step = (hist.h_xmax - hist.h_xmin)/hist.h_nxbins
-        for i in range(hist.h_nxbins):
-            self.xwidths[i]   = x_step
-            self.xlowedge[i]  = hist.h_xmin + i*x_step
-            self.xhighedge[i] = self.xlowedge[i] + self.xwidths[i]
-            self.xcentres[i]  = self.xlowedge[i] + self.xwidths[i]/2
-        self.xrange = (self.xlowedge[0],self.xhighedge[-1])
-        self.xedges = _np.append(self.xlowedge, self.xhighedge[-1])
-
-        y_step = (hist.h_ymax - hist.h_ymin) / hist.h_nybins
-        for i in range(hist.h_nybins):
-            self.ywidths[i]   = y_step
-            self.ylowedge[i]  = hist.h_ymin + i*y_step
-            self.yhighedge[i] = self.ylowedge[i] + self.ywidths[i]
-            self.ycentres[i]  = self.ylowedge[i] + self.ywidths[i] / 2
-        self.yrange = (self.ylowedge[0],self.yhighedge[-1])
-        self.yedges = _np.append(self.ylowedge, self.yhighedge[-1])
-            
-        z_step = (hist.h_zmax - hist.h_zmin) / hist.h_nzbins
-        for i in range(hist.h_nzbins):
-            self.zwidths[i]   = z_step
-            self.zlowedge[i]  = hist.h_zmin + i*z_step
-            self.zhighedge[i] = self.zlowedge[i] + self.zwidths[i]
-            self.zcentres[i]  = self.zlowedge[i] + self.zwidths[i] / 2
-        self.zrange = (self.zlowedge[0],self.zhighedge[-1])
-        self.zedges = _np.append(self.zlowedge, self.zhighedge[-1])
+        self.xedges = _np.linspace(hist.h_xmin, hist.h_xmax, hist.h_nxbins + 1)
+        self.yedges = _np.linspace(hist.h_ymin, hist.h_ymax, hist.h_nybins + 1)
+        self.zedges = _np.linspace(hist.h_zmin, hist.h_zmax, hist.h_nzbins + 1)
 
         if hist.h_escale == 'log':
-            e_step = (_math.log10(hist.h_emax) - _math.log10(hist.h_emin)) / hist.h_nebins
-            for i in range(hist.h_nebins):
-                self.elowedge[i]  = hist.h_emin * 10 ** (i * e_step)
-                self.ehighedge[i] = hist.h_emin * 10 ** ((i+1) * e_step)
-                self.ewidths[i]   = self.ehighedge[i] - self.elowedge[i]
-                self.ecentres[i]  = self.elowedge[i] + self.ewidths[i] / 2
-
-        if hist.h_escale == 'linear':
-            e_step = (hist.h_emax - hist.h_emin) / hist.h_nebins
-            for i in range(hist.h_nebins):
-                self.ewidths[i]  = e_step
-                self.elowedge[i]  = hist.h_emin + i * e_step
-                self.ehighedge[i] = self.elowedge[i] + self.ewidths[i]
-                self.ecentres[i]  = self.elowedge[i] + self.ewidths[i] / 2
-
-        if hist.h_escale == 'user':
-            for i in range(hist.h_nebins):
-                self.elowedge[i]  = hist.h_ebinsedges.at(i)
-                self.ehighedge[i] = hist.h_ebinsedges.at(i+1)
-                self.ewidths[i]   = hist.h_ebinsedges.at(i+1)-hist.h_ebinsedges.at(i)
-                self.ecentres[i]  = self.elowedge[i] + 0.5*self.ewidths[i]
-
-        self.erange = (self.elowedge[0],self.ehighedge[-1])
-        self.eedges = _np.append(self.elowedge, self.ehighedge[-1])
-
+            self.eedges = _np.logspace(_math.log10(hist.h_emin), _math.log10(hist.h_emax), hist.h_nebins + 1)
+        elif hist.h_escale == 'linear':
+            self.eedges = _np.linspace(hist.h_emin, hist.h_emax, hist.h_nebins + 1)
+        elif hist.h_escale == 'user':
+            self.eedges = _np.array(list(hist.h_ebinsedges)[:hist.h_nebins + 1], dtype=float)
+
+        for ax in ['x', 'y', 'z', 'e']:
+            edges = getattr(self, ax + 'edges')
+            setattr(self, ax + 'lowedge',  edges[:-1].copy())
+            setattr(self, ax + 'highedge', edges[1:].copy())
+            setattr(self, ax + 'widths',   edges[1:] - edges[:-1])
+            setattr(self, ax + 'centres',  0.5*(edges[:-1] + edges[1:]))
+            setattr(self, ax + 'range',    (edges[0], edges[-1]))
 
     def _ToNumpy(self, hist, hist_type="h"):
-        histo4d = _np.zeros((hist.h_nxbins, hist.h_nybins, hist.h_nzbins, hist.h_nebins))
-        ho = getattr(hist, hist_type)
-        for x, y, z, e in _itertools.product(range(hist.h_nxbins),
-                                             range(hist.h_nybins),
-                                             range(hist.h_nzbins),
-                                             range(hist.h_nebins)):
-            histo4d[x, y, z, e] = ho.at(x, y, z, e)
-
-        return histo4d
+        return _BDSBH4DToNumpy(hist, hist_type)
 
     def _GetContents(self,hist):
         self.contents = self._ToNumpy(hist)
@@ -1952,6 +2169,66 @@ def CombinePickledHistogram1DSets(globPattern="*.dat", nCPUs=1):
         return _MergePickledHistogram1DSets(*files)
 
 
+class _EventChunk(dict):
+    """
+    A dictionary of {column : numpy.array} for a chunk of events as yielded by
+    IterateEvents. Values of vector columns for all events in the chunk are
+    concatenated and the event structure is kept in self.eventOffsets[column].
+    """
+    def __init__(self, eventNumbers):
+        super(_EventChunk, self).__init__()
+        self.eventNumbers = eventNumbers
+        self.eventOffsets = {}
+
+    def EventNumbers(self, column):
+        """
+        Return the global event number of each value in a column.
+        """
+        return _np.repeat(self.eventNumbers, _np.diff(self.eventOffsets[column]))
+
+
+def IterateEvents(data, columns, chunkSize=10000):
+    """
+    Iterate over the events of a loaded DataLoader instance of raw data in
+    chunks of chunkSize events so that memory is bounded regardless of the
+    size of the file.
+
+    :param data: DataLoader instance from pybdsim.Data.Load.
+    :type data: ROOT.DataLoader
+    :param columns: full names of the leaves in the Event tree to read, e.g. ['Eloss.S', 'd1.x'].
+    :type columns: list(str)
+    :param chunkSize: maximum number of events in each chunk.
+    :type chunkSize: int
+
+    Yields a tuple of (eventNumbers, chunk) where eventNumbers are the global event
+    indices of the events in the chunk and chunk is a dictionary of {column : numpy.array}.
+    Each chunk is read in bulk with RDataFrame and only the requested leaves are read. ::
+
+    >>> d = pybdsim.Data.Load("output.root")
+    >>> for eventNumbers, chunk in pybdsim.Data.IterateEvents(d, ['Eloss.S', 'Eloss.energy']):
+    ...     h += numpy.histogram(chunk['Eloss.S'], bins, weights=chunk['Eloss.energy'])[0]
+    """
+    if not isinstance(data,_ROOT.DataLoader):
+        raise IOError("Data is not a ROOT.DataLoader object. Supply data "
+                      "loaded with pybdsim.Data.Load")
+    chunkSize = int(chunkSize)
+    if chunkSize < 1:
+        raise ValueError("chunkSize must be at least 1")
+    et = data.GetEventTree()
+    nEvents = int(et.GetEntries())
+    rdf = _ROOT.RDataFrame(et)
+    for start in range(0, nEvents, chunkSize):
+        stop = min(start + chunkSize, nEvents)
+        values = _ReadColumnsBulk(rdf.Range(start, stop), list(columns))
+        chunk = _EventChunk(_np.arange(start, stop))
+        for c in columns:
+            chunk[c], counts = values[c]
+            if counts is None:
+                counts = _np.ones(stop - start, dtype=_np.int64)
+            chunk.eventOffsets[c] = _CountsToOffsets(counts)
+        yield chunk.eventNumbers, chunk
+
+
 def GetHistoryPDGTuple(trajectories, startingTrajectoryStorageIndex, reduceDuplicates=False):
     """
     Return a tuple of PDG IDs for the history of a particle given by trajectories in an event.
@@ -1992,39 +2269,313 @@ def GetHistoryPDGTuple(trajectories, startingTrajectoryStorageIndex, reduceDupli
         history = tuple(x for x, y in _itertools.groupby(history))
     return history
 
+def _FlattenColumn(column):
+    """
+    Flatten one column as returned by RDataFrame.AsNumpy into a single
+    contiguous numpy array. Vector branches come back as an object array
+    with one RVec per event, scalar branches as a plain numpy array with
+    one value per event. Returns the flat array and the number of values
+    in each event. This loops over the events in Python, so it's only used
+    for vector columns of a type not in _rvecElementTypes (see _ReadColumnsBulk).
+    """
+    if column.dtype != object:
+        return _np.asarray(column), _np.ones(len(column), dtype=_np.int64)
+
+    counts = _np.fromiter((len(v) for v in column), dtype=_np.int64, count=len(column))
+    if len(column) == 0:
+        return _np.array([]), counts
+    try:
+        parts = [_np.asarray(v) for v in column]
+    except (TypeError, ValueError):
+        # e.g. RVec<bool> doesn't expose a buffer
+        parts = [_np.array(list(v)) for v in column]
+    return _np.concatenate(parts), counts
+
+
+# C++ element type of a vector column : numpy type of the flat array
+_rvecElementTypes = {
+    "double"             : _np.float64,
+    "Double_t"           : _np.float64,
+    "float"              : _np.float32,
+    "Float_t"            : _np.float32,
+    "int"                : _np.int32,
+    "Int_t"              : _np.int32,
+    "unsigned int"       : _np.uint32,
+    "UInt_t"             : _np.uint32,
+    "short"              : _np.int16,
+    "Short_t"            : _np.int16,
+    "unsigned short"     : _np.uint16,
+    "UShort_t"           : _np.uint16,
+    "long long"          : _np.int64,
+    "Long64_t"           : _np.int64,
+    "unsigned long long" : _np.uint64,
+    "ULong64_t"          : _np.uint64,
+    "bool"               : _np.bool_,
+    "Bool_t"             : _np.bool_,
+}
+
+_columnHelpersDeclared = False
+
+def _DeclareColumnHelpers():
+    """
+    Declare (once) a small C++ function to ROOT's interpreter that concatenates
+    the RVec of every event of a column (as from RDataFrame.Take) into one numpy
+    buffer. This moves the loop over events out of Python.
+    """
+    global _columnHelpersDeclared
+    if _columnHelpersDeclared:
+        return
+    _ROOT.gInterpreter.Declare("""
+#include <algorithm>
+#include <vector>
+#include <iterator>
+#include "ROOT/RVec.hxx"
+namespace pybdsim
+{
+  template <typename T>
+  void ConcatenateRVecs(const std::vector<ROOT::VecOps::RVec<T> >& v, T* out)
+  {
+    for (const auto& event : v)
+      {out = std::copy(event.begin(), event.end(), out);}
+  }
+}
+""")
+    _columnHelpersDeclared = True
+
+
+def _RVecElementType(columnType):
+    """
+    Return the element type of a vector column type as given by
+    RDataFrame.GetColumnType (e.g. 'ROOT::VecOps::RVec<float>' or
+    'vector<float>') or None if it is not a vector.
+    """
+    columnType = str(columnType).strip()
+    start = columnType.find("<")
+    if start < 0 or not columnType.endswith(">"):
+        return None
+    if columnType[:start].split("::")[-1] not in ("RVec", "vector"):
+        return None
+    return columnType[start + 1:-1].strip()
+
+
+def _ReadColumnsBulk(rdf, columns):
+    """
+    Read columns of an RDataFrame into flat numpy arrays in one pass over the events.
+
+    Scalar columns are read with AsNumpy. For vector columns, the number of values
+    in each event is a Defined column read with AsNumpy and the RVecs of all events
+    are collected with Take and concatenated in C++ (see _DeclareColumnHelpers),
+    so there is no loop over the events in Python. All of these are booked before
+    the event loop is run, so it is run once.
+
+    Returns a dictionary of {column : (flat array, counts)} where counts is the
+    number of values in each event for a vector column or None for a scalar column.
+    """
+    _DeclareColumnHelpers()
+    asNumpy = []
+    countColumns = {}
+    taken = {}
+    for i, c in enumerate(columns):
+        elementType = _RVecElementType(rdf.GetColumnType(c))
+        if elementType is None or elementType not in _rvecElementTypes:
+            asNumpy.append(c) # scalar, or an unusual type flattened with _FlattenColumn
+            continue
+        countColumns[c] = "pybdsim_n" + str(i)
+        rdf = rdf.Define(countColumns[c], "std::size(" + c + ")")
+        taken[c] = (elementType, rdf.Take["ROOT::VecOps::RVec<" + elementType + ">"](c))
+    values = rdf.AsNumpy(asNumpy + list(countColumns.values())) # runs the event loop
+
+    result = {}
+    for c in columns:
+        if c in taken:
+            elementType, rvecs = taken[c]
+            counts = _np.asarray(values[countColumns[c]], dtype=_np.int64)
+            flat = _np.empty(int(counts.sum()), dtype=_rvecElementTypes[elementType])
+            if len(flat) > 0:
+                _ROOT.pybdsim.ConcatenateRVecs[elementType](rvecs.GetValue(), flat)
+            result[c] = (flat, counts)
+        elif values[c].dtype == object:
+            result[c] = _FlattenColumn(values[c])
+        else:
+            result[c] = (_np.asarray(values[c]), None)
+    return result
+
+
+def _CountsToOffsets(counts):
+    """
+    Convert a number of entries per event into an array of offsets of length
+    nEvents + 1 so that event i is [offsets[i]:offsets[i+1]] of a flat array.
+    """
+    offsets = _np.zeros(len(counts) + 1, dtype=_np.int64)
+    _np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _EventTreeFileNames(eventTree):
+    """
+    List of the file names of an event tree (TChain) from a DataLoader instance.
+    """
+    try:
+        return [str(f.GetTitle()) for f in eventTree.GetListOfFiles()]
+    except (AttributeError, TypeError):
+        return [str(eventTree.GetCurrentFile().GetName())]
+
+
+def _BranchStatuses(tree):
+    """
+    Return a dictionary of {branchName : active} for every branch and sub-branch
+    of a tree (parents before their sub-branches), so the status can be put back
+    with _RestoreBranchStatuses after activating only some branches.
+    """
+    statuses = {}
+    def add(branches):
+        for b in branches:
+            name = str(b.GetName())
+            statuses[name] = bool(tree.GetBranchStatus(name))
+            add(b.GetListOfBranches())
+    add(tree.GetListOfBranches())
+    return statuses
+
+
+def _RestoreBranchStatuses(tree, statuses):
+    """
+    Re-enable only the branches that were active in statuses (from _BranchStatuses)
+    and have been disabled since, and disable again those that have been enabled.
+    """
+    for name, active in statuses.items():
+        if bool(tree.GetBranchStatus(name)) != active:
+            tree.SetBranchStatus(name, int(active))
+
+def _SamplerNames(data):
+    """
+    List of sampler names in a DataLoader instance including 'Primary' at index 0.
+    """
+    # this two step assignment is stupid but to counter bad behaviour with
+    # root, python and our classes... this works, direct assignemnt doens't
+    sn = data.GetSamplerNames()
+    samplerNames = list(sn)
+    samplerNames.insert(0,'Primary')
+    return samplerNames
+
+
+def _SamplerIndexFromIndexOrName(samplerNames, samplerIndexOrName):
+    if type(samplerIndexOrName) == str:
+        try:
+            return samplerNames.index(samplerIndexOrName)
+        except ValueError:
+            return samplerNames.index(samplerIndexOrName+".")
+    else:
+        return samplerIndexOrName
+
+
+def _SamplerBranchName(samplerName):
+    return samplerName if samplerName.endswith(".") else samplerName + "."
+
+
+def _ReadSamplerVariablesBulk(eventTree, branchNames, vs):
+    """
+    Read only the requested leaves of one or more sampler branches for all events
+    with ROOT's RDataFrame. All columns are read together in one pass over the tree
+    in compiled code so there is no loading of each event or conversion to Python
+    objects. Returns a dictionary of {branchName : (dict of arrays, eventOffsets)}.
+    """
+    rdf = _ROOT.RDataFrame(eventTree)
+    columns = _ReadColumnsBulk(rdf, [bn + v for bn in branchNames for v in vs])
+    result = {}
+    for bn in branchNames:
+        values = {}
+        counts = None
+        for v in vs:
+            values[v], n = columns[bn + v]
+            if counts is None:
+                counts = n
+        if counts is None:
+            counts = _np.ones(int(eventTree.GetEntries()), dtype=_np.int64)
+        result[bn] = (values, _CountsToOffsets(counts))
+    return result
+
+
+def _ReadSamplerVariablesLoop(eventTree, samplers, vs):
+    """
+    Read the requested variables of one or more sampler objects (that are attached to
+    eventTree) by loading each event in turn. Returns a list of (dict of arrays,
+    eventOffsets) in the order of samplers.
+    """
+    results = [{v:[] for v in vs} for _ in samplers]
+    counts  = [[] for _ in samplers]
+    for i in range(int(eventTree.GetEntries())):
+        eventTree.GetEntry(i) # loading is the heavy bit
+        for s, result, cs in zip(samplers, results, counts):
+            count = None
+            for v in vs:
+                r = getattr(s, v)
+                try:
+                    res = list(r)
+                    count = len(res) if count is None else count
+                except TypeError:
+                    res = list([r])
+                except AttributeError:
+                    if isinstance(r, _ROOT.vector(bool)):
+                        res = [bool(r[j]) for j in range(r.size())]
+                        count = len(res) if count is None else count
+                    else:
+                        raise
+                result[v].extend(res)
+            cs.append(1 if count is None else count)
+
+    output = []
+    for result, cs in zip(results, counts):
+        for v in vs:
+            result[v] = _np.array(result[v])
+        output.append((result, _CountsToOffsets(_np.array(cs, dtype=_np.int64))))
+    return output
+
+
 class _SamplerData:
     """
     Base class for loading a chosen set of sampler data from a file.
     data - is the DataLoader instance.
     params - is a list of parameter names as strings.
     samplerIndexOrName - is the index of the sampler (0=primaries) or name.
+    bulk - read the leaves for all events in one go (columnar) rather than
+           loading each event in turn.
 
+    The result is in self.data - a dictionary of numpy arrays with the values
+    of all events concatenated. The event structure is kept in self.eventOffsets
+    such that event i is self.data[param][eventOffsets[i]:eventOffsets[i+1]] for
+    any vector parameter (scalar ones such as 'n', 'z' or 'S' have one entry per event).
     """
-    def __init__(self, data, params, samplerIndexOrName=0):
+    def __init__(self, data, params, samplerIndexOrName=0, bulk=True):
         if not isinstance(data,_ROOT.DataLoader):
             raise IOError("Data is not a ROOT.DataLoader object. Supply data "
                           "loaded with pybdsim.Data.Load")
         self._et           = data.GetEventTree()
         self._ev           = data.GetEvent()
-        # this two step assignment is stupid but to counter bad behaviour with
-        # root, python and our classes... this works, direct assignemnt doens't
-        sn = data.GetSamplerNames() 
-        self._samplerNames = list(sn)
-        self._samplerNames.insert(0,'Primary')
+        self._samplerNames = _SamplerNames(data)
         self._samplers     = list(self._ev.Samplers)
         self._samplers.insert(0,self._ev.GetPrimaries())
         self._entries      = int(self._et.GetEntries())
 
-        if type(samplerIndexOrName) == str:
-            try:
-                self.samplerIndex = self._samplerNames.index(samplerIndexOrName)
-            except ValueError:
-                self.samplerIndex = self._samplerNames.index(samplerIndexOrName+".")
+        self.samplerIndex = _SamplerIndexFromIndexOrName(self._samplerNames, samplerIndexOrName)
+        self.samplerName  = self._samplerNames[self.samplerIndex]
+        self.eventOffsets = None
+
+        cache = _Cache.GetCache()
+        if cache is not None:
+            key = cache.Key(_EventTreeFileNames(self._et), "SamplerData", self.samplerName, params)
+            cached = cache.Get(key)
+            if cached is not None:
+                self.eventOffsets = cached.pop("__eventOffsets")
+                self.data = cached
+                return
+
+        if bulk and hasattr(_ROOT, "RDataFrame"):
+            self.data = self._GetVariablesBulk(self.samplerIndex, params)
         else:
-            self.samplerIndex = samplerIndexOrName
+            self.data = self._GetVariables(self.samplerIndex, params)
 
-        self.samplerName = self._samplerNames[self.samplerIndex]
-        self.data        = self._GetVariables(self.samplerIndex, params)
+        if cache is not None:
+            cache.Put(key, dict(self.data, __eventOffsets=self.eventOffsets))
 
     def _SamplerIndex(self, samplerName):
         try:
@@ -2047,25 +2598,13 @@ class _SamplerData:
         return _np.array(result)
 
     def _GetVariables(self, samplerIndex, vs):
-        result = {v:[] for v in vs}
         s = self._samplers[samplerIndex]
-        for i in range(self._entries):
-            self._et.GetEntry(i) # loading is the heavy bit
-            for v in vs:
-                r = getattr(s, v)
-                try:
-                    res = list(r)
-                except TypeError:
-                    res = list([r])
-                except AttributeError:
-                    if isinstance(r, _ROOT.vector(bool)):
-                        res = [bool(r[i]) for i in range(r.size())]
-                    else:
-                        raise
-                result[v].extend(res)
+        result, self.eventOffsets = _ReadSamplerVariablesLoop(self._et, [s], vs)[0]
+        return result
 
-        for v in vs:
-            result[v] = _np.array(result[v])
+    def _GetVariablesBulk(self, samplerIndex, vs):
+        bn = _SamplerBranchName(self._samplerNames[samplerIndex])
+        result, self.eventOffsets = _ReadSamplerVariablesBulk(self._et, [bn], vs)[bn]
         return result
 
 
@@ -2083,10 +2622,13 @@ class PhaseSpaceData(_SamplerData):
     >>> primaries = pybdsim.Data.PhaseSpaceData(f)
     >>> samplerfd45 = pybdsim.Data.PhaseSpaceData(f, "samplerfd45")
     >>> thirdAfterPrimaries = pybdsim.Data.PhaseSpaceData(f, 3)
+
+    By default the data is read in bulk (columnar) with RDataFrame. Use bulk=False
+    to load each event in turn as before.
     """
-    def __init__(self, data, samplerIndexOrName=0):
+    def __init__(self, data, samplerIndexOrName=0, bulk=True):
         params = ['x','xp','y','yp','z','zp','energy','T']
-        super(PhaseSpaceData, self).__init__(data, params, samplerIndexOrName)
+        super(PhaseSpaceData, self).__init__(data, params, samplerIndexOrName, bulk)
 
 
 class SamplerData(_SamplerData):
@@ -2103,13 +2645,105 @@ class SamplerData(_SamplerData):
     >>> primaries = pybdsim.Data.SamplerData(f)
     >>> samplerfd45 = pybdsim.Data.SamplerData(f, "samplerfd45")
     >>> thirdAfterPrimaries = pybdsim.Data.SamplerData(f, 3)
+
+    A subset of the variables can be given with params so that only those leaves
+    are read, e.g.
+
+    >>> d1 = pybdsim.Data.SamplerData(f, "d1", params=['x','xp','y','yp'])
+
+    By default the data is read in bulk (columnar) with RDataFrame. Use bulk=False
+    to load each event in turn as before.
+    """
+    def __init__(self, data, samplerIndexOrName=0, params=None, bulk=True):
+        if params is None:
+            params = ['n', 'energy', 'x', 'y', 'z', 'xp', 'yp','zp','T','p',
+                      'weight','partID','parentID','trackID','modelID','turnNumber','S',
+                      'r', 'rp', 'phi', 'phip', 'charge', 'kineticEnergy',
+                      'mass', 'rigidity','isIon','ionA','ionZ']
+        super(SamplerData, self).__init__(data, params, samplerIndexOrName, bulk)
+
+
+class SamplersData(dict):
     """
-    def __init__(self, data, samplerIndexOrName=0):
-        params = ['n', 'energy', 'x', 'y', 'z', 'xp', 'yp','zp','T','p',
-                  'weight','partID','parentID','trackID','modelID','turnNumber','S',
-                  'r', 'rp', 'phi', 'phip', 'charge', 'kineticEnergy',
-                  'mass', 'rigidity','isIon','ionA','ionZ']
-        super(SamplerData, self).__init__(data, params, samplerIndexOrName)
+    Pull data for several samplers from a loaded DataLoader instance of raw data
+    for all events in a single pass over the Event tree.
+
+    This is a dictionary of {samplerName : {param : numpy.array}} where each array is
+    the concatenated values of all events as in SamplerData. The event structure of
+    each sampler is kept in self.eventOffsets[samplerName].
+
+    The samplers may be given as names or indices (0 counting including the primaries).
+    If none are given, all samplers (including the primaries) are loaded. params is the
+    list of variables to load for each sampler - by default the same as SamplerData. ::
+
+    >>> f = pybdsim.Data.Load("file.root")
+    >>> sd = pybdsim.Data.SamplersData(f, ["d1", "e1"], params=['x','xp','y','yp'])
+    >>> sd["d1"]["x"]
+
+    Only the branches of the requested samplers are read. By default the data is
+    read in bulk (columnar) with RDataFrame. With bulk=False, each event is loaded
+    in turn but only the branches required are activated.
+    """
+    def __init__(self, data, samplerIndicesOrNames=None, params=None, bulk=True):
+        super(SamplersData, self).__init__()
+        if not isinstance(data,_ROOT.DataLoader):
+            raise IOError("Data is not a ROOT.DataLoader object. Supply data "
+                          "loaded with pybdsim.Data.Load")
+        if params is None:
+            params = ['n', 'energy', 'x', 'y', 'z', 'xp', 'yp','zp','T','p',
+                      'weight','partID','parentID','trackID','modelID','turnNumber','S',
+                      'r', 'rp', 'phi', 'phip', 'charge', 'kineticEnergy',
+                      'mass', 'rigidity','isIon','ionA','ionZ']
+        self.params = list(params)
+
+        et = data.GetEventTree()
+        samplerNames = _SamplerNames(data)
+        if samplerIndicesOrNames is None:
+            samplerIndices = list(range(len(samplerNames)))
+        else:
+            samplerIndices = [_SamplerIndexFromIndexOrName(samplerNames, s) for s in samplerIndicesOrNames]
+        names = [samplerNames[i].rstrip(".") for i in samplerIndices]
+        branchNames = [_SamplerBranchName(samplerNames[i]) for i in samplerIndices]
+
+        self.eventOffsets = {}
+
+        # use any samplers already in the cache and only read the rest from the file
+        cache = _Cache.GetCache()
+        keys = {}
+        if cache is not None:
+            fileNames = _EventTreeFileNames(et)
+            for name, i in zip(names, samplerIndices):
+                keys[name] = cache.Key(fileNames, "SamplerData", samplerNames[i], self.params)
+                cached = cache.Get(keys[name])
+                if cached is not None:
+                    self.eventOffsets[name] = cached.pop("__eventOffsets")
+                    self[name] = cached
+        toRead = [(name, bn, i) for name, bn, i in zip(names, branchNames, samplerIndices) if name not in self]
+        if len(toRead) == 0:
+            return
+        names, branchNames, samplerIndices = zip(*toRead)
+
+        if bulk and hasattr(_ROOT, "RDataFrame"):
+            results = _ReadSamplerVariablesBulk(et, branchNames, self.params)
+            results = [results[bn] for bn in branchNames]
+        else:
+            ev = data.GetEvent()
+            samplers = list(ev.Samplers)
+            samplers.insert(0, ev.GetPrimaries())
+            statuses = _BranchStatuses(et)
+            et.SetBranchStatus("*", 0)
+            try:
+                for bn in branchNames:
+                    et.SetBranchStatus(bn + "*", 1)
+                results = _ReadSamplerVariablesLoop(et, [samplers[i] for i in samplerIndices], self.params)
+            finally:
+                _RestoreBranchStatuses(et, statuses)
+
+        for name, (values, offsets) in zip(names, results):
+            self[name] = values
+            self.eventOffsets[name] = offsets
+            if cache is not None:
+                cache.Put(keys[name], dict(values, __eventOffsets=offsets))
 
 class TrajectoryData:
     """
@@ -2371,6 +3005,286 @@ class TrajectoryData:
             self.trajectories.append(pyTrajectory)
 
 
+_trajectoryHelpersDeclared = False
+
+def _DeclareTrajectoryHelpers():
+    """
+    Declare (once) small C++ functions to ROOT's interpreter that copy the
+    nested per-trajectory, per-step vectors of an event into flat numpy buffers.
+    This moves the loop over steps out of Python.
+    """
+    global _trajectoryHelpersDeclared
+    if _trajectoryHelpersDeclared:
+        return
+    _ROOT.gInterpreter.Declare("""
+#include <algorithm>
+#include <vector>
+#include "TVector3.h"
+namespace pybdsim
+{
+  template <typename T>
+  void FlattenStepsT(const std::vector<std::vector<T> >& v, const int* offsets, int n, double* out)
+  {
+    std::size_t nt = std::min(v.size(), (std::size_t)n);
+    for (std::size_t i = 0; i < nt; ++i)
+      {
+        std::size_t ns = std::min(v[i].size(), (std::size_t)(offsets[i+1] - offsets[i]));
+        for (std::size_t j = 0; j < ns; ++j)
+          {out[offsets[i] + j] = static_cast<double>(v[i][j]);}
+      }
+  }
+  void FlattenSteps(const std::vector<std::vector<double> >& v, const int* o, int n, double* out) {FlattenStepsT(v, o, n, out);}
+  void FlattenSteps(const std::vector<std::vector<float> >& v, const int* o, int n, double* out) {FlattenStepsT(v, o, n, out);}
+  void FlattenSteps(const std::vector<std::vector<int> >& v, const int* o, int n, double* out) {FlattenStepsT(v, o, n, out);}
+  void FlattenSteps(const std::vector<std::vector<unsigned int> >& v, const int* o, int n, double* out) {FlattenStepsT(v, o, n, out);}
+  void FlattenSteps(const std::vector<std::vector<bool> >& v, const int* o, int n, double* out) {FlattenStepsT(v, o, n, out);}
+
+  void FlattenSteps3(const std::vector<std::vector<TVector3> >& v, const int* offsets, int n,
+                     double* x, double* y, double* z)
+  {
+    std::size_t nt = std::min(v.size(), (std::size_t)n);
+    for (std::size_t i = 0; i < nt; ++i)
+      {
+        std::size_t ns = std::min(v[i].size(), (std::size_t)(offsets[i+1] - offsets[i]));
+        for (std::size_t j = 0; j < ns; ++j)
+          {
+            const TVector3& p = v[i][j];
+            x[offsets[i] + j] = p.X();
+            y[offsets[i] + j] = p.Y();
+            z[offsets[i] + j] = p.Z();
+          }
+      }
+  }
+
+  void StepCounts(const std::vector<std::vector<TVector3> >& v, int* out)
+  {
+    for (std::size_t i = 0; i < v.size(); ++i)
+      {out[i] = (int)v[i].size();}
+  }
+}
+""")
+    _trajectoryHelpersDeclared = True
+
+
+class _TrajectoryView:
+    """
+    A lazy view of one trajectory in a FlatTrajectoryData instance. Step variables
+    are returned as numpy views (no copy) of the flat arrays and trajectory
+    variables (trackID, partID, etc.) as single values. It can be used like
+    the dictionary of each trajectory in TrajectoryData.
+    """
+    def __init__(self, parent, index):
+        self._parent = parent
+        self._index  = index
+
+    def __getitem__(self, key):
+        p = self._parent
+        if key in p.trajectories:
+            return p.trajectories[key][self._index]
+        return p.steps[key][p.offsets[self._index]:p.offsets[self._index+1]]
+
+    def __contains__(self, key):
+        return key in self._parent.trajectories or key in self._parent.steps
+
+    def __len__(self):
+        return int(self._parent.offsets[self._index+1] - self._parent.offsets[self._index])
+
+    def keys(self):
+        return list(self._parent.trajectories.keys()) + list(self._parent.steps.keys())
+
+    def __repr__(self):
+        return "Trajectory " + str(self._index) + " with " + str(len(self)) + " steps"
+
+
+class FlatTrajectoryData:
+    """
+    Pull trajectory data from a loaded DataLoader instance of raw data into flat
+    contiguous arrays.
+
+    All steps of all trajectories of the requested event(s) are stored in one
+    numpy array per variable in self.steps. self.offsets (of length number of
+    trajectories + 1) gives the steps of trajectory i as [offsets[i]:offsets[i+1]].
+    The per-trajectory variables (trackID, partID, parentID, eventNumber and, if
+    stored, parentIDX, parentStepIDX, primaryStepIDX) are in self.trajectories.
+
+    Only the requested step variables (params) are loaded. Available are:
+    'X','Y','Z','PX','PY','PZ','x','y','z','px','py','pz','S','T','EnergyDeposit',
+    'charge','kineticEnergy','turnsTaken','mass','rigidity','isIon','ionA','ionZ',
+    'nElectrons','prePT','prePST','postPT','postPST'. By default all are loaded.
+    Variables that were not stored in the file are filled with zeros.
+
+    eventNumbers can be a single event index, a list of them or None for all events.
+
+    >>> f = pybdsim.Data.Load("file.root")
+    >>> td = pybdsim.Data.FlatTrajectoryData(f, 0, params=['X','Y','Z'])
+    >>> td.steps['X'][td.offsets[3]:td.offsets[4]]
+    >>> td[3]['X']
+
+    Indexing or iterating gives a lazy view of each trajectory that can be used
+    like the dictionaries in TrajectoryData. Requires data version 5 or greater.
+    """
+    # variable name : (member of Trajectory class, component for TVector3 members)
+    _stepVariables = {
+        'X'             : ('XYZ', 0),
+        'Y'             : ('XYZ', 1),
+        'Z'             : ('XYZ', 2),
+        'PX'            : ('PXPYPZ', 0),
+        'PY'            : ('PXPYPZ', 1),
+        'PZ'            : ('PXPYPZ', 2),
+        'x'             : ('xyz', 0),
+        'y'             : ('xyz', 1),
+        'z'             : ('xyz', 2),
+        'px'            : ('pxpypz', 0),
+        'py'            : ('pxpypz', 1),
+        'pz'            : ('pxpypz', 2),
+        'S'             : ('S', None),
+        'T'             : ('T', None),
+        'EnergyDeposit' : ('energyDeposit', None),
+        'charge'        : ('charge', None),
+        'kineticEnergy' : ('kineticEnergy', None),
+        'turnsTaken'    : ('turnsTaken', None),
+        'mass'          : ('mass', None),
+        'rigidity'      : ('rigidity', None),
+        'isIon'         : ('isIon', None),
+        'ionA'          : ('ionA', None),
+        'ionZ'          : ('ionZ', None),
+        'nElectrons'    : ('nElectrons', None),
+        'prePT'         : ('preProcessTypes', None),
+        'prePST'        : ('preProcessSubTypes', None),
+        'postPT'        : ('postProcessTypes', None),
+        'postPST'       : ('postProcessSubTypes', None),
+    }
+    _integerVariables = {'charge', 'turnsTaken', 'ionA', 'ionZ', 'nElectrons',
+                         'prePT', 'prePST', 'postPT', 'postPST'}
+    # per trajectory variable name : member of Trajectory class
+    _trajectoryVariables = {
+        'trackID'        : 'trackID',
+        'partID'         : 'partID',
+        'parentID'       : 'parentID',
+        'parentIDX'      : 'parentIndex',
+        'parentStepIDX'  : 'parentStepIndex',
+        'primaryStepIDX' : 'primaryStepIndex',
+    }
+
+    def __init__(self, dataLoader, eventNumbers=0, params=None):
+        _DeclareTrajectoryHelpers()
+        self._eventTree  = dataLoader.GetEventTree()
+        self._event      = dataLoader.GetEvent()
+        self._trajectory = self._event.GetTrajectory()
+        _header     = dataLoader.GetHeader()
+        _headerTree = dataLoader.GetHeaderTree()
+        _headerTree.GetEntry(0)
+        if _header.header.dataVersion < 5:
+            raise ValueError("FlatTrajectoryData requires data version >= 5 - use TrajectoryData")
+
+        if params is None:
+            params = list(self._stepVariables.keys())
+        for p in params:
+            if p not in self._stepVariables:
+                raise ValueError("Unknown trajectory variable \"" + str(p) + "\"")
+        self.params = list(params)
+
+        nEvents = int(self._eventTree.GetEntries())
+        if eventNumbers is None:
+            eventNumbers = range(nEvents)
+        elif isinstance(eventNumbers, (int, _np.integer)):
+            eventNumbers = [eventNumbers]
+        for ei in eventNumbers:
+            if ei >= nEvents:
+                raise IndexError("Event number " + str(ei) + " beyond number of events in file")
+
+        statuses = _BranchStatuses(self._eventTree)
+        self._ActivateBranches()
+        try:
+            self._Load(eventNumbers)
+        finally:
+            _RestoreBranchStatuses(self._eventTree, statuses)
+
+    def _ActivateBranches(self):
+        members = {"n", "XYZ"}
+        members.update(self._trajectoryVariables.values())
+        members.update(self._stepVariables[p][0] for p in self.params)
+        self._eventTree.SetBranchStatus("*", 0)
+        self._eventTree.SetBranchStatus("Trajectory.", 1)
+        for m in members:
+            self._eventTree.SetBranchStatus("Trajectory." + m + "*", 1)
+
+    def _Load(self, eventNumbers):
+        t = self._trajectory
+        members = {}
+        for p in self.params:
+            m, component = self._stepVariables[p]
+            members.setdefault(m, []).append((p, component))
+
+        steps = {p:[] for p in self.params}
+        trajectories = {k:[] for k in self._trajectoryVariables}
+        trajectories['eventNumber'] = []
+        counts = []
+
+        for ei in eventNumbers:
+            self._eventTree.GetEntry(int(ei))
+            n = int(t.n)
+            nSteps = _np.zeros(n, dtype=_np.int32)
+            if n > 0:
+                _ROOT.pybdsim.StepCounts(t.XYZ, nSteps)
+            localOffsets = _np.zeros(n + 1, dtype=_np.int32)
+            _np.cumsum(nSteps, out=localOffsets[1:])
+            total = int(localOffsets[-1])
+
+            for m, requested in members.items():
+                arrays = [_np.zeros(total) for _ in range(3)] if requested[0][1] is not None else [_np.zeros(total)]
+                if n > 0 and total > 0:
+                    member = getattr(t, m)
+                    if requested[0][1] is not None:
+                        _ROOT.pybdsim.FlattenSteps3(member, localOffsets, n, arrays[0], arrays[1], arrays[2])
+                    else:
+                        _ROOT.pybdsim.FlattenSteps(member, localOffsets, n, arrays[0])
+                for p, component in requested:
+                    steps[p].append(arrays[component if component is not None else 0])
+
+            for k, m in self._trajectoryVariables.items():
+                v = _np.array(getattr(t, m), dtype=_np.int64)
+                trajectories[k].append(v if len(v) == n else _np.zeros(n, dtype=_np.int64))
+            trajectories['eventNumber'].append(_np.full(n, int(ei), dtype=_np.int64))
+            counts.append(nSteps)
+
+        self.steps = {}
+        for p in self.params:
+            a = _np.concatenate(steps[p]) if steps[p] else _np.array([])
+            if p == 'isIon':
+                a = a.astype(bool)
+            elif p in self._integerVariables:
+                a = a.astype(_np.int32)
+            self.steps[p] = a
+        self.trajectories = {k:(_np.concatenate(v) if v else _np.array([], dtype=_np.int64))
+                             for k,v in trajectories.items()}
+        counts = _np.concatenate(counts) if counts else _np.array([], dtype=_np.int64)
+        self.offsets = _CountsToOffsets(counts)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __repr__(self):
+        return str(len(self)) + ' trajectories with ' + str(int(self.offsets[-1])) + ' steps'
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Trajectory index out of range")
+        return _TrajectoryView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield _TrajectoryView(self, i)
+
+    def StepTrajectoryIndex(self):
+        """
+        Return an array of the trajectory index of each step (i.e. for self.steps).
+        """
+        return _np.repeat(_np.arange(len(self)), _np.diff(self.offsets))
+
+
 class EventInfoData:
     """
     Extract data from the Info branch of the Event tree.
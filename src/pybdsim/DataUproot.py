@@ -10,12 +10,15 @@ Design goals:
 # this must apparently be at the beginning of the file or the imports crash
 from __future__ import annotations as _annotations
 
+from . import Cache as _Cache
 from . import Data as _Data
 
 import awkward as _ak
 from collections import UserDict as _UserDict
+import functools as _functools
+import glob as _glob
 import logging as _logging
-import itertools as _itertools
+import multiprocessing as _multiprocessing
 import os as _os
 import numpy as _np
 import pandas as _pd
@@ -63,6 +66,7 @@ __all__ = [
     'REBDSIMOutput',
     'REBDSIMOpticsOutput',
     'REBDSIMCombineOutput',
+    'BDSIMDataset',
     'Histogram',
     'Histogram2D',
     'Histogram3D'
@@ -201,6 +205,36 @@ class Histogram3D(Histogram):
         self.to_df().to_csv(_os.path.join(path, filename), header=False, float_format='% 11.7E', **kwargs)
 
 
+def _fluka_spectrum_text(values, name):
+    """Format one spectrum (highest energy first, 6 values per line) in the FLUKA text format."""
+    values = values[::-1]
+    rows = [values[i:i + 6] for i in range(0, len(values), 6)]
+    return "\n".join(("  {:.4E}" * len(row)).format(*row) for row in rows) + "\n 1.000\n" + name
+
+
+def _write_fluka_slab(prefix: str, values: _np.ndarray, origin: _Tuple[int, int, int],
+                      path: str, single_file: bool) -> str:
+    """
+    Format the spectra of a slab of voxels (values of shape (nx, ny, nz, ne)) whose first voxel has
+    the indices `origin` in the mesh. Each spectrum is written to its own file in `path`, or if
+    `single_file` the text of all of them is returned instead.
+    """
+    blocks = []
+    for i, j, k in _np.ndindex(values.shape[:3]):
+        name = f"{prefix}_{origin[0] + i}_{origin[1] + j}_{origin[2] + k}"
+        text = _fluka_spectrum_text(values[i, j, k], name)
+        if single_file:
+            blocks.append(text + "\n")
+        else:
+            with open(_os.path.join(path, name), 'w') as f:
+                f.write(text)
+    return "".join(blocks)
+
+
+def _write_fluka_slab_star(args):
+    return _write_fluka_slab(*args)
+
+
 class Histogram4D:
     def __init__(self, parent, bdsbh4d_histogram, name):
         self._h = bdsbh4d_histogram
@@ -240,83 +274,121 @@ class Histogram4D:
                 bh.axis.Regular(self._h.h_nzbins, self._h.h_zmin, self._h.h_zmax),
                 energy_axis)
 
-            for x, y, z, e in _itertools.product(range(self._h.h_nxbins), range(self._h.h_nybins),
-                                                 range(self._h.h_nzbins), range(self._h.h_nebins)):
-                histo4d[x, y, z, e] = getattr(self._h, hist_type).at(x, y, z, e)
+            histo4d.view()[...] = _Data._BDSBH4DToNumpy(self._h, hist_type)
 
             return histo4d
         else:
             raise AttributeError("Boost histograms are not available")
 
-    def extract_spectrum(self, x=0, y=0, z=0, path='.', extract_all=False):
-
+    def _extract_fluka(self, prefix, histogram, x, y, z, path, extract_all, single_file, n_workers):
+        values = histogram.view()
+        origin = (0, 0, 0)
         if not extract_all:
-            all_x = [x]
-            all_y = [y]
-            all_z = [z]
-        else:
-            all_x = range(self.xnumbins)
-            all_y = range(self.ynumbins)
-            all_z = range(self.znumbins)
+            values = values[x:x + 1, y:y + 1, z:z + 1]
+            origin = (x, y, z)
+        prefix = f"{prefix}_{self.meshname}"
+        # one task per slab of constant x so that the memory used stays small
+        tasks = [(prefix, values[i:i + 1], (origin[0] + i, origin[1], origin[2]), path, single_file)
+                 for i in range(values.shape[0])]
+
+        out = open(_os.path.join(path, prefix), 'w') if single_file else None
+        try:
+            if n_workers > 1 and len(tasks) > 1:
+                with _multiprocessing.Pool(min(n_workers, len(tasks))) as pool:
+                    for text in pool.imap(_write_fluka_slab_star, tasks):
+                        if out:
+                            out.write(text)
+            else:
+                for task in tasks:
+                    text = _write_fluka_slab(*task)
+                    if out:
+                        out.write(text)
+        finally:
+            if out:
+                out.close()
+
+    def extract_spectrum(self, x=0, y=0, z=0, path='.', extract_all=False, single_file=False, n_workers=1):
+        """
+        Write the spectrum of voxel (x, y, z), or every voxel if `extract_all`, in the FLUKA text format.
 
-        for _x in all_x:
-            for _y in all_y:
-                for _z in all_z:
+        By default each spectrum is written to a file `fluxes_<meshname>_<x>_<y>_<z>`. With `single_file`
+        all of them are written one after another into the file `fluxes_<meshname>`, each ending with its
+        name. The voxels can be formatted by slabs of constant x in a pool of `n_workers` processes.
+        See also `export_spectra` for a binary container that is much faster to write and read.
+        """
+        self._extract_fluka('fluxes', self.bh, x, y, z, path, extract_all, single_file, n_workers)
 
-                    f = open(f"{path}/fluxes_{self.meshname}_{_x}_{_y}_{_z}", 'w')
-                    spectrum = list(self.bh[_x, _y, _z, :].to_numpy()[0])
-                    spectrum.reverse()
+    def extract_error(self, x=0, y=0, z=0, path='.', extract_all=False, single_file=False, n_workers=1):
+        """
+        Write the errors of the spectrum of voxel (x, y, z), or every voxel if `extract_all`, in the FLUKA
+        text format to files `errors_<meshname>_...`. The options are the same as `extract_spectrum`.
+        """
+        self._extract_fluka('errors', self.bh_err, x, y, z, path, extract_all, single_file, n_workers)
 
-                    i = 1
-                    for value in spectrum:
-                        f.write("  {:.4E}".format(value))
-                        if i % 6 == 0 and i != len(spectrum):
-                            f.write('\n')
-                        i += 1
-                    f.write('\n 1.000\n')
-                    f.write(f'fluxes_{self.meshname}_{_x}_{_y}_{_z}')
+    def export_spectra(self, filename: str, errors: bool = True, compress: bool = False):
+        """
+        Write the spectra of all the voxels into a single binary file indexed by voxel.
 
-                    f.close()
+        The format is chosen by the extension: '.npz' (numpy) or '.h5' / '.hdf5' (requires h5py). The file
+        contains the arrays 'spectra' (and 'errors') with shape (nvoxels, nebins) where row n is the voxel
+        with indices 'voxel_index'[n] = (x, y, z), the bin edges 'x_edges', 'y_edges', 'z_edges' and
+        'energy_edges' and 'shape'. It can be read with `Histogram4D.load_spectra`.
 
-    def extract_error(self, x=0, y=0, z=0, path='.', extract_all=False):
+        Args:
+            filename: the name of the output file
+            errors: whether to include the errors
+            compress: whether to compress the data
+        """
+        shape = self.shape
+        arrays = {
+            'spectra': self.bh.view().reshape(-1, shape[3]),
+            'voxel_index': _np.stack(_np.unravel_index(_np.arange(_np.prod(shape[:3])), shape[:3]), axis=1),
+            'x_edges': self.bh.axes[0].edges,
+            'y_edges': self.bh.axes[1].edges,
+            'z_edges': self.bh.axes[2].edges,
+            'energy_edges': self.bh.axes[3].edges,
+            'shape': _np.array(shape),
+        }
+        if errors:
+            arrays['errors'] = self.bh_err.view().reshape(-1, shape[3])
 
-        if not extract_all:
-            all_x = [x]
-            all_y = [y]
-            all_z = [z]
+        if filename.endswith('.npz'):
+            (_np.savez_compressed if compress else _np.savez)(filename, **arrays)
+        elif filename.endswith('.h5') or filename.endswith('.hdf5'):
+            try:
+                import h5py as _h5py
+            except ImportError:
+                raise ImportError("h5py is required to write HDF5 files - use a .npz file instead")
+            with _h5py.File(filename, 'w') as f:
+                for name, array in arrays.items():
+                    f.create_dataset(name, data=array, compression='gzip' if compress and array.ndim > 1 else None)
+                f.attrs['meshname'] = self.meshname
         else:
-            all_x = range(self.xnumbins)
-            all_y = range(self.ynumbins)
-            all_z = range(self.znumbins)
-
-        for _x in all_x:
-            for _y in all_y:
-                for _z in all_z:
+            raise ValueError(f"Unknown format for '{filename}' - use .npz, .h5 or .hdf5")
 
-                    f = open(f"{path}/errors_{self.meshname}_{_x}_{_y}_{_z}", 'w')
-                    spectrum = list(self.bh_err[_x, _y, _z, :].to_numpy()[0])
-                    spectrum.reverse()
-
-                    i = 1
-                    for value in spectrum:
-                        f.write("  {:.4E}".format(value))
-                        if i % 6 == 0 and i != len(spectrum):
-                            f.write('\n')
-                        i += 1
-                    f.write('\n 1.000\n')
-                    f.write(f'errors_{self.meshname}_{_x}_{_y}_{_z}')
-
-                    f.close()
+    @staticmethod
+    def load_spectra(filename: str) -> _Dict[str, _np.ndarray]:
+        """
+        Read a file written by `export_spectra` into a dictionary of numpy arrays.
+        """
+        if filename.endswith('.npz'):
+            with _np.load(filename) as f:
+                return {name: f[name] for name in f.files}
+        import h5py as _h5py
+        with _h5py.File(filename, 'r') as f:
+            return {name: f[name][()] for name in f.keys()}
 
     def project_to_3d(self, weights=1):
-
+        """
+        Sum over the energy axis with optional weights (a number or one per energy bin).
+        """
         histo3d = bh.Histogram(*self.bh.axes[0:3])
 
-        for x in range(self.bh.shape[0]):
-            for y in range(self.bh.shape[1]):
-                for z in range(self.bh.shape[2]):
-                    tmp = self.bh[x, y, z, :].view() * weights
-                    histo3d[x, y, z] = tmp.sum()
+        values = self.bh.view()
+        if _np.ndim(weights) == 0:
+            histo3d.view()[...] = values.sum(axis=3) * weights
+        else:
+            histo3d.view()[...] = values @ _np.asarray(weights, dtype=float)
 
         self._cache = histo3d.view()
         return histo3d
@@ -324,7 +396,6 @@ class Histogram4D:
     def compute_h10(self, conversionfactorfile):
         data = _pd.read_table(conversionfactorfile, names=["energy", "h10_coeff"])
         f = _interp1d(data['energy'].values, data['h10_coeff'].values)
-        self._cache = self.project_to_3d(weights=f(self.bh.axes[3].centers)).view()
         return self.project_to_3d(weights=f(self.bh.axes[3].centers))
 
     def plot_spectrum(self, x=0, y=0, z=0, xlim=[1e-10, 300], ylim=[1e-15, 1e-7], log=True, error_bar=True, **kwargs):
@@ -659,6 +730,25 @@ class Output(metaclass=OutputType):
             """A proxy for the `uproot` `pandas` method."""
             return self._tree.pandas.df(branches=branches, **kwargs)
 
+        def iterate(self, branches: _List[str], step_size: _Union[int, str] = "100 MB", library: str = 'ak', **kwargs):
+            """
+            Iterate over the tree in chunks of bounded size so that a whole file never has to be held in memory.
+
+            Only the requested branches are read. Each chunk is read with `uproot`'s `iterate`.
+
+            Args:
+                branches: the full names of the branches (leaves) to read, e.g. ['Eloss.S', 'Eloss.energy']
+                step_size: the size of each chunk as a number of entries (int) or a memory size (str, e.g. "100 MB")
+                library: the `uproot` library of the arrays returned ('ak', 'np' or 'pd')
+                kwargs: passed to `uproot` `iterate`
+
+            Yields:
+                a tuple of the global event (entry) numbers of the chunk and the arrays for that chunk
+            """
+            for arrays, report in self._tree.iterate(branches, step_size=step_size, library=library,
+                                                     report=True, **kwargs):
+                yield _np.arange(report.tree_entry_start, report.tree_entry_stop), arrays
+
         def to_df(self) -> _pd.DataFrame:
             pass
 
@@ -762,11 +852,57 @@ class Output(metaclass=OutputType):
                 df.columns = [re.split(self.branch_name, c)[1] for c in df.columns]
             return df
 
+        def iterate(self, branches: _List[str] = None, step_size: _Union[int, str] = "100 MB",
+                    strip_prefix: bool = True, **kwargs):
+            """
+            Iterate over the leaves of this branch in chunks of bounded size (see `Output.Tree.iterate`).
+
+            Args:
+                branches: the leaves to read (defaults to the active leaves)
+                step_size: the size of each chunk as a number of entries (int) or a memory size (str, e.g. "100 MB")
+                strip_prefix: remove the branch name from the field names of the arrays
+                kwargs: passed to `Output.Tree.iterate`
+
+            Yields:
+                a tuple of the global event numbers of the chunk and an awkward array of the leaves for that chunk
+            """
+            if branches is None:
+                branches = [b for b, _ in self._active_leaves.items() if _[0] is True]
+            for event_numbers, arrays in self.parent.iterate([self.branch_name + b for b in branches],
+                                                             step_size=step_size, library='ak', **kwargs):
+                if strip_prefix:
+                    arrays = _ak.zip({b: arrays[self.branch_name + b] for b in branches}, depth_limit=1)
+                yield event_numbers, arrays
+
         def to_df(self) -> _pd.DataFrame:
             if self._df is None:
-                self._df = self.pandas()
+                cache = _Cache.GetCache()
+                filename = self.parent.parent.file
+                if cache is None or filename is None:
+                    self._df = self.pandas()
+                else:
+                    self._df = self._cached_pandas(cache, filename)
             return self._df
 
+        def _cached_pandas(self, cache: _Cache.ColumnCache, filename: str) -> _pd.DataFrame:
+            """Read the active leaves with `pandas` via the column cache (see `pybdsim.Cache`)."""
+            leaves = [b for b, _ in self._active_leaves.items() if _[0] is True]
+            key = cache.Key(filename, 'to_df', self.parent._tree_name, self.branch_name, leaves)
+            columns = cache.Get(key)
+            if columns is not None:
+                index_names = list(columns.pop('__index_names'))
+                df = _pd.DataFrame(columns)
+                return df.set_index(index_names) if index_names else df
+            df = self.pandas()
+            index_names = list(df.index.names)
+            if any(n is None for n in index_names):
+                index_names = []
+            flat = df.reset_index() if index_names else df.reset_index(drop=True)
+            columns = {c: flat[c].values for c in flat.columns}
+            columns['__index_names'] = _np.array(index_names, dtype=object)
+            cache.Put(key, columns)
+            return df
+
         def to_np(self) -> _np.ndarray:
             pass
 
@@ -813,6 +949,28 @@ class Output(metaclass=OutputType):
 
 
 class BDSIMOutput(Output):
+    def iterate(self, branches: _List[str], step_size: _Union[int, str] = "100 MB", library: str = 'ak', **kwargs):
+        """
+        Iterate over the events of the file in chunks of bounded size.
+
+        This allows quantities (e.g. loss maps or histograms) to be computed over very large files with
+        constant memory. Only the requested branches are read.
+
+        >>> d = pybdsim.DataUproot.BDSIMOutput("output.root")
+        >>> for event_numbers, chunk in d.iterate(['Eloss.S', 'Eloss.energy'], step_size="100 MB"):
+        ...     h += np.histogram(ak.flatten(chunk['Eloss.S']), bins, weights=ak.flatten(chunk['Eloss.energy']))[0]
+
+        Args:
+            branches: the full names of the branches (leaves) of the Event tree to read
+            step_size: the size of each chunk as a number of events (int) or a memory size (str, e.g. "100 MB")
+            library: the `uproot` library of the arrays returned ('ak', 'np' or 'pd')
+            kwargs: passed to `uproot` `iterate`
+
+        Yields:
+            a tuple of the global event numbers of the chunk and the arrays for that chunk
+        """
+        return self.event.iterate(branches, step_size=step_size, library=library, **kwargs)
+
     def __getattr__(self, item):
         if item in (
                 'header',
@@ -1870,3 +2028,122 @@ class REBDSIMCombineOutput(REBDSIMOutput):
         if item not in ('event', 'header'):
             return None
         return super().__getattr__(item)
+
+
+def _read_branch(file_index: int, filename: str, branch_name: str, leaves: _List[str]) -> _pd.DataFrame:
+    """Read some leaves of a branch of the Event tree of one file into a flat `pandas.DataFrame`."""
+    tree = _uproot.open(filename)['Event']
+    arrays = tree.arrays([branch_name + leaf for leaf in leaves], library='ak')
+    df = _ak.to_dataframe(arrays, how='outer')
+    df.columns = [c[len(branch_name):] if c.startswith(branch_name) else c for c in df.columns]
+    df = df.reset_index()
+    df = df.rename(columns={'entry': 'event', 'subentry': 'index'})
+    df.insert(0, 'file_index', file_index)
+    return df
+
+
+def _map_file(mapper, file_index_and_filename):
+    file_index, filename = file_index_and_filename
+    return mapper(BDSIMOutput(filename, path=''))
+
+
+class BDSIMDataset:
+    def __init__(self, files: _Union[str, _List[str]], n_workers: _Optional[int] = None):
+        """
+        A set of raw BDSIM output files (e.g. as produced by `pybdsim.Run.BdsimParallel`) read as one dataset.
+
+        Each file is read in a separate process of a pool and the columns of the samplers, energy
+        deposition and primaries are concatenated with a `file_index` column identifying the file
+        (the index in `files`) and an `event` column with the event index in that file.
+
+        >>> ds = pybdsim.DataUproot.BDSIMDataset("outfile_*.root", n_workers=8)
+        >>> eloss = ds.eloss(['S', 'energy', 'weight'])
+        >>> d1 = ds.sampler('d1', ['x', 'xp', 'y', 'yp'])
+
+        User reductions can be applied with `map` and `map_reduce`, where the mapper receives a
+        `BDSIMOutput` for each file. The mapper and reducer must be module-level (picklable) functions.
+
+        >>> def n_events(output): return output.event.numentries
+        >>> total = ds.map_reduce(n_events, operator.add, 0)
+
+        Args:
+            files: a glob pattern (str) or a list of file names
+            n_workers: the number of processes to use (default the number of cores minus 1); 1 reads serially
+        """
+        if isinstance(files, str):
+            files = sorted(_glob.glob(files))
+        self._files = list(files)
+        if len(self._files) == 0:
+            raise BDSIMOutputException("No files in dataset.")
+        if n_workers is None:
+            n_workers = max(1, _multiprocessing.cpu_count() - 1)
+        self._n_workers = max(1, int(n_workers))
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def files(self) -> _List[str]:
+        """The files of the dataset - the `file_index` column is the index in this list."""
+        return self._files
+
+    @property
+    def n_workers(self) -> int:
+        return self._n_workers
+
+    def _map(self, function, iterable):
+        iterable = list(iterable)
+        n_workers = min(self._n_workers, len(iterable))
+        if n_workers <= 1:
+            return [function(*args) for args in iterable]
+        with _multiprocessing.Pool(processes=n_workers) as pool:
+            return pool.starmap(function, iterable)
+
+    def read(self, branch: str, leaves: _List[str]) -> _pd.DataFrame:
+        """
+        Read some leaves of a branch of the Event tree of all files into one `pandas.DataFrame`.
+
+        Args:
+            branch: the name of the branch (e.g. 'Eloss' or a sampler name)
+            leaves: the leaves to read (e.g. ['S', 'energy'])
+        """
+        branch_name = branch if branch.endswith('.') else branch + '.'
+        frames = self._map(_read_branch,
+                           [(i, f, branch_name, list(leaves)) for i, f in enumerate(self._files)])
+        return _pd.concat(frames, ignore_index=True)
+
+    def sampler(self, name: str, leaves: _Optional[_List[str]] = None) -> _pd.DataFrame:
+        """Read a sampler from all files (by default its default leaves)."""
+        if leaves is None:
+            leaves = [k for k, v in BDSIMOutput.Event.Sampler.DEFAULT_LEAVES.items() if v[0]]
+        return self.read(name, leaves)
+
+    def eloss(self, leaves: _Optional[_List[str]] = None, branch: str = 'Eloss') -> _pd.DataFrame:
+        """Read the energy deposition (by default the `Eloss` branch) from all files."""
+        if leaves is None:
+            leaves = [k for k, v in BDSIMOutput.Event.Eloss.DEFAULT_LEAVES.items()
+                      if v[0] and not k.startswith('store')]
+        return self.read(branch, leaves)
+
+    def primary(self, leaves: _Optional[_List[str]] = None) -> _pd.DataFrame:
+        """Read the primaries from all files."""
+        if leaves is None:
+            leaves = [k for k, v in BDSIMOutput.Event.Primary.DEFAULT_LEAVES.items() if v[0]]
+        return self.read('Primary', leaves)
+
+    def map(self, mapper) -> list:
+        """
+        Apply `mapper` to a `BDSIMOutput` of each file in parallel and return the list of results
+        in the order of `files`.
+        """
+        return self._map(_functools.partial(_map_file, mapper), [((i, f),) for i, f in enumerate(self._files)])
+
+    def map_reduce(self, mapper, reducer, initial=None):
+        """
+        Apply `mapper` to a `BDSIMOutput` of each file in parallel and combine the results
+        with `reducer(a, b)`, starting from `initial` if given.
+        """
+        results = self.map(mapper)
+        if initial is None:
+            return _functools.reduce(reducer, results)
+        return _functools.reduce(reducer, results, initial)
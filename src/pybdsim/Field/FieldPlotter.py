@@ -1,5 +1,6 @@
 import matplotlib.pyplot as _plt
 import matplotlib as _mpl
+import itertools as _itertools
 import numpy as _np
 import os as _os
 import pybdsim as _pybdsim
@@ -33,11 +34,62 @@ def _ArrowSize(d):
         result = _np.min([result, step])
     return result
 
+def _GridView(fm):
+    """
+    Return a view of the data of a field with the axes in the order of the
+    coordinate columns (e.g. [x,y,z,values]) whatever loop order it was loaded
+    or constructed in, or None if this can't be determined from the header.
+
+    The order is found by checking only a few points, so no data is copied or
+    read (e.g. from a memory-mapped field) until the view is sliced.
+    """
+    nDim = fm.nDimensions
+    data = fm.data
+    nValues = _np.shape(data)[-1]
+    try:
+        n = [int(fm.header['n' + c.lower()]) for c in fm.columns[:nDim]]
+    except (KeyError, ValueError, TypeError):
+        return None
+    if int(_np.prod(n)) * nValues != _np.size(data):
+        return None
+    flat = data.reshape(-1, nValues)
+
+    # try each order of dimensions (slowest to fastest) and check stepping one index
+    # along each dimension only changes that coordinate
+    for order in _itertools.permutations(range(nDim)):
+        strides = {}
+        stride = 1
+        for d in reversed(order):
+            strides[d] = stride
+            stride *= n[d]
+        valid = True
+        for d in range(nDim):
+            if n[d] == 1:
+                continue
+            row = flat[strides[d]]
+            changed = row[:nDim] != flat[0, :nDim]
+            if not changed[d] or _np.count_nonzero(changed) != 1:
+                valid = False
+                break
+        if valid:
+            grid = flat.reshape(*[n[d] for d in order], nValues)
+            return grid.transpose(*[order.index(d) for d in range(nDim)], nDim)
+    return None
+
+
 class FourDData:
     """
     Class purely to simplify plotting of fields. Not for general use.
+
+    The coordinates (x,y,...) and field components (fx,fy,fz,mag) are flattened
+    arrays that are only made when first used. The number of points in each
+    dimension (nx,...) and the axes come from the header.
+
+    sliceAt is an optional dictionary of the index to take in any dimension, e.g.
+    {'z' : 3}, so only that slice of the field map is used (and read from disk
+    for a memory-mapped field map).
     """
-    def __init__(self, filename, xind=0, yind=1, zind=2, tind=3, symmetry="none", transpose=False):
+    def __init__(self, filename, xind=0, yind=1, zind=2, tind=3, symmetry="none", transpose=False, sliceAt=None):
         # check for the dimensionality of the field
         self.nDim = 1 if yind == -1 else 2 if zind == -1 else 3 if tind == -1 else 4
         fm = _GetField(filename, self.nDim)
@@ -47,39 +99,102 @@ class FourDData:
         #    # currently only works for 2D fields
         #    if self.nDim == 2:
         #        fm._UseSymmetry(symmetry, transpose)
-        self.data = fm.data
-            
-        # '...' fills in unknown number of dimensions with ':' meaning
-        # all of that dimension
-        if (xind >= 0):
-            self.x  = self[..., xind].flatten()
-            self.nx = len(_np.unique(self.x))
-        if (yind >= 0):
-            self.y  = self[..., yind].flatten()
-            self.ny = len(_np.unique(self.y))
-        if (zind >= 0):
-            self.z  = self[..., zind].flatten()
-            self.nz = len(_np.unique(self.z))
-        if (tind >= 0):
-            self.t  = self[..., tind].flatten()
-            self.nt = len(_np.unique(self.t))
-
-        # index from end as we don't know the dimensionality
-        self.fx = self[..., -3].flatten()
-        self.fy = self[..., -2].flatten()
-        self.fz = self[..., -1].flatten()
-        self.mag = _np.sqrt(self.fx**2 + self.fy**2 + self.fz**2)
+        self.data    = fm.data
+        self.header  = fm.header
+        self.columns = fm.columns
+        self._cache  = {}
+        self._inds   = {'x' : xind, 'y' : yind, 'z' : zind, 't' : tind}
+        self._points = None # flattened data of the points used if not all
+
+        names = [c.lower() for c in fm.columns[:self.nDim]]
+        for name, ind in self._inds.items():
+            if ind < 0:
+                continue
+            key = 'n' + names[ind]
+            if key in self.header:
+                setattr(self, 'n' + name, int(self.header[key]))
+            else:
+                setattr(self, 'n' + name, len(_np.unique(self[..., ind])))
+
+        if sliceAt:
+            grid = _GridView(fm)
+            if grid is not None:
+                index = [slice(None)] * self.nDim
+                for name, i in sliceAt.items():
+                    index[self._inds[name]] = i
+                grid = grid[tuple(index)]
+                # flatten in file order (first dimension fastest)
+                self._points = _np.ascontiguousarray(grid.transpose(*reversed(range(grid.ndim - 1)), grid.ndim - 1)).reshape(-1, grid.shape[-1])
+            else:
+                mask = _np.ones(_np.size(self.data) // _np.shape(self.data)[-1], dtype=bool)
+                for name, i in sliceAt.items():
+                    coord = self[..., self._inds[name]].reshape(-1)
+                    mask &= coord == _np.unique(coord)[i]
+                self._points = self.data.reshape(-1, _np.shape(self.data)[-1])[mask]
+            for name in sliceAt:
+                setattr(self, 'n' + name, 1)
 
     def __getitem__(self, key):
         return self.data[key]
 
+    def _Column(self, index):
+        if index not in self._cache:
+            if self._points is not None:
+                self._cache[index] = self._points[:, index]
+            else:
+                # '...' fills in unknown number of dimensions with ':' meaning all of that dimension
+                self._cache[index] = self[..., index].flatten()
+        return self._cache[index]
+
+    def Axis(self, name):
+        """
+        Return the coordinates of the points along one axis (e.g. 'x') from the header.
+        """
+        c = self.columns[self._inds[name]].lower()
+        return _np.linspace(self.header[c + 'min'], self.header[c + 'max'], int(self.header['n' + c]))
+
+    @property
+    def x(self):
+        return self._Column(self._inds['x'])
+
+    @property
+    def y(self):
+        return self._Column(self._inds['y'])
+
+    @property
+    def z(self):
+        return self._Column(self._inds['z'])
+
+    @property
+    def t(self):
+        return self._Column(self._inds['t'])
+
+    # index from end as we don't know the dimensionality
+    @property
+    def fx(self):
+        return self._Column(-3)
+
+    @property
+    def fy(self):
+        return self._Column(-2)
+
+    @property
+    def fz(self):
+        return self._Column(-1)
+
+    @property
+    def mag(self):
+        if 'mag' not in self._cache:
+            self._cache['mag'] = _np.sqrt(self.fx**2 + self.fy**2 + self.fz**2)
+        return self._cache['mag']
+
 
 class ThreeDData(FourDData):
     """
     Class purely to simplify plotting of fields. Not for general use.
     """
-    def __init__(self, filename, symmetry="none", transpose=False):
-        FourDData.__init__(self, filename, tind=-1, symmetry=symmetry, transpose=transpose)
+    def __init__(self, filename, symmetry="none", transpose=False, sliceAt=None):
+        FourDData.__init__(self, filename, tind=-1, symmetry=symmetry, transpose=transpose, sliceAt=sliceAt)
 
 class TwoDData(FourDData):
     """
@@ -102,13 +217,13 @@ class NDData(FourDData):
     def __init__(self, filename, symmetry="none", transpose=False):
         fm = _GetField(filename)
         if fm.nDimensions == 1:
-            OneDData.__init__(self, filename, symmetry, transpose)
+            OneDData.__init__(self, fm, symmetry, transpose)
         elif fm.nDimensions == 2:
-            TwoDData.__init__(self, filename, symmetry, transpose)
+            TwoDData.__init__(self, fm, symmetry, transpose)
         elif fm.nDimensions == 3:
-            ThreeDData.__init__(self, filename, symmetry, transpose)
+            ThreeDData.__init__(self, fm, symmetry, transpose)
         elif fm.nDimensions == 4:
-            FourDData.__init__(self, filename, symmetry, transpose)
+            FourDData.__init__(self, fm, symmetry=symmetry, transpose=transpose)
         else:
             raise ValueError("Field must be of dimension 1, 2, 3 or 4")
 
@@ -177,7 +292,7 @@ def Plot2DXY(filename, scale=None, title=None, flipX=False, firstDimension="X",
     d = TwoDData(filename, symmetry, transpose)
     _plt.figure(figsize=figsize)
     norm = _mpl.colors.Normalize(vmin=vmin, vmax=vmax)
-    cmap = _mpl.colors.ListedColormap(_plt.cm.get_cmap(cmap)(_np.linspace(0, 1, 256)))
+    cmap = _mpl.colors.ListedColormap(_mpl.colormaps.get_cmap(cmap)(_np.linspace(0, 1, 256)))
     _plt.quiver(d.x,d.y,d.fx,d.fy,d.mag,cmap=cmap,pivot='mid',scale=scale, norm=norm)
     if title:
         _plt.title(title)
@@ -256,7 +371,7 @@ def Plot2D(filename, scale=None, title=None, flipX=False, flipY=False, firstDime
     fi /= fmag
     fj /= fmag
     norm = _mpl.colors.Normalize(vmin=vmin, vmax=vmax)
-    cmap = _mpl.colors.ListedColormap(_plt.cm.get_cmap(cmap)(_np.linspace(0, 1, 256)))
+    cmap = _mpl.colors.ListedColormap(_mpl.colormaps.get_cmap(cmap)(_np.linspace(0, 1, 256)))
     _plt.quiver(ci, cj, fi, fj, fmag, cmap=cmap, norm=norm, pivot='mid', scale=1.0/scale, units='xy', scale_units='xy')
     if title:
         _plt.title(title)
@@ -330,20 +445,18 @@ def Plot2DXYStream(filename, density=1, zInd=0, useColour=True, aspect='equal',
 
     Note, matplotlibs streamplot may raise an exception if the field is entriely 0 valued.
     """
-    d = NDData(filename, symmetry, transpose)
-    if d.nDim == 2:
-        cx = _np.unique(d.x)
-        cy = _np.unique(d.y)
-        fx = d.fx.reshape(len(cy), len(cx))
-        fy = d.fy.reshape(len(cy), len(cx))
-    elif d.nDim == 3:
-        # with the 3D data, we need to select a slice in Z (does not seem to work yet)
-        cx = d[0,:,zInd,0]
-        cy = d[:,0,zInd,1]
-        fx = d[:,:,zInd,3]
-        fy = d[:,:,zInd,4]
+    fm = _GetField(filename)
+    if fm.nDimensions == 2:
+        d = TwoDData(fm, symmetry, transpose)
+    elif fm.nDimensions == 3:
+        # with the 3D data, we only use a slice in Z
+        d = ThreeDData(fm, symmetry, transpose, sliceAt={'z' : zInd})
     else:
         raise ValueError("Currently only 2D and 3D field maps supported.")
+    cx = d.Axis('x')
+    cy = d.Axis('y')
+    fx = d.fx.reshape(len(cy), len(cx))
+    fy = d.fy.reshape(len(cy), len(cx))
 
     # modern matplotlib's streamplot has a very strict check on the spacing
     # of points being equal, which they're meant. However, it is too strict
@@ -356,7 +469,7 @@ def Plot2DXYStream(filename, density=1, zInd=0, useColour=True, aspect='equal',
     mag = _np.sqrt(fx**2 + fy**2)
     if useColour:
         norm = _mpl.colors.Normalize(vmin=vmin, vmax=vmax)
-        cmap = _mpl.colors.ListedColormap(_plt.cm.get_cmap(cmap)(_np.linspace(0, 1, 256)))
+        cmap = _mpl.colors.ListedColormap(_mpl.colormaps.get_cmap(cmap)(_np.linspace(0, 1, 256)))
         _plt.streamplot(cx, cy, fx, fy, color=mag, cmap=cmap, norm=norm, density=density)
     else:
         lw = 5*mag / mag.max()
@@ -407,7 +520,7 @@ def Plot2DXZStream(filename, density=1, yIndexIf3D=0, useColour=True, aspect='eq
     if useColour:
         mag = _np.sqrt(fx**2 + fz**2)
         norm = _mpl.colors.Normalize(vmin=vmin, vmax=vmax)
-        cmap = _mpl.colors.ListedColormap(_plt.cm.get_cmap(cmap)(_np.linspace(0, 1, 256)))
+        cmap = _mpl.colors.ListedColormap(_mpl.colormaps.get_cmap(cmap)(_np.linspace(0, 1, 256)))
         _plt.streamplot(cx, cz, fx, fz, color=mag, cmap=cmap, norm=norm, density=density)
     else:
         _plt.streamplot(cx, cz, fx, fz, density=density)
@@ -560,22 +673,24 @@ def Plot2DXYFxFyFz(filename, title=None, aspect="auto", extent=None, symmetry='n
     if title:
         _plt.suptitle(title, size='x-large')
 
-def Plot3DXY(filename, scale=None, title=None, flipX=False, flipY=False, aspect='equal', cmap='magma', symmetry="none", transpose=False, vmin=None, vmax=None):
+def Plot3DXY(filename, scale=None, title=None, flipX=False, flipY=False, aspect='equal', cmap='magma', symmetry="none", transpose=False, vmin=None, vmax=None, zIndex=None):
     """
-    Plots (B_x,B_y) as a function of x and y.
+    Plots (B_x,B_y) as a function of x and y. If zIndex is given, only
+    that slice in z is plotted, otherwise all points are.
     """
-    d = ThreeDData(filename, symmetry, transpose)
+    d = ThreeDData(filename, symmetry, transpose, sliceAt=None if zIndex is None else {'z' : zIndex})
     _plt.figure()
     _plt.quiver(d.x,d.y,d.fx,d.fy,d.mag,cmap=_mpl.colormaps.get_cmap(cmap),pivot='mid',scale=scale, vmin=vmin, vmax=vmax)
     if title:
         _plt.title(title)
     _Niceties('X (cm)', 'Y (cm)', zlabel="|$B_{x,y}$| (T)", flipX=flipX, aspect=aspect)
 
-def Plot3DXZ(filename, scale=None, title=None, flipX=False, flipZ=False, aspect='equal', cmap='magma', symmetry="none", transpose=False, vmin=None, vmax=None):
+def Plot3DXZ(filename, scale=None, title=None, flipX=False, flipZ=False, aspect='equal', cmap='magma', symmetry="none", transpose=False, vmin=None, vmax=None, yIndex=None):
     """
-    Plots (B_x,B_z) as a function of x and z.
+    Plots (B_x,B_z) as a function of x and z. If yIndex is given, only
+    that slice in y is plotted, otherwise all points are.
     """
-    d = ThreeDData(filename, symmetry, transpose)
+    d = ThreeDData(filename, symmetry, transpose, sliceAt=None if yIndex is None else {'y' : yIndex})
     _plt.figure()
     _plt.quiver(d.x,d.z,d.fx,d.fz,d.mag,cmap=_mpl.colormaps.get_cmap(cmap),pivot='mid',scale=scale, vmin=vmin, vmax=vmax)
     if title:
@@ -1,8 +1,77 @@
+import concurrent.futures as _futures
 import gzip as _gzip
-import importlib_resources as _importlib_resources
+import json as _json
 import numpy as _np
+import struct as _struct
 import tarfile as _tarfile
 import os as _os
+import warnings as _warnings
+
+# the binary format is this, then one byte for the version, a little-endian
+# uint32 of the length of a JSON header then the raw array (64-byte aligned)
+_binaryMagic   = b"PYBDSIMFIELD"
+_binaryVersion = 1
+
+
+class _BlockWriter(object):
+    """
+    Write text to a file in large blocks. If the file name ends with ".gz" it
+    is gzip compressed with the given compression level (1-9).
+
+    If threaded, the compression and writing of each block is done in a
+    background thread while the next block is formatted. zlib and file writing
+    release the GIL so these overlap. The output is identical either way.
+    """
+    def __init__(self, fileName, compressionLevel=6, threaded=True):
+        if fileName.endswith(".gz"):
+            self._f = _gzip.open(fileName, 'wb', compresslevel=compressionLevel)
+        else:
+            self._f = open(fileName, 'wb')
+        self._executor = _futures.ThreadPoolExecutor(max_workers=1) if threaded else None
+        self._pending  = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, text):
+        data = text.encode('ascii')
+        if self._executor:
+            self._Wait() # only one block in flight to limit the memory used
+            self._pending = self._executor.submit(self._f.write, data)
+        else:
+            self._f.write(data)
+
+    def _Wait(self):
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def WriteArray(self, array, rowFormat, valuesPerRow=None, blockSize=2**20):
+        """
+        Write all the values of array with a %-style rowFormat (including the
+        newline) that consumes valuesPerRow values (default the size of the
+        last dimension of array). Each block of rows is formatted with a single
+        % operation, which is much faster than formatting each value.
+        """
+        values = _np.asarray(array).reshape(-1)
+        if valuesPerRow is None:
+            valuesPerRow = _np.shape(array)[-1]
+        rowsPerBlock = max(1, blockSize // valuesPerRow)
+        nRows = len(values) // valuesPerRow
+        for i in range(0, nRows, rowsPerBlock):
+            block = values[i*valuesPerRow : min(nRows, i + rowsPerBlock)*valuesPerRow].tolist()
+            self.write((rowFormat * (len(block) // valuesPerRow)) % tuple(block))
+
+    def close(self):
+        try:
+            self._Wait()
+        finally:
+            if self._executor:
+                self._executor.shutdown()
+            self._f.close()
 
 
 class Field(object):
@@ -52,12 +121,16 @@ class Field(object):
         """
         self.comments.append(str(commentString))
         
-    def Write(self, fileName, writeLoopOrderReversed=False, overrideLoopOrder=None):
+    def Write(self, fileName, writeLoopOrderReversed=False, overrideLoopOrder=None, compressionLevel=6, threaded=True):
         """
         :param writeLoopOrderReversed: Write this field map with the other loop order.
         :type writeLoopOrderReversed: bool
         :param overrideLoopOrder: string to write irrespective of internal data as the loop order.
         :type overrideLoopOrder: str
+        :param compressionLevel: gzip compression level from 1 (fastest) to 9 (smallest).
+        :type compressionLevel: int
+        :param threaded: compress and write in a separate thread while formatting the data.
+        :type threaded: bool
 
         gzip - if the file ends with ".gz" the file will be compressed automatically.
 
@@ -65,70 +138,89 @@ class Field(object):
         provided in case a field is prepared in the other order somehow and you
         want to control the writing of this header variable independently.
         """
-        compressed = fileName.endswith(".gz")
-        if compressed:
-            f = _gzip.open(fileName, 'wb')
-        else:
-            f = open(fileName, 'w')
+        if overrideLoopOrder and overrideLoopOrder not in ['xyzt', 'tzyx']:
+            raise ValueError("overrideLoopOrder must be one of 'xyzt', 'tzyx'")
+
+        with _BlockWriter(fileName, compressionLevel, threaded) as f:
+            lines = ["# units: cm, T\n"]
+            for comment in self.comments:
+                lines.append("# "+str(comment).strip()+"\n")
+            for key,value in self.header.items():
+                lines.append(str(key)+'> '+ str(value) + '\n')
+            if overrideLoopOrder:
+                lines.append("loopOrder> "+overrideLoopOrder+"\n")
+            else:
+                lo = 'tzyx' if writeLoopOrderReversed else 'xyzt'
+                lines.append("loopOrder> "+lo+"\n")
 
-        def write(fn, s):
-            if compressed:
-                fn.write(s.encode('ascii'))
+            if self.doublePrecision:
+                colStrings = ['%23s' % s for s in self.columns]
             else:
-                fn.write(s)
-        write(f, "# units: cm, T\n")
-        for comment in self.comments:
-            write(f, "# "+str(comment).strip()+"\n")
-        for key,value in self.header.items():
-            write(f, str(key)+'> '+ str(value) + '\n')
-        if overrideLoopOrder:
-            if overrideLoopOrder not in ['xyzt', 'tzyx']:
-                raise ValueError("overrideLoopOrder must be one of 'xyzt', 'tzyx'")
-            write(f, "loopOrder> "+overrideLoopOrder+"\n")
-        else:
-            lo = 'tzyx' if writeLoopOrderReversed else 'xyzt'
-            write(f, "loopOrder> "+lo+"\n")
+                colStrings = ['%14s' % s for s in self.columns]
+            colStrings[0] = colStrings[0].strip() # don't pad the first column title
+            # a '!' denotes the column header line
+            lines.append('! '+ '\t'.join(colStrings)+'\n')
+            f.write("".join(lines))
+
+            # flatten all but last dimension - 3 field components
+            nvalues = _np.shape(self.data)[-1] # number of values in last dimension
+
+            flipLocal = self.flip
+            if writeLoopOrderReversed:
+                flipLocal = not flipLocal
+
+            if not flipLocal:
+                # [x,y,z,t,values] -> [t,z,y,x,values] for 4D
+                # [x,y,z,values]   -> [z,y,x,values]   for 3D
+                # [x,y,values]     -> [y,x,values]     for 2D
+                # [x,values]       -> [x,values]       for 1D
+                inds = list(range(self.data.ndim))       # indices for dimension [0,1,2] etc
+                # keep the last value the same but reverse all indices before then
+                inds[:(self.data.ndim - 1)] = reversed(inds[:(self.data.ndim - 1)])
+                datal = _np.transpose(self.data, inds)
+            else:
+                datal = self.data
 
-        if self.doublePrecision:
-            colStrings = ['%23s' % s for s in self.columns]
-        else:
-            colStrings = ['%14s' % s for s in self.columns]
-        colStrings[0] = colStrings[0].strip() # don't pad the first column title
-        # a '!' denotes the column header line
-        write(f, '! '+ '\t'.join(colStrings)+'\n')
-        
-        # flatten all but last dimension - 3 field components
-        nvalues = _np.shape(self.data)[-1] # number of values in last dimension
+            valueFormat = '%23.16E' if self.doublePrecision else '%14.8E'
+            f.WriteArray(datal, '\t'.join([valueFormat]*nvalues) + '\n', nvalues)
 
-        flipLocal = self.flip
-        if writeLoopOrderReversed:
-            flipLocal = not flipLocal
-        
-        if not flipLocal:
-            # [x,y,z,t,values] -> [t,z,y,x,values] for 4D
-            # [x,y,z,values]   -> [z,y,x,values]   for 3D
-            # [x,y,values]     -> [y,x,values]     for 2D
-            # [x,values]       -> [x,values]       for 1D
-            if (self.data.ndim == 2):
-                pass # do nothin for 1D
-            inds = list(range(self.data.ndim))       # indices for dimension [0,1,2] etc
-            # keep the last value the same but reverse all indices before then
-            inds[:(self.data.ndim - 1)] = reversed(inds[:(self.data.ndim - 1)])
-            datal = _np.transpose(self.data, inds)
-        else:
-            datal = self.data
+    def WriteBinary(self, fileName, dtype=_np.float64):
+        """
+        :param fileName: name of file to write to.
+        :type fileName: str
+        :param dtype: numpy type to store the values as (e.g. numpy.float32 to halve the size).
+        :type dtype: numpy.dtype, str
 
-        datal = datal.reshape(-1,nvalues)
-        for value in datal:
-            if self.doublePrecision:
-                strings   = ['%.16E' % x for x in value]
-                stringsFW = ['%23s' % s for s in strings]
-            else:
-                strings   = ['%.8E' % x for x in value]
-                stringsFW = ['%14s' % s for s in strings]
-            write(f, '\t'.join(stringsFW) + '\n')
+        Write the field map in a compact binary format. This is a short header
+        followed by the raw little-endian array, so it can be loaded (memory-mapped)
+        almost instantly with Load or LoadBinary and only the parts of the array
+        that are used are read from disk.
 
-        f.close()
+        This format is only for pybdsim - BDSIM requires the ascii format from Write.
+        """
+        dtype = _np.dtype(dtype).newbyteorder('<')
+        meta = {"nDimensions"     : self.nDimensions,
+                "columns"         : list(self.columns),
+                "header"          : self.header,
+                "comments"        : self.comments,
+                "flip"            : bool(self.flip),
+                "doublePrecision" : bool(self.doublePrecision),
+                "dtype"           : dtype.str,
+                "shape"           : list(_np.shape(self.data))}
+        metaBytes = _json.dumps(meta, default=lambda v : v.item() if hasattr(v, "item") else str(v)).encode('utf-8')
+        headerLength = len(_binaryMagic) + 1 + 4 + len(metaBytes)
+        metaBytes += b' ' * (-headerLength % 64) # align the data
+
+        with open(fileName, 'wb') as f:
+            f.write(_binaryMagic)
+            f.write(bytes([_binaryVersion]))
+            f.write(_struct.pack('<I', len(metaBytes)))
+            f.write(metaBytes)
+            # write in blocks along the first dimension to limit the memory used for conversion
+            data = _np.asarray(self.data)
+            step = max(1, int(2**26 // max(1, data[:1].size)))
+            for i in range(0, len(data), step):
+                f.write(_np.ascontiguousarray(data[i:i + step], dtype=dtype).tobytes())
 
     def WriteFLUKA2DFormat1(self, fileName):
         """
@@ -139,23 +231,10 @@ class Field(object):
         if self.nDimensions != 2:
             raise ValueError("This field map is not 2D - it's ",self.nDimensions,"D")
 
-        f = open(fileName, "w")
-        
-        # flatten all but last dimension - 3 field components
-        nvalues = _np.shape(self.data)[-1] # number of values in last dimension
-
-        flipLocal = self.flip
-
-        dt = self.data.reshape(-1,nvalues)
-        for xi in range(self.header['nx']):
-            for yi in range(self.header['ny']):
-                v = self.data[xi][yi]
-                v = [v[index] for index in [0,1,2,3]] # [x,y,Bx,By]
-                strings   = ['%.7E' % x for x in v]
-                #stringsFW = ['%14s' % s for s in strings]
-                f.write(','.join(strings) + '\n')
-        
-        f.close()
+        # loop over x then y - [x,y,Bx,By] for each point
+        v = self.data[:int(self.header['nx']), :int(self.header['ny']), :4]
+        with _BlockWriter(fileName) as f:
+            f.WriteArray(v, ','.join(['%.7E']*4) + '\n', 4)
 
     def WriteMGNDataCard2D(self, fileName, name = 'magnet', symmetry = '0.0'):
         """
@@ -177,47 +256,24 @@ class Field(object):
         """
         if self.nDimensions != 2:
             raise ValueError("This field map is not 2D - it's ",self.nDimensions,"D")
-        f = open(fileName, 'w')
 
         numberOfDigits = 9
 
-        f.write('FREE\n')
-        f.write('MGNCREAT  , 200.0, , 0.0, 0.0, ' + symmetry + ', , ' + name + '\n')
-        f.write('MGNCREAT  , , , , ' + str(self.header['nx']) + ', ' + str(self.header['ny'])
-                + ', ,  &\n')
-        f.write('MGNCREAT  , ' +  str(self.header['xmin']) + ', ' + str(self.header['ymin'])
-                + ', , ' + str(self.header['xmax']) + ', ' + str(self.header['ymax']) + ',  , &&\n')
-        fieldPointCounter = 0 #Maximal 3 points per card
-        lineCounter = 0 #First card ends with name of mgncreat card, second one with & and then &&
-        line = 'MGNDATA   , '
-        for yi in range(self.header['ny']):
-            for xi in range(self.header['nx']):
-                line += str(round(self.data[xi][yi][2], numberOfDigits)) + ', ' + str(round(self.data[xi][yi][3], numberOfDigits)) + ', '
-                if fieldPointCounter == 2 and lineCounter == 0:
-                    line += ' ' + name + '\n'
-                    f.write(line)
-                    line = 'MGNDATA   , '
-                    lineCounter += 1
-                    fieldPointCounter = 0
-                elif fieldPointCounter == 2 and lineCounter == 1:
-                    line += '  &\n'
-                    f.write(line)
-                    line = 'MGNDATA   , '
-                    lineCounter += 1
-                    fieldPointCounter = 0
-                elif fieldPointCounter == 2 and lineCounter > 1:
-                    line += '  &&\n'
-                    f.write(line)
-                    line = 'MGNDATA   , '
-                    fieldPointCounter = 0
-                elif fieldPointCounter < 2:
-                    fieldPointCounter += 1
-
-        if fieldPointCounter != 0:
-            line += ', , ' * (3 - fieldPointCounter) + '  &&\nFIXED'
-            f.write(line)
-        else:
-            f.write('FIXED')
+        # loop over x first, then y - [Bx,By] for each point
+        nx, ny = int(self.header['nx']), int(self.header['ny'])
+        values = self.data[:nx, :ny, 2:4].transpose(1, 0, 2).reshape(-1).tolist()
+        values = _np.array([round(v, numberOfDigits) for v in values], dtype=object)
+        with _BlockWriter(fileName) as f:
+            f.write('FREE\n')
+            f.write('MGNCREAT  , 200.0, , 0.0, 0.0, ' + symmetry + ', , ' + name + '\n')
+            f.write('MGNCREAT  , , , , ' + str(self.header['nx']) + ', ' + str(self.header['ny'])
+                    + ', ,  &\n')
+            f.write('MGNCREAT  , ' +  str(self.header['xmin']) + ', ' + str(self.header['ymin'])
+                    + ', , ' + str(self.header['xmax']) + ', ' + str(self.header['ymax']) + ',  , &&\n')
+            # maximal 3 points per card - the first card ends with the name of the mgncreat card,
+            # the second one with & and then &&
+            self._WriteCards(f, values, 'MGNDATA   , ', '%r, ', 3, 2, [' ' + name, '  &', '  &&'],
+                             ', , ', '  &&\nFIXED', 'FIXED')
 
     def WriteMGNDataCard3D(self, fileName, name = 'magnet'):
         """
@@ -239,51 +295,46 @@ class Field(object):
         """
         if self.nDimensions != 3:
             raise ValueError("This field map is not 3D - it's ",self.nDimensions,"D")
-        f = open(fileName, 'w')
 
-        numberOfDigits = 9
-
-        f.write('FREE\n')
-        f.write('MGNCREAT, 300.0, , 0.0, 0.0, 0.0, , ' + name + '\n')
-        f.write('MGNCREAT, , , , ' + str(self.header['nx']) + ', ' + str(self.header['ny'])
-                + ', ' + str(self.header['nz']) + ', &\n')
-        f.write('MGNCREAT, ' +  str(self.header['xmin']) + ', ' + str(self.header['ymin'])
-                + ', ' + str(self.header['zmin']) + ', ' + str(self.header['xmax']) + ', ' + str(self.header['ymax'])
-                + ', ' + str(self.header['zmax']) + ', &&\n')
-        fieldPointCounter = 0 #Maximal 2 points per card
-        lineCounter = 0 #First card ends with name of mgncreat card, second one with & and then &&
-        line = 'MGNDATA, '
-        for zi in range(self.header['nz']):
-            for yi in range(self.header['ny']):
-                for xi in range(self.header['nx']):
-                    line += ("{0:.4e}".format(self.data[xi][yi][zi][3]) + ', '
-                             + "{0:.4e}".format(self.data[xi][yi][zi][4]) + ', '
-                             + "{0:.4e}".format(self.data[xi][yi][zi][5]) + ', ')
-                    if fieldPointCounter == 1 and lineCounter == 0:
-                        line += ' ' + name + '\n'
-                        f.write(line)
-                        line = 'MGNDATA, '
-                        lineCounter += 1
-                        fieldPointCounter = 0
-                    elif fieldPointCounter == 1 and lineCounter == 1:
-                        line += '&\n'
-                        f.write(line)
-                        line = 'MGNDATA, '
-                        lineCounter += 1
-                        fieldPointCounter = 0
-                    elif fieldPointCounter == 1 and lineCounter > 1:
-                        line += '&&\n'
-                        f.write(line)
-                        line = 'MGNDATA, '
-                        fieldPointCounter = 0
-                    elif fieldPointCounter < 1:
-                        fieldPointCounter += 1
-
-        if fieldPointCounter != 0:
-            line += ', , , ' * (2 - fieldPointCounter) + '&&'#\nFIXED'
-            f.write(line)
-        #else:
-        #    f.write('FIXED')
+        # loop over x first, then y, then z - [Bx,By,Bz] for each point
+        nx, ny, nz = int(self.header['nx']), int(self.header['ny']), int(self.header['nz'])
+        values = self.data[:nx, :ny, :nz, 3:6].transpose(2, 1, 0, 3)
+        with _BlockWriter(fileName) as f:
+            f.write('FREE\n')
+            f.write('MGNCREAT, 300.0, , 0.0, 0.0, 0.0, , ' + name + '\n')
+            f.write('MGNCREAT, , , , ' + str(self.header['nx']) + ', ' + str(self.header['ny'])
+                    + ', ' + str(self.header['nz']) + ', &\n')
+            f.write('MGNCREAT, ' +  str(self.header['xmin']) + ', ' + str(self.header['ymin'])
+                    + ', ' + str(self.header['zmin']) + ', ' + str(self.header['xmax']) + ', ' + str(self.header['ymax'])
+                    + ', ' + str(self.header['zmax']) + ', &&\n')
+            # maximal 2 points per card - the first card ends with the name of the mgncreat card,
+            # the second one with & and then &&
+            self._WriteCards(f, values, 'MGNDATA, ', '%.4e, ', 2, 3, [' ' + name, '&', '&&'],
+                             ', , , ', '&&', '')
+
+    @staticmethod
+    def _WriteCards(f, values, prefix, valueFormat, pointsPerCard, valuesPerPoint, endings,
+                    padding, lastEnding, endingIfComplete):
+        """
+        Write MGNDATA cards with pointsPerCard points on each. The cards end with
+        endings[0], then endings[1] then endings[2] for all the rest. An incomplete
+        last card is padded with padding per missing point and ends with lastEnding.
+        If the last card is complete, endingIfComplete is written instead.
+        """
+        values = _np.asarray(values).reshape(-1)
+        valuesPerCard = pointsPerCard * valuesPerPoint
+        nCards = len(values) // valuesPerCard
+        cardFormat = prefix + valueFormat * valuesPerCard
+        for i in range(min(nCards, 2)):
+            f.write(cardFormat % tuple(values[i*valuesPerCard:(i+1)*valuesPerCard].tolist()) + endings[i] + '\n')
+        if nCards > 2:
+            f.WriteArray(values[2*valuesPerCard:nCards*valuesPerCard], cardFormat + endings[2] + '\n', valuesPerCard)
+        nLeft = (len(values) // valuesPerPoint) % pointsPerCard
+        if nLeft != 0:
+            left = values[nCards*valuesPerCard:].tolist()
+            f.write(prefix + (valueFormat * len(left)) % tuple(left) + padding * (pointsPerCard - nLeft) + lastEnding)
+        else:
+            f.write(endingIfComplete)
 
 class Field1D(Field):
     """
@@ -442,48 +493,37 @@ class Field4D(Field):
         self.nDimensions = 4
 
 
-def Load(filename, debug=False):
+def _OpenFieldFile(filename, debug=False):
     """
-    :param filename: name of file to load
-    :type filename: str
-    
-    Load a BDSIM field format file into a numpy array. Can either
-    be a regular ascii text file or can be a compressed file ending
-    in ".tar.gz".
-
-    returns a numpy array with the corresponding number of dimensions
-    and the dimension has the coordinates and fx,fy,fz.
+    Open a field map file in binary mode. It can be a regular ascii text file,
+    a gzipped file or the first member of a ".tar.gz" file.
     """
-    gzippedFile = False
     if (filename.endswith('.tar.gz')):
         if debug:
             print('Field Loader> loading compressed file ' + filename)
         tar = _tarfile.open(filename,'r')
-        f = tar.extractfile(tar.firstmember)
+        return tar.extractfile(tar.firstmember)
     elif '.gz' in filename:
-        f = _gzip.open(filename)
-        gzippedFile = True
+        return _gzip.open(filename, 'rb')
     else:
         if debug:
             print('Field Loader> loading file ' + filename)
-        f = open(filename)
+        return open(filename, 'rb')
 
-    intoData = False
+def _ReadFieldHeader(f):
+    """
+    Read the header of a BDSIM field map file up to and including the column
+    line (beginning with '!'). Returns header (dict), columns and comments.
+    """
     header   = {}
     columns  = []
-    data     = []
     comments = []
-    
-    for line in f:
-        if gzippedFile:
-            line = line.decode('utf-8')
-        if intoData:
-            ls = line.strip()
-            # avoid empty lines
-            if ls.isspace() or len(ls) == 0:
-                continue
-            data.append(line.strip().split())
-        elif '>' in line:
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        line = line.decode('utf-8')
+        if '>' in line:
             d = line.strip().split('>')
             k = d[0].strip()
             try:
@@ -493,13 +533,173 @@ def Load(filename, debug=False):
             header[k] = v
         elif '!' in line:
             columns = line.strip('!').strip().split()
-            intoData = True
+            break
         elif line.lstrip().startswith('#'):
             comments.append(line.lstrip()[1:])
+    return header, columns, comments
+
+def _ReadFieldBody(f, size=None, chunkSize=2**26):
+    """
+    Parse the remaining whitespace separated numbers in file f into a 1D array.
+    The text is read and converted in large chunks in C. If the total number of
+    values (size) is known, they are written directly into an array of that size,
+    so no more memory than the final array (plus one chunk) is used.
+    """
+    if size is not None:
+        result = _np.empty(size, dtype=float)
+    else:
+        parts = []
+    n = 0
+    remainder = b''
+    with _warnings.catch_warnings():
+        # numpy only warns if it can't parse a value - make this an error
+        _warnings.simplefilter('error', DeprecationWarning)
+        while True:
+            chunk = f.read(chunkSize)
+            if chunk:
+                chunk = remainder + chunk
+                iLastNewLine = chunk.rfind(b'\n')
+                if iLastNewLine < 0:
+                    remainder = chunk
+                    continue
+                remainder = chunk[iLastNewLine + 1:]
+                chunk = chunk[:iLastNewLine + 1]
+            else:
+                chunk, remainder = remainder, b''
+            if chunk.strip():
+                try:
+                    values = _np.fromstring(chunk.decode('ascii'), dtype=float, sep=' ')
+                except (DeprecationWarning, ValueError, UnicodeDecodeError):
+                    raise ValueError("Invalid value in field map data")
+                if size is not None:
+                    if n + len(values) > size:
+                        raise ValueError("More values in field map than expected from header")
+                    result[n:n + len(values)] = values
+                else:
+                    parts.append(values)
+                n += len(values)
+            if not chunk and not remainder:
+                break
+    if size is not None:
+        if n != size:
+            raise ValueError("Expected " + str(size) + " values in field map but found " + str(n))
+        return result
+    return _np.concatenate(parts) if parts else _np.array([])
+
+def _IsBinaryField(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(_binaryMagic)) == _binaryMagic
+    except OSError:
+        return False
+
+def LoadBinary(filename, mmap=True):
+    """
+    :param filename: name of file written by Field.WriteBinary to load.
+    :type filename: str
+    :param mmap: whether to memory-map the data rather than read it all.
+    :type mmap: bool
+
+    Load a field map written in the pybdsim binary format. By default the data is
+    memory-mapped, so this is almost instant and only the parts of the array that
+    are used (e.g. one slice) are read from disk. The array is copy-on-write, so it
+    can be modified (e.g. scaled) in memory without changing the file.
+
+    Returns an instance of Field1D, Field2D, Field3D or Field4D.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(_binaryMagic)) != _binaryMagic:
+            raise ValueError("\"" + filename + "\" is not a pybdsim binary field map")
+        version = f.read(1)[0]
+        if version > _binaryVersion:
+            raise ValueError("Binary field map version " + str(version) + " is newer than this version of pybdsim supports")
+        metaLength = _struct.unpack('<I', f.read(4))[0]
+        meta = _json.loads(f.read(metaLength).decode('utf-8'))
+        offset = f.tell()
+
+    shape = tuple(meta['shape'])
+    if mmap:
+        data = _np.memmap(filename, dtype=meta['dtype'], mode='c', offset=offset, shape=shape)
+    else:
+        data = _np.fromfile(filename, dtype=meta['dtype'], count=int(_np.prod(shape)), offset=offset).reshape(shape)
+
+    # build the object directly from the stored header so the data isn't touched
+    nDim = meta['nDimensions']
+    fieldClass = {1 : Field1D, 2 : Field2D, 3 : Field3D, 4 : Field4D}[nDim]
+    fd = fieldClass.__new__(fieldClass)
+    Field.__init__(fd, data, meta['columns'], meta['flip'], meta['doublePrecision'])
+    fd.header      = meta['header']
+    fd.comments    = meta['comments']
+    fd.nDimensions = nDim
+    return fd
+
+def ConvertToBinary(inputFileName, outputFileName=None, dtype=_np.float64):
+    """
+    :param inputFileName: BDSIM format field map (ascii, .gz or .tar.gz).
+    :type inputFileName: str
+    :param outputFileName: name of binary file to write. Default is the input name with ".bin".
+    :type outputFileName: str, None
+    :param dtype: numpy type to store the values as.
+    :type dtype: numpy.dtype, str
+
+    Convert a BDSIM format field map to the pybdsim binary format (see Field.WriteBinary).
+    Returns the output file name. This can also be used from the command line: ::
+
+      python -m pybdsim.Field inputFieldMap.dat.gz [outputFieldMap.bin] [float32]
+    """
+    if outputFileName is None:
+        base = inputFileName
+        for ext in ['.tar.gz', '.gz']:
+            if base.endswith(ext):
+                base = base[:-len(ext)]
+                break
+        outputFileName = _os.path.splitext(base)[0] + ".bin"
+    fd = Load(inputFileName)
+    if fd is None:
+        raise ValueError("Could not load field map \"" + inputFileName + "\"")
+    fd.WriteBinary(outputFileName, dtype)
+    return outputFileName
 
-    f.close()
+def Load(filename, debug=False):
+    """
+    :param filename: name of file to load
+    :type filename: str
     
-    data = _np.array(data, dtype=float)
+    Load a BDSIM field format file into a numpy array. Can either
+    be a regular ascii text file or can be a compressed file ending
+    in ".gz" or ".tar.gz".
+
+    returns a numpy array with the corresponding number of dimensions
+    and the dimension has the coordinates and fx,fy,fz.
+
+    The header is parsed in Python and the numerical data in large chunks
+    in C directly into an array of the size given by the header.
+
+    A file in the pybdsim binary format (see Field.WriteBinary) is detected
+    automatically and memory-mapped with LoadBinary.
+    """
+    if _IsBinaryField(filename):
+        return LoadBinary(filename)
+
+    f = _OpenFieldFile(filename, debug)
+    try:
+        header, columns, comments = _ReadFieldHeader(f)
+
+        # the expected size is only known if there are all the n keys for the columns
+        dimToNVariable = {'x' : 'nx',
+                          'y' : 'ny',
+                          'z' : 'nz',
+                          't' : 'nt'}
+        size = None
+        try:
+            dims = [int(header[dimToNVariable[k.lower()]]) for k in columns[:-3]]
+            if len(columns) > 3:
+                size = int(_np.prod(dims)) * len(columns)
+        except (KeyError, ValueError, TypeError):
+            pass
+        data = _ReadFieldBody(f, size)
+    finally:
+        f.close()
 
     normalLoopOrder = ['x','y','z','t']
     # this is convention - in the case of xyzt, bdsim loops
@@ -530,10 +730,6 @@ def Load(filename, debug=False):
             print(header)
         return
     else:
-        dimToNVariable = {'x' : 'nx',
-                          'y' : 'ny',
-                          'z' : 'nz',
-                          't' : 'nt'}
         if debug:
             print("Columns: ", columns)
             print("Header: ", header)
@@ -670,70 +866,107 @@ for key in _Symmetries.keys():
     for sym in _Symmetries[key]:
         _Symmetries2D[key].append(sym[:2]+sym[4:])
 
+# create _Symmetries3D from _Symmetries where index 3 is removed
+_Symmetries3D = {}
+for key in _Symmetries.keys():
+    _Symmetries3D[key] = []
+    for sym in _Symmetries[key]:
+        _Symmetries3D[key].append(sym[:3]+sym[4:])
+
+
+def _SortUnorderedFieldMap(field, nDim, symmetries, symmetry="none", transpose=False):
+    """
+    Return an array of shape (n1,n2,...,values) with the points of the field
+    map sorted into a regular grid, after applying the symmetries and removing
+    duplicate points. This uses a lexicographic sort so it's O(N log N).
+    """
+    names = [c.lower() for c in field.columns[:nDim]]
+    for sym in symmetry.split():
+        if sym not in symmetries:
+            raise ValueError("Symmetry "+sym+" not recognised. Options are: "+str(symmetries.keys()))
+        transforms = symmetries[sym]
+        if len(transforms) < 2:
+            continue # only reflections add points
+        for i, name in enumerate(names):
+            reflected = any(t[i] == -1 for t in transforms)
+            if reflected and field.header.get(name+'min', 0) < 0 and field.header.get(name+'max', 0) > 0:
+                print("Warning: Field map has positive and negative "+name+" values. The symmetry may not be applied correctly and might lead to unexpected results. Please ensure the field map is symmetric around "+name+"=0.")
+
+    nValues = field.data.shape[-1]
+    data = _np.asarray(field.data).reshape(-1, nValues)
+    # apply each symmetry in turn - each transform gives a copy of all of the points
+    for sym in symmetry.split():
+        factors = _np.array(symmetries[sym])
+        data = (factors[:, _np.newaxis, :] * data[_np.newaxis, :, :]).reshape(-1, nValues)
+
+    # transpose the data if required
+    if transpose:
+        data = data.copy()
+        # switch the first two coordinate columns and the fx and fy columns
+        data[:,[0,1]] = data[:,[1,0]]
+        data[:,[-3,-2]] = data[:,[-2,-3]]
+
+    # sort by the coordinates (first column slowest) then the values
+    order = _np.lexsort(data.T[::-1])
+    data = data[order]
+    # keep the first point at each position - this removes duplicates
+    coords = data[:, :nDim]
+    newPoint = _np.ones(len(data), dtype=bool)
+    newPoint[1:] = _np.any(coords[1:] != coords[:-1], axis=1)
+    data = data[newPoint]
+
+    shape = [len(_np.unique(data[:, i])) for i in range(nDim)]
+    if int(_np.prod(shape)) != len(data):
+        raise ValueError("The points do not form a complete regular grid: " + " x ".join(map(str, shape))
+                         + " coordinates but " + str(len(data)) + " distinct points")
+    return data.reshape(*shape, nValues)
+
 
 def SortUnorderedFieldMap2D(field, symmetry="none", transpose=False):
     """
     Rearrange the data in a 2D field map to be in a linearly
-    progressing loop of (x,y). In future this could be generalised
-    to more dimensions and also any two dimensions, not just x,y.
-    The symmetry option allows the field to be expanded to include
-    the symmetries of the field.
+    progressing loop of (x,y). The symmetry option allows the field
+    to be expanded to include the symmetries of the field.
 
     :param field: Incoming jumbled field map
     :type  field: pybdsim.Field.Field2D
-    :param symmetry: Symmetry to apply to the field
+    :param symmetry: Symmetry to apply to the field (or several separated by spaces)
     :type  symmetry: str
+    :param transpose: Swap x and y (and fx and fy)
+    :type  transpose: bool
+
+    Duplicate points are removed and a ValueError is raised if the points
+    don't form a complete grid. Returns a new Field2D.
     """
-    for sym in symmetry.split():
-        if sym in _Symmetries2D.keys():
-            if sym in ['reflectx', 'reflectxydipole', 'reflectxyquadrupole']:
-                if (field.header['xmin'] < 0 and field.header['xmax'] > 0):
-                    print("Warning: Field map has positive and negative x values. The symmetry may not be applied correctly and might lead to unexpected results. Please ensure the field map is symmetric around x=0.")
-            if sym in ['reflecty', 'reflectxydipole', 'reflectxyquadrupole', 'reflectxzdipole', 'reflectxzsolendoid']:
-                if (field.header['ymin'] < 0 and field.header['ymax'] > 0):
-                    print("Warning: Field map has positive and negative y values. The symmetry may not be applied correctly and might lead to unexpected results. Please ensure the field map is symmetric around y=0.")
-        else:
-            raise ValueError("Symmetry "+sym+" not recognised. Options are: "+str(_Symmetries2D.keys()))
-    
-    data2D = field.data.reshape(-1, field.data.shape[-1])
-    for sym in symmetry.split():
-        # convert the data to a 2D array
-        data2D_original = _np.copy(data2D)
-        # create an empty array to store the new data
-        data2D = _np.empty((0, field.data.shape[-1]))
-        # apply the symmetry
-        for trans in _Symmetries2D[sym]:
-            symData = _np.copy(data2D_original)
-            for i in range(len(trans)):
-                if trans[i] == -1:
-                    symData[:,i] *= -1
-            data2D = _np.concatenate((data2D, symData))
-    # remove duplicates
-    data2D = _np.unique(data2D, axis=0)
-    # transpose the data if required
-    if transpose:
-        # switch the x and y columns with indices 0 and 1
-        data2D[:,[0,1]] = data2D[:,[1,0]]
-        # switch the fx and fy columns with indices -3 and -2
-        data2D[:,[-3,-2]] = data2D[:,[-2,-3]]
-    # prepare the data for the field object
-    fieldmap = []
-    for xi in _np.unique(data2D[:,0]):
-        v = []
-        for yi in _np.unique(data2D[:,1]):
-            # find the row in data2D that corresponds to xi,yi
-            row = data2D[(data2D[:,0] == xi) & (data2D[:,1] == yi)]
-            v.append([row[0,0], row[0,1], row[0,2], row[0,3], row[0,4]])
-        fieldmap.append(v)
-    fieldmap = _np.array(fieldmap)
-    # construct a BDSIM format field object and write it out
-    field_new = Field2D(fieldmap)
-    with _importlib_resources.as_file(_importlib_resources.files("pybdsim") / "testfield2D.dat") as testfile:
-        field_new.Write(testfile)
-        field_new = Load(testfile)
-        _os.remove(testfile)
+    data = _SortUnorderedFieldMap(field, 2, _Symmetries2D, symmetry, transpose)
+    field_new = Field2D(data, doublePrecision=field.doublePrecision,
+                        firstColumn=field.columns[0], secondColumn=field.columns[1])
+    field_new.comments = list(field.comments)
     return field_new
-    
+
+
+def SortUnorderedFieldMap3D(field, symmetry="none", transpose=False):
+    """
+    Rearrange the data in a 3D field map to be in a linearly
+    progressing loop of (x,y,z). The symmetry option allows the field
+    to be expanded to include the symmetries of the field.
+
+    :param field: Incoming jumbled field map
+    :type  field: pybdsim.Field.Field3D
+    :param symmetry: Symmetry to apply to the field (or several separated by spaces)
+    :type  symmetry: str
+    :param transpose: Swap x and y (and fx and fy)
+    :type  transpose: bool
+
+    Duplicate points are removed and a ValueError is raised if the points
+    don't form a complete grid. Returns a new Field3D.
+    """
+    data = _SortUnorderedFieldMap(field, 3, _Symmetries3D, symmetry, transpose)
+    field_new = Field3D(data, doublePrecision=field.doublePrecision, firstColumn=field.columns[0],
+                        secondColumn=field.columns[1], thirdColumn=field.columns[2])
+    field_new.comments = list(field.comments)
+    return field_new
+
 def TransposeFieldMap2D(field):
     """
     Transpose the field map in x and y.
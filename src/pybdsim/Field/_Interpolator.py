@@ -0,0 +1,163 @@
+import itertools as _itertools
+import numpy as _np
+
+from ._Field import _Symmetries
+
+_interpolatorTypes = ["nearest", "linear", "linearmag", "cubic"]
+
+
+class Interpolator(object):
+    """
+    Evaluate a field map at arbitrary points in the same way as BDSIM's interpolators.
+
+    :param field: field map to interpolate.
+    :type field: pybdsim.Field.Field1D, Field2D, Field3D or Field4D
+    :param interpolator: one of 'nearest', 'linear', 'linearmag' or 'cubic' as in BDSIM (e.g. 'cubic3d' is also accepted).
+    :type interpolator: str
+    :param symmetry: symmetry (or several separated by spaces) of the field, e.g. 'reflectxydipole'.
+    :type symmetry: str
+
+    >>> f = pybdsim.Field.Load("field.dat.gz")
+    >>> fi = pybdsim.Field.Interpolator(f, "cubic")
+    >>> b = fi(points) # points is an array of shape (N,nDimensions) -> b has shape (N,3)
+
+    The points are in the units and order of the coordinate columns of the field (e.g.
+    x,y,z in cm). The field is zero outside the map, as in BDSIM. All points are
+    evaluated at once with numpy, so millions of points can be evaluated quickly.
+
+    'linear' and 'cubic' (Catmull-Rom, as BDSIM) are interpolated in each dimension in turn;
+    'linearmag' is the linearly interpolated field scaled to the linearly interpolated
+    magnitude. At the edges of the map, the nearest points are repeated for cubic interpolation.
+
+    For a symmetry such as 'reflectx', points with negative x are reflected to the map and the
+    field components transformed as given in pybdsim.Field._Field._Symmetries. Single
+    transforms such as 'flipx' are applied to all points.
+
+    The grid is reconstructed from the coordinates of each point and the header (min, max and
+    number of points in each dimension), so the order of the data in the field object doesn't matter.
+    """
+    def __init__(self, field, interpolator="linear", symmetry="none"):
+        self.nDimensions = field.nDimensions
+        interpolator = interpolator.lower()
+        if interpolator[-2:] in ["1d", "2d", "3d", "4d"]:
+            if int(interpolator[-2]) != self.nDimensions:
+                raise ValueError("Interpolator \"" + interpolator + "\" does not match the "
+                                 + str(self.nDimensions) + "D field")
+            interpolator = interpolator[:-2]
+        if interpolator not in _interpolatorTypes:
+            raise ValueError("Unknown interpolator \"" + interpolator + "\" - options are: " + str(_interpolatorTypes))
+        self.interpolator = interpolator
+
+        self.axes = [c.lower() for c in field.columns[:self.nDimensions]]
+        h = field.header
+        self.mins  = _np.array([float(h[a + 'min']) for a in self.axes])
+        self.maxs  = _np.array([float(h[a + 'max']) for a in self.axes])
+        self.shape = tuple(int(h['n' + a]) for a in self.axes)
+        n = _np.array(self.shape)
+        self.steps = _np.where(n > 1, (self.maxs - self.mins) / _np.maximum(n - 1, 1), 1.0)
+        # strides in the flat array of values for each dimension
+        self.strides = _np.array([int(_np.prod(self.shape[i+1:])) for i in range(self.nDimensions)])
+
+        # put the values in a flat array in a regular grid using the coordinates of each point
+        data = _np.asarray(field.data).reshape(-1, _np.shape(field.data)[-1])
+        indices = _np.rint((data[:, :self.nDimensions] - self.mins) / self.steps).astype(_np.int64)
+        indices = _np.clip(indices, 0, n - 1)
+        self.values = _np.zeros((int(_np.prod(self.shape)), 3))
+        self.values[indices @ self.strides] = data[:, -3:]
+        if self.interpolator == "linearmag":
+            self.magnitudes = _np.linalg.norm(self.values, axis=1)[:, _np.newaxis]
+
+        self._symmetries = []
+        for sym in symmetry.split():
+            if sym not in _Symmetries:
+                raise ValueError("Symmetry " + sym + " not recognised. Options are: " + str(_Symmetries.keys()))
+            transforms = _np.array(_Symmetries[sym])
+            # the coordinate factors for the dimensions of this field and the field factors
+            coordinateFactors = transforms[:, ["xyzt".index(a) if a in "xyzt" else 0 for a in self.axes]]
+            self._symmetries.append((coordinateFactors, transforms[:, 4:]))
+
+    def __call__(self, points):
+        return self.Evaluate(points)
+
+    def Evaluate(self, points):
+        """
+        :param points: coordinates of shape (N,nDimensions) (or (N,) for a 1D field).
+        :type points: numpy.array
+
+        Returns the field at each point as an array of shape (N,3).
+        """
+        points = _np.array(points, dtype=float).reshape(-1, self.nDimensions)
+        factors = _np.ones((len(points), 3))
+        for coordinateFactors, fieldFactors in self._symmetries:
+            if len(coordinateFactors) == 1:
+                points *= coordinateFactors[0]
+                factors *= fieldFactors[0]
+                continue
+            reflected = _np.any(coordinateFactors == -1, axis=0)
+            negative = points < 0
+            for cf, ff in zip(coordinateFactors[1:], fieldFactors[1:]):
+                match = _np.all((negative == (cf == -1)) | ~reflected, axis=1)
+                points[match] *= cf
+                factors[match] *= ff
+
+        u = (points - self.mins) / self.steps
+        inside = _np.all((u >= -1e-9) & (u <= _np.array(self.shape) - 1 + 1e-9), axis=1)
+        u = _np.clip(u, 0, _np.array(self.shape) - 1)
+
+        if self.interpolator == "nearest":
+            result = self.values[_np.rint(u).astype(_np.int64) @ self.strides]
+        elif self.interpolator == "linear":
+            result = self._Linear(u, self.values)
+        elif self.interpolator == "linearmag":
+            result = self._Linear(u, self.values)
+            magnitude = self._Linear(u, self.magnitudes)
+            norm = _np.linalg.norm(result, axis=1)[:, _np.newaxis]
+            result = _np.divide(result * magnitude, norm, out=_np.zeros_like(result), where=norm > 0)
+        else:
+            result = self._Cubic(u, self.values)
+
+        result *= factors
+        result[~inside] = 0
+        return result
+
+    def _Base(self, u):
+        n = _np.array(self.shape)
+        i0 = _np.clip(_np.floor(u).astype(_np.int64), 0, _np.maximum(n - 2, 0))
+        return i0, u - i0
+
+    def _Linear(self, u, values):
+        i0, t = self._Base(u)
+        # per dimension, the weights and flat index offsets of the two neighbouring points
+        weights = [(1 - t[:, d], t[:, d]) for d in range(self.nDimensions)]
+        offsets = [(i0[:, d] * self.strides[d], (i0[:, d] + (self.shape[d] > 1)) * self.strides[d])
+                   for d in range(self.nDimensions)]
+        return self._Sum(values, weights, offsets)
+
+    def _Cubic(self, u, values):
+        i0, t = self._Base(u)
+        # Catmull-Rom weights for the points at offsets -1, 0, 1 and 2 in each dimension
+        weights, offsets = [], []
+        for d in range(self.nDimensions):
+            td = t[:, d]
+            weights.append((0.5*td*(-1 + td*(2 - td)),
+                            0.5*(2 + td*td*(-5 + 3*td)),
+                            0.5*td*(1 + td*(4 - 3*td)),
+                            0.5*td*td*(-1 + td)))
+            offsets.append(tuple(_np.clip(i0[:, d] + k, 0, self.shape[d] - 1) * self.strides[d] for k in (-1, 0, 1, 2)))
+        return self._Sum(values, weights, offsets)
+
+    @staticmethod
+    def _Sum(values, weights, offsets):
+        """
+        Sum the values at every combination of the neighbouring points in each
+        dimension multiplied by the product of their weights.
+        """
+        result = 0
+        for combination in _itertools.product(*[range(len(w)) for w in weights]):
+            w = weights[0][combination[0]]
+            flat = offsets[0][combination[0]]
+            for d in range(1, len(combination)):
+                w = w * weights[d][combination[d]]
+                flat = flat + offsets[d][combination[d]]
+            result = result + w[:, _np.newaxis] * values[flat]
+        return result
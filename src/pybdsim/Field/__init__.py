@@ -11,8 +11,13 @@ from ._Field import Field2D
 from ._Field import Field3D
 from ._Field import Field4D
 from ._Field import Load
+from ._Field import LoadBinary
+from ._Field import ConvertToBinary
 from ._Field import MirrorDipoleQuadrant1
 from ._Field import SortUnorderedFieldMap2D
+from ._Field import SortUnorderedFieldMap3D
+
+from ._Interpolator import Interpolator
 
 from .FieldPlotter import Plot1DFxFyFz
 from .FieldPlotter import Plot2D
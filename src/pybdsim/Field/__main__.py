@@ -0,0 +1,17 @@
+"""
+Convert a BDSIM format field map to the pybdsim binary format.
+
+python -m pybdsim.Field inputFieldMap.dat.gz [outputFieldMap.bin] [float32]
+"""
+import sys as _sys
+
+from ._Field import ConvertToBinary
+
+if __name__ == "__main__":
+    nargs = len(_sys.argv)
+    if (nargs < 2 or nargs > 4):
+        print("Error - Usage: python -m pybdsim.Field inputfile [outputfile] [float32|float64]")
+        _sys.exit(1)
+    outputFileName = _sys.argv[2] if nargs > 2 else None
+    dtype = _sys.argv[3] if nargs > 3 else "float64"
+    print(ConvertToBinary(_sys.argv[1], outputFileName, dtype))
@@ -1938,7 +1938,12 @@ def Trajectory3D(rootFileName, eventNumber=0, bottomLeft=None, topRight=None):
     bottomLeft and topRight are optional [xlow,xhigh] limits for plots.
     """
     rootFile = _Data.Load(rootFileName)
-    trajData = _Data.TrajectoryData(rootFile, eventNumber)
+    header = rootFile.GetHeader()
+    rootFile.GetHeaderTree().GetEntry(0)
+    if header.header.dataVersion >= 5:
+        trajData = _Data.FlatTrajectoryData(rootFile, eventNumber, params=['x','y','z'])
+    else:
+        trajData = _Data.TrajectoryData(rootFile, eventNumber)
 
     f = _plt.figure()
     ax0 = f.add_subplot(121)
@@ -3,10 +3,12 @@ Utilities for running BDSIM and other tools from Python.
 
 """
 import glob as _glob
+import json as _json
 from multiprocessing import Pool as _Pool
 from multiprocessing import cpu_count as _cpu_count
 import numpy as _np
 import os as _os
+import shutil as _shutil
 import subprocess as _subprocess
 import uuid as _uuid
 import time as _time
@@ -163,6 +165,306 @@ class Study(object):
             self.outputsizes.append(0)
 
 
+class Job(object):
+    """
+    One command run by a JobScheduler.
+
+    :param args: command and its arguments, e.g. ["bdsim", "--file=model.gmad", ...]
+    :type args: list(str)
+    :param outputs: files the command should make - the job fails if any is missing.
+    :type outputs: list(str)
+    :param name: unique name of the job in the scheduler. Default is the first output.
+    :type name: None, str
+
+    The status is one of 'pending', 'running', 'done' or 'failed'. The exit code,
+    wall time in s, total size of the outputs in bytes and the number of attempts
+    are recorded. Outputs deleted with JobScheduler.RemoveOutputs are moved to removed.
+    """
+    _attributes = ['name', 'args', 'outputs', 'removed', 'status', 'exitCode', 'wallTime', 'outputSize', 'attempts']
+
+    def __init__(self, args, outputs=None, name=None):
+        self.args       = [str(a) for a in args]
+        self.outputs    = list(outputs) if outputs else []
+        self.name       = name if name is not None else (self.outputs[0] if self.outputs else " ".join(self.args))
+        self.status     = 'pending'
+        self.exitCode   = None
+        self.wallTime   = None
+        self.outputSize = None
+        self.attempts   = 0
+        self.removed    = []
+        self.onSuccess  = None
+        self.priority   = 0
+        self.persistent = True
+        self._process   = None
+        self._startTime = None
+
+    def __repr__(self):
+        return "Job(" + self.name + ", " + self.status + ")"
+
+    def ToDict(self):
+        return {k : getattr(self, k) for k in self._attributes}
+
+    @classmethod
+    def FromDict(cls, d):
+        job = cls(d['args'], d['outputs'], d['name'])
+        for k in cls._attributes:
+            if k in d:
+                setattr(job, k, d[k])
+        return job
+
+
+class JobScheduler(object):
+    """
+    Run a queue of jobs (e.g. bdsim with different seeds) on the local machine with
+    up to nCPUs at once, recording the status, exit code, wall time and output size
+    of each job, retrying failed ones and reporting the progress.
+
+    :param manifest: optional json file the state of all jobs is written to after every change.
+    :type manifest: None, str
+    :param silent: whether to suppress the print-out of each job.
+    :type silent: bool
+    :param errorSilent: whether to suppress the error print-out of each job.
+    :type errorSilent: bool
+
+    >>> js = JobScheduler("production.json")
+    >>> for i in range(100):
+    ...     js.AddBdsim("model.gmad", "run_" + str(i), ngenerate=1000, seed=100 + i)
+    >>> js.Run(nCPUs=8, retries=2)
+    >>> js.Failed()
+
+    If the manifest already exists (e.g. the production was interrupted), the jobs in it
+    are loaded and the jobs that are done aren't run again. Adding a job with the name
+    of one already loaded has no effect, so the same script can simply be run again.
+    A job succeeds if its exit code is 0 and all of its outputs exist.
+    """
+    def __init__(self, manifest=None, silent=True, errorSilent=False):
+        self.manifest    = manifest
+        self.silent      = silent
+        self.errorSilent = errorSilent
+        self.jobs        = {}
+        if manifest is not None and _os.path.isfile(manifest):
+            with open(manifest) as f:
+                for d in _json.load(f):
+                    job = Job.FromDict(d)
+                    if job.status != 'done' or not all(_os.path.exists(o) for o in job.outputs):
+                        # run again with all the retries
+                        job.status   = 'pending'
+                        job.attempts = 0
+                    self.jobs[job.name] = job
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __getitem__(self, name):
+        return self.jobs[name]
+
+    def AddJob(self, args, outputs=None, name=None, onSuccess=None, priority=0, persistent=True):
+        """
+        Add a command to the queue. Returns the job.
+
+        :param onSuccess: optional function called with the job when it succeeds, e.g. to add
+                          further jobs while running. If the job is already done (loaded from
+                          the manifest), it's called straight away.
+        :type onSuccess: None, function
+        :param priority: pending jobs with a higher priority are started first.
+        :type priority: int
+        :param persistent: whether the job is written to the manifest.
+        :type persistent: bool
+        """
+        job = Job(args, outputs, name)
+        if job.name in self.jobs:
+            job = self.jobs[job.name]
+        else:
+            self.jobs[job.name] = job
+        job.onSuccess  = onSuccess
+        job.priority   = priority
+        job.persistent = persistent
+        if job.status == 'done' and onSuccess is not None:
+            onSuccess(job)
+        return job
+
+    def RemoveOutputs(self, job):
+        """
+        Delete the output files of a job that is done, e.g. raw data that has been analysed.
+        The job stays done in the manifest.
+        """
+        for o in job.outputs:
+            if _os.path.exists(o):
+                _os.remove(o)
+        job.removed.extend(job.outputs)
+        job.outputs = []
+        self.WriteManifest()
+
+    def AddBdsim(self, gmadpath, outfile, ngenerate=10000, seed=None, batch=True, options=None,
+                 bdsimExecutable=None, **kwargs):
+        """
+        Add a bdsim job. Arguments are as Bdsim and kwargs as AddJob. The output
+        is outfile + '.root'.
+        """
+        args = _BdsimArgs(gmadpath, outfile, ngenerate, seed, batch, options, bdsimExecutable)
+        return self.AddJob(args, [outfile + '.root'], **kwargs)
+
+    def AddRebdsim(self, analysis_config_file, bdsim_raw_output_file, output_file_name=None,
+                   rebdsimExecutable=None, **kwargs):
+        """
+        Add a rebdsim job. Arguments are as Rebdsim and kwargs as AddJob.
+        """
+        if output_file_name is None:
+            output_file_name = _DefaultOutputName(bdsim_raw_output_file, '_ana.root')
+        args = _RebdsimArgs(analysis_config_file, bdsim_raw_output_file, output_file_name, rebdsimExecutable)
+        return self.AddJob(args, [output_file_name], **kwargs)
+
+    def AddBdskim(self, skim_config_file, bdsim_raw_output_file, output_file_name=None,
+                  bdskimExecutable=None, **kwargs):
+        """
+        Add a bdskim job. Arguments are as Bdskim and kwargs as AddJob.
+        """
+        if output_file_name is None:
+            output_file_name = _DefaultOutputName(bdsim_raw_output_file, '_skim.root')
+        args = _BdskimArgs(skim_config_file, bdsim_raw_output_file, output_file_name, bdskimExecutable)
+        return self.AddJob(args, [output_file_name], **kwargs)
+
+    def AddBdsimCombine(self, infileList, outpath, bdsimCombineExecutable=None, **kwargs):
+        """
+        Add a bdsimCombine job. Arguments are as BdsimCombine and kwargs as AddJob.
+        """
+        args = _CombineArgs(bdsimCombineExecutable or "bdsimCombine", infileList, outpath)
+        return self.AddJob(args, [outpath], **kwargs)
+
+    def AddRebdsimCombine(self, infileList, outpath, rebdsimCombineExecutable=None, **kwargs):
+        """
+        Add a rebdsimCombine job. Arguments are as RebdsimCombine and kwargs as AddJob.
+        """
+        args = _CombineArgs(rebdsimCombineExecutable or "rebdsimCombine", infileList, outpath)
+        return self.AddJob(args, [outpath], **kwargs)
+
+    def Pending(self):
+        return [j for j in self.jobs.values() if j.status == 'pending']
+
+    def Running(self):
+        return [j for j in self.jobs.values() if j.status == 'running']
+
+    def Done(self):
+        return [j for j in self.jobs.values() if j.status == 'done']
+
+    def Failed(self):
+        return [j for j in self.jobs.values() if j.status == 'failed']
+
+    def OutputSize(self):
+        """
+        Total size in bytes of the outputs of all jobs that are done.
+        """
+        return sum(j.outputSize or 0 for j in self.Done())
+
+    def Summary(self):
+        """
+        Return a string of the number of jobs of each status.
+        """
+        return "{} / {} done, {} failed, {} running, {} pending".format(len(self.Done()), len(self.jobs),
+                                                                     len(self.Failed()), len(self.Running()),
+                                                                     len(self.Pending()))
+
+    def WriteManifest(self):
+        """
+        Write the state of all jobs to the manifest file (if one was given).
+        """
+        if self.manifest is None:
+            return
+        tmpName = self.manifest + ".tmp"
+        with open(tmpName, "w") as f:
+            _json.dump([j.ToDict() for j in self.jobs.values() if j.persistent], f)
+        _os.replace(tmpName, self.manifest)
+
+    def _Start(self, job):
+        stdout = _subprocess.DEVNULL if self.silent else None
+        stderr = _subprocess.DEVNULL if self.errorSilent else None
+        job.status     = 'running'
+        job.attempts  += 1
+        job._startTime = _time.time()
+        try:
+            job._process = _subprocess.Popen(job.args, stdout=stdout, stderr=stderr)
+        except OSError as e:
+            # e.g. the executable doesn't exist
+            print("Job", job.name, "could not be started:", e)
+            job._process = None
+            job.exitCode = -1
+
+    def _Finish(self, job, retries):
+        if job._process is not None:
+            job.exitCode = job._process.returncode
+        job._process = None
+        job.wallTime = _time.time() - job._startTime
+        missing = [o for o in job.outputs if not _os.path.exists(o)]
+        job.outputSize = sum(_os.path.getsize(o) for o in job.outputs if o not in missing)
+        if job.exitCode == 0 and not missing:
+            job.status = 'done'
+            if job.onSuccess is not None:
+                job.onSuccess(job)
+        elif job.attempts <= retries:
+            job.status = 'pending'
+        else:
+            job.status = 'failed'
+
+    def Run(self, nCPUs=None, retries=0, progress=True, pollInterval=0.1):
+        """
+        Run all pending jobs with up to nCPUs at once (default is the total number of
+        cores available minus 1). Failed jobs are run again up to retries times.
+
+        :param progress: print the progress each time a job finishes, or a function called with
+                         this scheduler each time a job finishes.
+        :type progress: bool, function
+
+        Jobs added while running (e.g. by onSuccess) are also run. If interrupted, running jobs
+        are stopped and left pending in the manifest. Returns the list of failed jobs.
+        """
+        nCPUs = _NumberOfCPUs(nCPUs)
+        startTime = _time.time()
+        running = []
+        try:
+            while True:
+                pending = sorted(self.Pending(), key=lambda j: -j.priority)
+                started = len(pending) > 0 and len(running) < max(1, nCPUs)
+                while pending and len(running) < max(1, nCPUs):
+                    job = pending.pop(0)
+                    self._Start(job)
+                    running.append(job)
+                if not running:
+                    break
+                if started:
+                    self.WriteManifest()
+                _time.sleep(pollInterval)
+                finished = [j for j in running if j._process is None or j._process.poll() is not None]
+                for job in finished:
+                    running.remove(job)
+                    self._Finish(job, retries)
+                if finished:
+                    self.WriteManifest()
+                    if callable(progress):
+                        progress(self)
+                    elif progress:
+                        self._PrintProgress(startTime)
+        except KeyboardInterrupt:
+            for job in running:
+                if job._process is not None:
+                    job._process.terminate()
+                    job._process.wait()
+                job._process = None
+                job.status = 'pending'
+                job.attempts -= 1
+            self.WriteManifest()
+            raise
+        return self.Failed()
+
+    def _PrintProgress(self, startTime):
+        elapsed = _time.time() - startTime
+        nDone = len(self.Done()) + len(self.Failed())
+        message = self.Summary() + ", elapsed {:.0f} s".format(elapsed)
+        remaining = len(self.Pending()) + len(self.Running())
+        if nDone and remaining:
+            message += ", ETA {:.0f} s".format(elapsed / nDone * remaining)
+        print(message)
+
+
 def _NumberOfCPUs(nCPUs=None):
     maxNumberOfCores = _cpu_count() - 1
     if nCPUs is None:
@@ -173,14 +475,11 @@ def _NumberOfCPUs(nCPUs=None):
     return nCPUs
 
 
-def Bdsim(gmadpath, outfile, ngenerate=10000, seed=None, batch=True,
-          silent=False, errorSilent=False, options=None, bdsimExecutable=None):
-    """
-    Runs bdsim with gmadpath as inputfile and outfile as outfile.
-    Runs in batch mode by default, with 10,000 particles. Any extra
-    options should be provided as a string or iterable of strings of
-    the form "--vis_debug" or "--vis_mac=vis.mac", etc.
-    """
+def _DefaultOutputName(inputFileName, suffix):
+    return (inputFileName[:-5] if inputFileName.endswith('.root') else inputFileName) + suffix
+
+
+def _BdsimArgs(gmadpath, outfile, ngenerate=10000, seed=None, batch=True, options=None, bdsimExecutable=None):
     if not bdsimExecutable:
         bdsimExecutable = "bdsim"
     args = [bdsimExecutable,
@@ -197,7 +496,40 @@ def Bdsim(gmadpath, outfile, ngenerate=10000, seed=None, batch=True,
         args.append(options)
     elif options is not None:
         args.extend(options)
+    return args
+
+
+def _RebdsimArgs(analysis_config_file, bdsim_raw_output_file, output_file_name=None, rebdsimExecutable=None):
+    rebdsimExecutable = "rebdsim" if not rebdsimExecutable else rebdsimExecutable
+    args = [rebdsimExecutable, analysis_config_file, bdsim_raw_output_file]
+    if output_file_name is not None:
+        args.append(output_file_name)
+    return args
 
+
+def _BdskimArgs(skim_config_file, bdsim_raw_output_file, output_file_name=None, bdskimExecutable=None):
+    bdskimExecutable = "bdskim" if not bdskimExecutable else bdskimExecutable
+    args = [bdskimExecutable, skim_config_file, bdsim_raw_output_file]
+    if output_file_name is not None:
+        args.append(output_file_name)
+    return args
+
+
+def _CombineArgs(executable, infileList, outpath):
+    job = [executable, outpath]
+    job.extend(infileList)
+    return job
+
+
+def Bdsim(gmadpath, outfile, ngenerate=10000, seed=None, batch=True,
+          silent=False, errorSilent=False, options=None, bdsimExecutable=None):
+    """
+    Runs bdsim with gmadpath as inputfile and outfile as outfile.
+    Runs in batch mode by default, with 10,000 particles. Any extra
+    options should be provided as a string or iterable of strings of
+    the form "--vis_debug" or "--vis_mac=vis.mac", etc.
+    """
+    args = _BdsimArgs(gmadpath, outfile, ngenerate, seed, batch, options, bdsimExecutable)
     if not silent:
         return _subprocess.call(args)
     elif silent and errorSilent:
@@ -206,7 +538,8 @@ def Bdsim(gmadpath, outfile, ngenerate=10000, seed=None, batch=True,
         return _subprocess.call(args, stdout=open(_os.devnull, 'wb'))
 
 def BdsimParallel(gmadpath, outfile, nJobs=1, ngenerate=10000, startseed=None, batch=True,
-                  silent=False, errorSilent=True, options=None, bdsimExecutable=None, nCPUs=None):
+                  silent=False, errorSilent=True, options=None, bdsimExecutable=None, nCPUs=None,
+                  retries=0, manifest=None, progress=False):
     """
     Runs multiple bdsim instances with gmadpath as inputfile and outfile as outfile.
     The number of parallel jobs is defined by nJobs. It can be specified how many cores
@@ -214,28 +547,23 @@ def BdsimParallel(gmadpath, outfile, nJobs=1, ngenerate=10000, startseed=None, b
     in batch mode by default, with 10,000 particles.
     Any extra options should be provided as a string or iterable of strings of
     the form "--vis_debug" or "--vis_mac=vis.mac", etc.
+
+    Failed jobs are run again with the same seed up to retries times. If manifest is
+    given, the state of each job is written to it and running again with the same
+    manifest only runs the jobs that aren't done. Returns the JobScheduler so the
+    status, exit code, wall time and output size of each job can be inspected.
     """
     if startseed is None:
         seed = int(_time.time())
     else:
         seed = int(startseed)
 
-    maxNumberOfCores = _cpu_count() - 1
-    if nCPUs is None:
-        nCPUs = maxNumberOfCores
-    if nCPUs > maxNumberOfCores:
-        print("Limiting the number of cores to the maximum of {}".format(maxNumberOfCores))
-        nCPUs = maxNumberOfCores
-    if nJobs < nCPUs:
-        nCPUs = nJobs
-    p = _Pool(processes=nCPUs)
+    js = JobScheduler(manifest, silent=silent, errorSilent=silent and errorSilent)
     for i in range(nJobs):
-        args = (gmadpath, outfile + '_' + str(i), ngenerate, seed, batch,
-                     silent, errorSilent, options, bdsimExecutable)
-        p.apply_async(Bdsim, args=args)
+        js.AddBdsim(gmadpath, outfile + '_' + str(i), ngenerate, seed, batch, options, bdsimExecutable)
         seed += 1
-    p.close()
-    p.join()
+    js.Run(min(_NumberOfCPUs(nCPUs), nJobs), retries=retries, progress=progress)
+    return js
 
 def Rebdsim(analysis_config_file, bdsim_raw_output_file, output_file_name=None, silent=False, rebdsimExecutable=None):
     """
@@ -253,12 +581,9 @@ def Rebdsim(analysis_config_file, bdsim_raw_output_file, output_file_name=None,
     :param rebdsimExecutable: specific executable to use for developers
     :type rebdsimExecutable: None, str
     """
-    rebdsimExecutable = "rebdsim" if not rebdsimExecutable else rebdsimExecutable
     if not _General.IsROOTFile(bdsim_raw_output_file):
         raise IOError("Not a ROOT file")
-    args = [rebdsimExecutable, analysis_config_file, bdsim_raw_output_file]
-    if output_file_name is not None:
-        args.append(output_file_name)
+    args = _RebdsimArgs(analysis_config_file, bdsim_raw_output_file, output_file_name, rebdsimExecutable)
     if silent:
         return _subprocess.call(args, stdout=open(_os.devnull, 'wb'))
     else:
@@ -280,12 +605,9 @@ def Bdskim(skim_config_file, bdsim_raw_output_file, output_file_name=None, silen
     :param rebdsimExecutable: specific executable to use for developers
     :type rebdsimExecutable: None, str
     """
-    bdskimExecutable = "bdskim" if not bdskimExecutable else bdskimExecutable
     if not _General.IsROOTFile(bdsim_raw_output_file):
         raise IOError("Not a ROOT file")
-    args = [bdskimExecutable, skim_config_file, bdsim_raw_output_file]
-    if output_file_name is not None:
-        args.append(output_file_name)
+    args = _BdskimArgs(skim_config_file, bdsim_raw_output_file, output_file_name, bdskimExecutable)
     if silent:
         return _subprocess.call(args, stdout=open(_os.devnull, 'wb'))
     else:
@@ -404,8 +726,7 @@ def BdsimCombine(infileList, outpath, silent=False, bdsimCombineExecutable=None)
     for file in infileList:
         if not _General.IsROOTFile(file):
             raise IOError("Not a ROOT file")
-    job = [bdsimCombineExecutable, outpath]
-    job.extend(infileList)
+    job = _CombineArgs(bdsimCombineExecutable, infileList, outpath)
     if silent:
         return _subprocess.call(job, stdout=open(_os.devnull, 'wb'))
     else:
@@ -420,13 +741,119 @@ def RebdsimCombine(infileList, outpath, silent=False, rebdsimCombineExecutable=N
     for file in infileList:
         if not _General.IsROOTFile(file):
             raise IOError("Not a ROOT file")
-    job = [rebdsimCombineExecutable, outpath]
-    job.extend(infileList)
+    job = _CombineArgs(rebdsimCombineExecutable, infileList, outpath)
     if silent:
         return _subprocess.call(job, stdout=open(_os.devnull, 'wb'))
     else:
         return _subprocess.call(job)
 
+def BdsimPipeline(gmadpath, outfile, analysis_config_file, nJobs=1, ngenerate=10000, startseed=None,
+                  output_file_name=None, fanIn=10, rawFiles="keep", skim_config_file=None, batch=True,
+                  options=None, nCPUs=None, retries=0, manifest=None, progress=True, silent=True,
+                  errorSilent=False, bdsimExecutable=None, rebdsimExecutable=None, bdskimExecutable=None,
+                  rebdsimCombineExecutable=None):
+    """
+    Run nJobs of bdsim as BdsimParallel, analysing the output of each with rebdsim as soon
+    as it finishes and combining the analysis outputs with rebdsimCombine as they arrive,
+    so the cores aren't idle while the slowest bdsim jobs finish.
+
+    :param analysis_config_file: rebdsim analysis configuration text file.
+    :type analysis_config_file: str
+    :param output_file_name: final combined analysis output. Default is outfile + '_ana.root'.
+    :type output_file_name: None, str
+    :param fanIn: number of files combined at once. Every fanIn analysis outputs are combined
+                  into an intermediate file and so on, so the final combine only has a few files.
+    :type fanIn: int
+    :param rawFiles: 'keep', 'delete' or 'skim' the raw bdsim output once it's been analysed.
+    :type rawFiles: str
+    :param skim_config_file: bdskim configuration text file for rawFiles='skim'. The skimmed file
+                             (raw_name)_skim.root is kept and the raw file deleted.
+    :type skim_config_file: None, str
+
+    The per-job analysis outputs (outfile_N_ana.root) are kept and the intermediate combined
+    files deleted. The other arguments are as BdsimParallel and JobScheduler. With a manifest,
+    running again only runs the bdsim, rebdsim and bdskim jobs that aren't done and then
+    combines all the analysis outputs again. Returns the JobScheduler.
+
+    >>> js = pybdsim.Run.BdsimPipeline("model.gmad", "run", "analysis.txt", nJobs=200, ngenerate=1000,
+    ...                                rawFiles="delete", manifest="production.json")
+    >>> js.Failed()
+    """
+    if rawFiles not in ["keep", "delete", "skim"]:
+        raise ValueError("rawFiles must be one of 'keep', 'delete' or 'skim'")
+    if rawFiles == "skim" and skim_config_file is None:
+        raise ValueError("skim_config_file is required for rawFiles='skim'")
+    if fanIn < 2:
+        raise ValueError("fanIn must be at least 2")
+    if output_file_name is None:
+        output_file_name = outfile + '_ana.root'
+    seed = int(_time.time()) if startseed is None else int(startseed)
+    mergePrefix = _DefaultOutputName(output_file_name, '_merge_')
+
+    js = JobScheduler(manifest, silent=silent, errorSilent=errorSilent)
+    waiting = [] # files waiting to be combined at each level of the tree
+    intermediates = set()
+    merges = [] # (job, inputs) for each intermediate combine
+
+    def Merge(level, fileName):
+        while len(waiting) <= level:
+            waiting.append([])
+        waiting[level].append(fileName)
+        if len(waiting[level]) == fanIn:
+            inputs = waiting[level]
+            waiting[level] = []
+            merged = mergePrefix + str(level + 1) + '_' + str(len(intermediates)) + '.root'
+            intermediates.add(merged)
+            def Merged(job):
+                _RemoveFiles(f for f in inputs if f in intermediates)
+                Merge(level + 1, merged)
+            job = js.AddRebdsimCombine(inputs, merged, rebdsimCombineExecutable, onSuccess=Merged,
+                                       priority=3, persistent=False)
+            merges.append((job, inputs))
+
+    def Simulated(bdsimJob):
+        rawFile = bdsimJob.outputs[0] if bdsimJob.outputs else bdsimJob.removed[0]
+        def Analysed(rebdsimJob):
+            if rawFiles == "skim" and bdsimJob.outputs:
+                js.AddBdskim(skim_config_file, rawFile, bdskimExecutable=bdskimExecutable,
+                             onSuccess=lambda j: js.RemoveOutputs(bdsimJob), priority=2)
+            elif rawFiles == "delete" and bdsimJob.outputs:
+                js.RemoveOutputs(bdsimJob)
+            Merge(0, rebdsimJob.outputs[0])
+        js.AddRebdsim(analysis_config_file, rawFile, rebdsimExecutable=rebdsimExecutable,
+                      onSuccess=Analysed, priority=1)
+
+    for i in range(nJobs):
+        js.AddBdsim(gmadpath, outfile + '_' + str(i), ngenerate, seed + i, batch, options, bdsimExecutable,
+                    onSuccess=Simulated)
+    js.Run(min(_NumberOfCPUs(nCPUs), nJobs), retries=retries, progress=progress)
+
+    # combine what's left at every level of the tree and the inputs of any intermediate
+    # combines that failed, so the final file isn't missing any analysis outputs
+    remaining = [f for level in waiting for f in level]
+    for job, inputs in merges:
+        if job.status != 'done':
+            remaining.extend(inputs)
+    if len(remaining) > 1:
+        final = js.AddRebdsimCombine(remaining, output_file_name, rebdsimCombineExecutable, persistent=False)
+        js.Run(1, retries=retries, progress=progress)
+        if final.status != 'done':
+            raise RuntimeError("Final rebdsimCombine to " + output_file_name + " failed - its inputs are kept: "
+                               + " ".join(remaining))
+        _RemoveFiles(f for f in remaining if f in intermediates)
+    elif len(remaining) == 1 and remaining[0] in intermediates:
+        _os.replace(remaining[0], output_file_name)
+    elif len(remaining) == 1:
+        _shutil.copyfile(remaining[0], output_file_name)
+    else:
+        print("No analysis outputs to combine")
+    return js
+
+def _RemoveFiles(fileNames):
+    for fileName in fileNames:
+        if _os.path.exists(fileName):
+            _os.remove(fileName)
+
 def RebdsimOrbit(rootpath, outpath, index='1', silent=False, rebdsimHistoExecutable=None):
     """
     Run rebdsimOrbit
@@ -466,12 +893,123 @@ def Chunks(l, n):
     return [l[i:i+n] for i in range(0,len(l),n)]
 
 
-def Reduce(globcommand, nPerChunk, outputprefix):
+def _Combine(output, files, executable="bdsimCombine", silent=False):
+    """Private function for parallelising reducing run."""
+    if silent:
+        _subprocess.run(_CombineArgs(executable, files, output), check=True, stdout=_subprocess.DEVNULL)
+    else:
+        print("Combining", files[0], "to", files[-1])
+        _subprocess.run(_CombineArgs(executable, files, output), check=True)
+
+
+def _HistoMerge(output, files, executable="rebdsimHistoMerge", silent=False):
+    """Private function for parallelising rebdsimHistoMerge on each file."""
+    stdout = _subprocess.DEVNULL if silent else None
+    _subprocess.run([executable, files[0], output], check=True, stdout=stdout)
+
+
+def _ReduceLevel(function, outputs, groups, executable, silent, nCPUs):
+    """
+    Run function(output, group, executable, silent) for each group with up to nCPUs
+    at once. Any failure raises subprocess.CalledProcessError.
+    """
+    args = [(o, g, executable, silent) for o, g in zip(outputs, groups)]
+    if nCPUs > 1 and len(args) > 1:
+        with _Pool(processes=min(nCPUs, len(args))) as p:
+            p.starmap(function, args)
+    else:
+        for a in args:
+            function(*a)
+
+
+def _Files(globcommandOrFiles):
+    if isinstance(globcommandOrFiles, str):
+        return sorted(_glob.glob(globcommandOrFiles))
+    return list(globcommandOrFiles)
+
+
+def TreeReduce(globcommandOrFiles, outputFileName, fanIn=10, tool="bdsimCombine", executable=None,
+               nCPUs=None, silent=True, keepIntermediate=False, rebdsimCombineExecutable=None):
+    """
+    Combine many files into one by combining fanIn files at a time in parallel, then
+    the outputs of those fanIn at a time and so on, so N files take about log(N)/log(fanIn)
+    sequential stages.
+
+    :param globcommandOrFiles: glob pattern (e.g. "datadir/*.root") or list of files.
+    :type globcommandOrFiles: str, list(str)
+    :param tool: 'bdsimCombine' (raw bdsim output), 'rebdsimCombine' (rebdsim output) or
+                 'rebdsimHistoMerge' (raw bdsim output - each file is histogram merged and
+                 then the outputs are combined with rebdsimCombine).
+    :type tool: str
+    :param executable: specific executable to use for tool.
+    :type executable: None, str
+    :param rebdsimCombineExecutable: specific rebdsimCombine to use after rebdsimHistoMerge.
+    :type rebdsimCombineExecutable: None, str
+    :param keepIntermediate: whether to keep the intermediate files of each level.
+    :type keepIntermediate: bool
+
+    Each level is run with a process pool of nCPUs (default is the total number of cores
+    minus 1). If any combine fails, subprocess.CalledProcessError is raised. The
+    intermediate files are outputFileName with '_levelN_M' added and are deleted once
+    they've been combined.
+
+    >>> pybdsim.Run.TreeReduce("data/*_ana.root", "total_ana.root", fanIn=20, tool="rebdsimCombine")
+    """
+    tools = ["bdsimCombine", "rebdsimCombine", "rebdsimHistoMerge"]
+    if tool not in tools:
+        raise ValueError("tool must be one of " + str(tools))
+    if fanIn < 2:
+        raise ValueError("fanIn must be at least 2")
+    files = _Files(globcommandOrFiles)
+    if not files:
+        raise ValueError("No files to combine")
+    nCPUs = max(1, _NumberOfCPUs(nCPUs))
+    prefix = _DefaultOutputName(outputFileName, '_level')
+
+    level = 0
+    intermediates = set()
+    if tool == "rebdsimHistoMerge":
+        level += 1
+        outputs = [prefix + "0_" + str(i) + ".root" for i in range(len(files))]
+        if len(files) == 1:
+            outputs = [outputFileName]
+        _ReduceLevel(_HistoMerge, outputs, [[f] for f in files], executable or tool, silent, nCPUs)
+        intermediates.update(outputs)
+        files = outputs
+        tool, executable = "rebdsimCombine", rebdsimCombineExecutable
+
+    while len(files) > 1:
+        groups = Chunks(files, fanIn)
+        if len(groups) == 1:
+            outputs = [outputFileName]
+        else:
+            outputs = [prefix + str(level) + "_" + str(i) + ".root" for i in range(len(groups))]
+        # a single file left over is passed to the next level as it is
+        toCombine = [(o, g) for o, g in zip(outputs, groups) if len(g) > 1]
+        _ReduceLevel(_Combine, [o for o, g in toCombine], [g for o, g in toCombine],
+                     executable or tool, silent, nCPUs)
+        if not keepIntermediate:
+            _RemoveFiles(f for o, g in toCombine for f in g if f in intermediates)
+        intermediates.update(o for o, g in toCombine)
+        files = [o if len(g) > 1 else g[0] for o, g in zip(outputs, groups)]
+        level += 1
+
+    if files[0] != outputFileName:
+        # only one input file
+        _shutil.copyfile(files[0], outputFileName)
+    return outputFileName
+
+
+def Reduce(globcommand, nPerChunk, outputprefix, combineExecutable="bdsimCombine", outputFileName=None):
     """
     Apply bdsimCombine to the globcommand set of files combining
     nPerchunks into an output file.
 
     ReduceRun("datadir/*.root", 10, "outputdir/")
+
+    If outputFileName is given, the chunk files are then combined in a tree
+    (as TreeReduce) into that one file. If any combine fails,
+    subprocess.CalledProcessError is raised.
     """
 
     files = _glob.glob(globcommand)
@@ -484,27 +1022,32 @@ def Reduce(globcommand, nPerChunk, outputprefix):
     prefix = outputprefix if outputprefix.endswith('/') else outputprefix+"_"
     
     chunks = Chunks(files, nPerChunk)
+    chunkNames = []
     for i,chunk in enumerate(chunks):
         print('Chunk ',i)
         chunkName = prefix + str(i).zfill(nchars)+".root"
-        command = "bdsimCombine "+chunkName + " " + " ".join(chunk)
-        print(command)
-        _os.system(command)
+        _Combine(chunkName, chunk, combineExecutable)
+        chunkNames.append(chunkName)
 
+    if outputFileName is not None:
+        TreeReduce(chunkNames, outputFileName, max(2, nPerChunk), executable=combineExecutable, nCPUs=1)
+        _RemoveFiles(f for f in chunkNames if f != outputFileName)
+        return outputFileName
+    return chunkNames
 
-def _Combine(output, files):
-    """Private function for parallelising reducing run."""
-    command = "bdsimCombine " + output + " " + " ".join(files)
-    print("Combinding ",files[0],"to",files[-1])
-    _os.system(command)
 
-    
-def ReduceParallel(globcommand, nPerChunk, outputprefix, nCPUs=4):
+def ReduceParallel(globcommand, nPerChunk, outputprefix, nCPUs=4, combineExecutable="bdsimCombine",
+                   outputFileName=None):
     """
     In parallel, apply bdsimCombine to the globcommand set of files combining
     nPerChunk into an output file.
 
     chunkermp.ReduceRun("testfiles/*.root", 14, "testfiles-merge/", nCPUs=7)
+
+    If outputFileName is given, the chunk files are then combined nPerChunk
+    at a time in parallel, and so on, into that one file (as TreeReduce) and the
+    chunk files deleted. combineExecutable may be e.g. 'rebdsimCombine' for rebdsim
+    output. If any combine fails, subprocess.CalledProcessError is raised.
     """
     files = _glob.glob(globcommand)
     print(len(files), "files to be combined in chunks of ", nPerChunk)
@@ -516,13 +1059,18 @@ def ReduceParallel(globcommand, nPerChunk, outputprefix, nCPUs=4):
     prefix = outputprefix if outputprefix.endswith('/') else outputprefix+"_"
     
     chunks = Chunks(files, nPerChunk)
-    if len(chunks[-1]) == 1:
+    if len(chunks) > 1 and len(chunks[-1]) == 1:
         chunks[-2].extend(chunks[-1])
         chunks.pop()
     chunkname = [prefix + str(i).zfill(nchars)+".root" for i in range(len(chunks))]
 
-    p = _Pool(processes=nCPUs)
-    p.starmap(_Combine, zip(chunkname, chunks))
+    _ReduceLevel(_Combine, chunkname, chunks, combineExecutable, False, nCPUs)
+
+    if outputFileName is not None:
+        TreeReduce(chunkname, outputFileName, max(2, nPerChunk), executable=combineExecutable, nCPUs=nCPUs)
+        _RemoveFiles(f for f in chunkname if f != outputFileName)
+        return outputFileName
+    return chunkname
 
 def RenderGmadJinjaTemplate(template_file, output_file, data, path=".") :
     from jinja2 import Environment, FileSystemLoader
@@ -1,3 +1,4 @@
+import pybdsim as _pybdsim
 from scipy.special import jn_zeros as _jn_zeros
 from scipy.special import jnp_zeros as _jnp_zeros
 from scipy.special import jn as _jn
@@ -18,6 +19,8 @@ from numpy import logical_and as _logical_and
 from numpy import trapz as _trapz
 from numpy import exp as _exp
 from numpy import zeros as _zeros
+from numpy import empty as _empty
+from numpy import float64 as _float64
 
 
 def TM_cylindrical(r, t, z, radius, length, m, n, p, E0=1, opt=""):
@@ -165,6 +168,16 @@ def TE_cylindrical(r, t, z, radius, length, m, n, p, B0=1, opt=""):
             "Ex": Ex, "Ey": Ey, "Ez": Ez, "Er": Er, "Et": Et, "E":E,
             "Bx": Bx, "By": By, "Bz": Bz, "Br": Er, "Bt": Bt, "B":B}
 
+def _CylindricalMode(modeType, r, t, z, radius, length, m, n, p, field0):
+    if modeType == "TM" :
+        return TM_cylindrical(r,t,z,radius,length,m,n,p,field0)
+    elif modeType == "TE" :
+        return TE_cylindrical(r,t,z,radius,length,m,n,p,field0)
+    elif modeType == "TM010" :
+        return TM010_cylindrical(r,t,z,radius,length,2*_pi*2.5e9,field0)
+    else:
+        raise ValueError("Unknown modeType \"" + str(modeType) + "\" - options are: TM, TE, TM010")
+
 def Cylindrical_cartesianmesh(radius, length, modeType, m,n,p, nx=20, ny=20, nz=20, safety=0.01, field0=1):
     lowx = -radius - safety
     lowy = -radius - safety
@@ -189,53 +202,20 @@ def Cylindrical_cartesianmesh(radius, length, modeType, m,n,p, nx=20, ny=20, nz=
     rmesh = _sqrt(xmesh**2 + ymesh**2)
     tmesh = _arctan2(ymesh, xmesh)
 
-    cavityshape = 1.0*(_sqrt(xmesh**2 + ymesh**2) < radius)
+    # all z slices at once as arrays of (z,y,x)
+    r = _CylindricalMode(modeType, rmesh, tmesh, zspace[:,None,None], radius, length, m, n, p, field0)
+
+    ExArray = r['Ex']
+    EyArray = r['Ey']
+    EzArray = r['Ez']
+    ErArray = r['Er']
+    EtArray = r['Et']
 
-    EzArray = []
-    ErArray = []
-    EtArray = []
-    ExArray = []
-    EyArray = []
-
-    BzArray = []
-    BrArray = []
-    BtArray = []
-    BxArray = []
-    ByArray = []
-
-    for z in zspace  :
-        if modeType == "TM" :
-            r = TM_cylindrical(rmesh,tmesh,z,radius,length,m,n,p,field0)
-        elif modeType == "TE" :
-            r = TE_cylindrical(rmesh,tmesh,z,radius,length,m,n,p,field0)
-        elif modeType == "TM010" :
-            r = TM010_cylindrical(rmesh,tmesh,z,radius,length,2*_pi*2.5e9,field0)
-
-        EzArray.append(r['Ez'])
-        ErArray.append(r['Er'])
-        EtArray.append(r['Et'])
-        ExArray.append(r['Ex'])
-        EyArray.append(r['Ey'])
-
-        BzArray.append(r['Bz'])
-        BrArray.append(r['Br'])
-        BtArray.append(r['Bt'])
-        BxArray.append(r['Bx'])
-        ByArray.append(r['By'])
-
-    # print(r['kmn'],r['kz'],r['omega'], r['freq'])
-
-    ExArray = _array(ExArray)
-    EyArray = _array(EyArray)
-    EzArray = _array(EzArray)
-    ErArray = _array(ErArray)
-    EtArray = _array(EtArray)
-
-    BxArray = _array(BxArray)
-    ByArray = _array(ByArray)
-    BzArray = _array(BzArray)
-    BrArray = _array(BrArray)
-    BtArray = _array(BtArray)
+    BxArray = r['Bx']
+    ByArray = r['By']
+    BzArray = r['Bz']
+    BrArray = r['Br']
+    BtArray = r['Bt']
 
     B = _array([BxArray,ByArray,BzArray])
     E = _array([ExArray,EyArray,EzArray])
@@ -253,6 +233,78 @@ def Cylindrical_cartesianmesh(radius, length, modeType, m,n,p, nx=20, ny=20, nz=
             "Bx":BxArray.T, "By":ByArray.T,
             "B":B.T, "E":E.T}
 
+def Cylindrical_fieldmap(radius, length, modeType, m, n, p, nx=20, ny=20, nz=20, nt=None, field="E",
+                         safety=0.01, field0=1, dtype=_float64, chunkSize=2**22):
+    """
+    Make a BDSIM field map of a cylindrical cavity mode on a cartesian mesh.
+
+    :param radius: radius of the cavity in m.
+    :type radius: float
+    :param length: length of the cavity in m.
+    :type length: float
+    :param modeType: 'TM', 'TE' or 'TM010'.
+    :type modeType: str
+    :param nt: if given, a 4D field map with nt points over one period is made, otherwise 3D.
+    :type nt: int, None
+    :param field: 'E' or 'B' for the electric or magnetic field.
+    :type field: str
+    :param dtype: numpy type of the field map data, e.g. numpy.float32 to halve the memory.
+    :type dtype: numpy.dtype
+    :param chunkSize: approximate maximum number of (x,y,z) points evaluated at once.
+    :type chunkSize: int
+
+    >>> fm = pybdsim.Theory.Cylindrical_fieldmap(0.05, 0.1, "TM", 0, 1, 0, nx=50, ny=50, nz=50)
+    >>> fm.Write("cavity.dat.gz")
+
+    Returns a pybdsim.Field.Field3D (or Field4D) instance with coordinates in cm and time in s
+    (the units of BDSIM field maps) and the field in the units of field0. The mesh is the same
+    as Cylindrical_cartesianmesh. In 4D, E varies as cos(omega t) and B as sin(omega t).
+
+    All points in a slab of z are evaluated at once, so the memory used is about that of the
+    field map itself plus a few times chunkSize points.
+    """
+    if field not in ["E", "B"]:
+        raise ValueError("field must be 'E' or 'B'")
+
+    xspace = _linspace(-radius - safety, radius + safety, nx)
+    yspace = _linspace(-radius - safety, radius + safety, ny)
+    zspace = _linspace(0, length, nz)
+
+    xmesh, ymesh = _meshgrid(xspace, yspace)
+    rmesh = _sqrt(xmesh**2 + ymesh**2)
+    tmesh = _arctan2(ymesh, xmesh)
+
+    nDim = 3 if nt is None else 4
+    shape = (nx, ny, nz) if nt is None else (nx, ny, nz, nt)
+    data = _empty(shape + (nDim + 3,), dtype=dtype)
+    extra = (None,) * (nDim - 3)
+    data[..., 0] = 100 * xspace[(slice(None), None, None) + extra]
+    data[..., 1] = 100 * yspace[(None, slice(None), None) + extra]
+    data[..., 2] = 100 * zspace[(None, None, slice(None)) + extra]
+
+    zPerChunk = max(1, int(chunkSize) // (nx * ny))
+    for iz in range(0, nz, zPerChunk):
+        r = _CylindricalMode(modeType, rmesh, tmesh, zspace[iz:iz+zPerChunk,None,None], radius, length, m, n, p, field0)
+        if nt is None:
+            for i, c in enumerate("xyz"):
+                data[:, :, iz:iz+zPerChunk, 3 + i] = r[field + c].T
+        else:
+            if iz == 0:
+                tspace = _linspace(0, 2 * _pi / r['omega'], nt)
+                data[..., 3] = tspace
+                phase = _cos(r['omega'] * tspace) if field == "E" else _sin(r['omega'] * tspace)
+            for i, c in enumerate("xyz"):
+                data[:, :, iz:iz+zPerChunk, :, 4 + i] = r[field + c].T[..., None] * phase
+
+    doublePrecision = _empty(0, dtype=dtype).itemsize > 4
+    if nt is None:
+        fm = _pybdsim.Field.Field3D(data, doublePrecision=doublePrecision)
+    else:
+        fm = _pybdsim.Field.Field4D(data, doublePrecision=doublePrecision)
+    fm.AddComment(modeType + " " + " ".join(str(i) for i in (m, n, p)) + " cylindrical cavity mode, "
+                  + field + " field, frequency " + str(r['freq']) + " Hz")
+    return fm
+
 def Cylindrical_line(radius, length, modeType, m,n,p, nx=20, ny=20, nz=20, safety=0.01, field0=1,
                      p0=[0,0,0], dl=[0,0,1], nlambda=50, linelength=0.1):
     p0 = _array(p0)
@@ -467,58 +519,35 @@ def TM_cylindical_old(radius, length, m,n,p, nx=20, ny=20, nz=20, safety=0.01, E
 
     cavityshape = 1.0*(_sqrt(xmesh**2 + ymesh**2) < radius)
 
-    EzArray = []
-    ErArray = []
-    EtArray = []
-    ExArray = []
-    EyArray = []
-
-    BzArray = []
-    BrArray = []
-    BtArray = []
-    BxArray = []
-    ByArray = []
-
-    for z in zspace  :
-        Ez = cavityshape * E0*_jn(m,kmn*rmesh) * _cos(m*tmesh) *_cos(p * _pi * z/length)
-        Er = - cavityshape * p * _pi/length * radius/_jn_zeros(m,n)[n-1] * E0 *_jvp(m,kmn*rmesh) * _cos(m*tmesh) * _sin(p * _pi * z/length)
-        Et = - cavityshape * p * _pi/length * m * radius**2/_jn_zeros(m,n)**2/rmesh * E0 * _jn(m,kmn*rmesh)*_sin(m*tmesh) * _sin(p * _pi * z/length)
-
-        Ex = Er*_cos(tmesh) - Et*_sin(tmesh)
-        Ey = Er*_sin(tmesh) + Et*_cos(tmesh)
-
-        Bz = cavityshape * 0*rmesh
-        Br = cavityshape * omega* m*radius**2/_jn_zeros(m,n)**2/rmesh/_c**2 * E0 *_jn(m,kmn*rmesh) * _sin(m * tmesh) * _cos(p * _pi * z/length)
-        Bt = cavityshape * omega* radius/_jn_zeros(m,n)/_c**2 * E0 * _jvp(m, kmn*rmesh) * _cos(m * tmesh) * _cos(p * _pi * z/length)
-
-        Bx = Br*_cos(tmesh) - Bt*_sin(tmesh)
-        By = Br*_sin(tmesh) + Bt*_cos(tmesh)
-
-        EzArray.append(Ez)
-        ErArray.append(Er)
-        EtArray.append(Et)
-        ExArray.append(Ex)
-        EyArray.append(Ey)
-
-        BzArray.append(Bz)
-        BrArray.append(Br)
-        BtArray.append(Bt)
-        BxArray.append(Bx)
-        ByArray.append(By)
+    # all z slices at once as arrays of (z,y,x)
+    z = zspace[:,None,None]
+    Ez = cavityshape * E0*_jn(m,kmn*rmesh) * _cos(m*tmesh) *_cos(p * _pi * z/length)
+    Er = - cavityshape * p * _pi/length * radius/_jn_zeros(m,n)[n-1] * E0 *_jvp(m,kmn*rmesh) * _cos(m*tmesh) * _sin(p * _pi * z/length)
+    Et = - cavityshape * p * _pi/length * m * radius**2/_jn_zeros(m,n)**2/rmesh * E0 * _jn(m,kmn*rmesh)*_sin(m*tmesh) * _sin(p * _pi * z/length)
+
+    Ex = Er*_cos(tmesh) - Et*_sin(tmesh)
+    Ey = Er*_sin(tmesh) + Et*_cos(tmesh)
+
+    Bz = _zeros((nz, ny, nx))
+    Br = cavityshape * omega* m*radius**2/_jn_zeros(m,n)**2/rmesh/_c**2 * E0 *_jn(m,kmn*rmesh) * _sin(m * tmesh) * _cos(p * _pi * z/length)
+    Bt = cavityshape * omega* radius/_jn_zeros(m,n)/_c**2 * E0 * _jvp(m, kmn*rmesh) * _cos(m * tmesh) * _cos(p * _pi * z/length)
+
+    Bx = Br*_cos(tmesh) - Bt*_sin(tmesh)
+    By = Br*_sin(tmesh) + Bt*_cos(tmesh)
 
     print(kmn, kz, omega, freq)
 
-    ExArray = _array(ExArray)
-    EyArray = _array(EyArray)
-    EzArray = _array(EzArray)
-    ErArray = _array(ErArray)
-    EtArray = _array(EtArray)
+    ExArray = Ex
+    EyArray = Ey
+    EzArray = Ez
+    ErArray = Er
+    EtArray = Et
 
-    BxArray = _array(BxArray)
-    ByArray = _array(ByArray)
-    BzArray = _array(BzArray)
-    BrArray = _array(BrArray)
-    BtArray = _array(BtArray)
+    BxArray = Bx
+    ByArray = By
+    BzArray = Bz
+    BrArray = Br
+    BtArray = Bt
 
     B = _array([BxArray,ByArray,BzArray])
     E = _array([ExArray,EyArray,EzArray])
@@ -570,58 +599,35 @@ def TE_cylindical_old(radius, length, m,n,p, nx=20, ny=20, nz=20, safety=0.01, B
 
     cavityshape = 1.0*(_sqrt(xmesh**2 + ymesh**2) < radius)
 
-    EzArray = []
-    ErArray = []
-    EtArray = []
-    ExArray = []
-    EyArray = []
-
-    BzArray = []
-    BrArray = []
-    BtArray = []
-    BxArray = []
-    ByArray = []
-
-    for z in zspace:
-        Ez = cavityshape * 0
-        Er = cavityshape * omega * m*radius**2/_jnp_zeros(m,n)[n-1]/rmesh * B0 * _jn(m,kmn*rmesh) * _sin(m*tmesh) * _sin(p*_pi*z/length)
-        Et = cavityshape * omega * radius/_jnp_zeros(m,n)[n-1] * B0 * _jvp(m, kmn*rmesh) * _cos(m*tmesh) * _sin(p*_pi*z/length)
-
-        Ex = Er*_cos(tmesh) - Et*_sin(tmesh)
-        Ey = Er*_sin(tmesh) + Et*_cos(tmesh)
-
-        Bz = cavityshape *B0*_jn(m, kmn*rmesh) * _cos(m*tmesh) * _sin(p*_pi*z/length)
-        Br = cavityshape *p*_pi/length * radius/_jnp_zeros(m,n)[n-1] * B0 * _jvp(m,kmn*rmesh) * _cos(m*tmesh) * _cos(p*_pi*z/length)
-        Bt = - cavityshape * p*_pi/length * m*radius**2/_jnp_zeros(m,n)[n-1]**2/radius * B0 * _jn(m, kmn*rmesh) * _sin(m*tmesh) * _cos(p*_pi*z/length)
-
-        Bx = Br*_cos(tmesh) - Bt*_sin(tmesh)
-        By = Br*_sin(tmesh) + Bt*_cos(tmesh)
-
-        EzArray.append(Ez)
-        ErArray.append(Er)
-        EtArray.append(Et)
-        ExArray.append(Ex)
-        EyArray.append(Ey)
-
-        BzArray.append(Bz)
-        BrArray.append(Br)
-        BtArray.append(Bt)
-        BxArray.append(Bx)
-        ByArray.append(By)
+    # all z slices at once as arrays of (z,y,x)
+    z = zspace[:,None,None]
+    Ez = _zeros((nz, ny, nx))
+    Er = cavityshape * omega * m*radius**2/_jnp_zeros(m,n)[n-1]/rmesh * B0 * _jn(m,kmn*rmesh) * _sin(m*tmesh) * _sin(p*_pi*z/length)
+    Et = cavityshape * omega * radius/_jnp_zeros(m,n)[n-1] * B0 * _jvp(m, kmn*rmesh) * _cos(m*tmesh) * _sin(p*_pi*z/length)
+
+    Ex = Er*_cos(tmesh) - Et*_sin(tmesh)
+    Ey = Er*_sin(tmesh) + Et*_cos(tmesh)
+
+    Bz = cavityshape *B0*_jn(m, kmn*rmesh) * _cos(m*tmesh) * _sin(p*_pi*z/length)
+    Br = cavityshape *p*_pi/length * radius/_jnp_zeros(m,n)[n-1] * B0 * _jvp(m,kmn*rmesh) * _cos(m*tmesh) * _cos(p*_pi*z/length)
+    Bt = - cavityshape * p*_pi/length * m*radius**2/_jnp_zeros(m,n)[n-1]**2/radius * B0 * _jn(m, kmn*rmesh) * _sin(m*tmesh) * _cos(p*_pi*z/length)
+
+    Bx = Br*_cos(tmesh) - Bt*_sin(tmesh)
+    By = Br*_sin(tmesh) + Bt*_cos(tmesh)
 
     print(kmn, kz, omega, freq)
 
-    ExArray = _array(ExArray)
-    EyArray = _array(EyArray)
-    EzArray = _array(EzArray)
-    ErArray = _array(ErArray)
-    EtArray = _array(EtArray)
-
-    BxArray = _array(BxArray)
-    ByArray = _array(ByArray)
-    BzArray = _array(BzArray)
-    BrArray = _array(BrArray)
-    BtArray = _array(BtArray)
+    ExArray = Ex
+    EyArray = Ey
+    EzArray = Ez
+    ErArray = Er
+    EtArray = Et
+
+    BxArray = Bx
+    ByArray = By
+    BzArray = Bz
+    BrArray = Br
+    BtArray = Bt
 
     B = _array([BxArray,ByArray,BzArray])
     E = _array([ExArray,EyArray,EzArray])
@@ -15,6 +15,8 @@ from . import _General
 from . import Beam as _Beam
 from . import Options as _Options
 
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+import gzip as _gzip
 import time as _time
 import os as _os
 import textwrap as _textwrap
@@ -27,6 +29,28 @@ sections = ['components',
             'material',
             'objects']
 
+def _Wrap(text, width=70):
+    """
+    Wrap text to lines of at most width characters exactly as textwrap.wrap does.
+    Text of words separated by single spaces (e.g. a sequence) is wrapped directly,
+    which is much faster. Anything else (e.g. hyphens textwrap may break at) uses textwrap.
+    """
+    words = text.split(' ')
+    if ('-' in text or '\t' in text or '\n' in text
+        or not all(words) or max(map(len, words)) > width):
+        return _textwrap.wrap(text, width)
+    lines = []
+    current = words[0]
+    for word in words[1:]:
+        if len(current) + 1 + len(word) <= width:
+            current += ' ' + word
+        else:
+            lines.append(current)
+            current = word
+    lines.append(current)
+    return lines
+
+
 class FileSection():
     """
     A class that represents a section of a gmad file. The sections that this
@@ -174,6 +198,8 @@ class Writer():
 
         self._mainFileLines   = []        #lines that will be written to the main file.
         self._elementsperline = 100       #number of machine elements per bdsim line (not text line)
+        self._itemsperwrite   = 2000      #number of elements joined into one string per write to a file
+        self._compress        = False     #write gzip compressed files (.gmad.gz)
         self._basefilename    = 'lattice' #default base file name
         self._timestring      = '! ' + _time.strftime("%a, %d %b %Y %H:%M:%S +0000", _time.gmtime()) + '\n'
 
@@ -188,7 +214,7 @@ class Writer():
         self._sectionsToBeWritten = []
 
     def WriteMachine(self,machine, filename, singlefile=False,
-                     verbose=True, overwrite=True):
+                     verbose=True, overwrite=True, nThreads=1, compress=False):
         """
         WriteMachine(machine(machine),filename(string),singlefile(bool),verbose(bool))
 
@@ -224,8 +250,20 @@ class Writer():
         kwargs:
         overwrite : Do not append an integer to the basefilename if
         already exists, instead overwrite existing files.
-
+        nThreads  : Number of sections written to separate files at the
+        same time. The elements are converted to text in Python, so this
+        mostly overlaps the disk writes and compression of the sections.
+        compress  : Write gzip compressed files (filename.gmad.gz etc.) as
+        they are generated. BDSIM reads uncompressed files, so these must
+        be decompressed before use (e.g. gunzip *.gmad.gz), but this saves
+        space when writing many variants of a large machine. The include
+        lines in the main file are the names once decompressed.
+
+        The text of each element is cached (see pybdsim.Builder.ElementBase),
+        so writing a machine again after changing some elements only converts
+        those elements again.
         """
+        self._compress = compress
         self._checkFiles(filename, overwrite)
 
         if singlefile:
@@ -241,15 +279,32 @@ class Writer():
                 self.Objects.WriteInMain()
 
         #write the individual files.
-        self.WriteComponents(machine)
-        self.WriteSequence(machine)
-        self.WriteSamplers(machine)
-        self.WriteBeam(machine)
-        self.WriteOptions(machine)
-        self.WriteBias(machine)
-        self.WriteMaterial(machine)
+        writers = [(self.Components, self.WriteComponents),
+                   (self.Sequence,   self.WriteSequence),
+                   (self.Samplers,   self.WriteSamplers),
+                   (self.Beam,       self.WriteBeam),
+                   (self.Options,    self.WriteOptions),
+                   (self.Bias,       self.WriteBias),
+                   (self.Material,   self.WriteMaterial)]
         if len(machine.objects) > 0:
-            self.WriteObjects(machine)
+            writers.append((self.Objects, self.WriteObjects))
+
+        if nThreads > 1:
+            # sections in the main file are kept in order by writing them here, the
+            # ones in separate files are written concurrently
+            order = ['Components', 'Sequence', 'Samplers', 'Beam', 'Options', 'Bias', 'Material', 'Objects']
+            with _ThreadPoolExecutor(nThreads) as executor:
+                futures = [executor.submit(write, machine) for section, write in writers
+                           if section._isWrittenSeparately]
+                for section, write in writers:
+                    if not section._isWrittenSeparately:
+                        write(machine)
+                for future in futures:
+                    future.result()
+            self._sectionsToBeWritten.sort(key=order.index)
+        else:
+            for section, write in writers:
+                write(machine)
 
         #Write main
         self.WriteMain(machine)
@@ -279,6 +334,8 @@ class Writer():
             fn_main = self._mainFilename #default
         else:
             fn_main = filename #override
+        if self._compress and not fn_main.endswith('.gz'):
+            fn_main += '.gz'
 
         #do not write if the beam, components or sequence sections have not been written.
         #These three have to exist for a machine to work.
@@ -288,7 +345,7 @@ class Writer():
             raise Exception(exceptionString)
 
         #write main file
-        with open(fn_main, 'w') as f:
+        with self._open(fn_main) as f:
             self._writeFileheader(
                 f, ["! Number of Elements:\t{}".format(len(machine.elements)),
                     "! Total length:\t\t{}m".format(machine.length)])
@@ -305,16 +362,16 @@ class Writer():
                 isUserDefined = getattr(sectObject,'_isUserDefined')
                 if not isUserDefined:
                     fn = fn.split('/')[-1]
+                    if self._compress and fn.endswith('.gz'):
+                        fn = fn[:-3] # the name once decompressed
                 f.write('include '+fn+';\n')
             f.write('\n\n')
 
             # write lines to main file from components, sequence etc.
-            for line in self._mainFileLines:
-                f.write(line)
+            self._writeItems(f, self._mainFileLines)
             #write samplers in this main file if less than 10 samplers.
             if len(machine.samplers) <= 10:
-                for sampler in machine.samplers:
-                    f.write(str(sampler))
+                self._writeItems(f, machine.samplers)
 
             # post includes
             if hasattr(machine, "includesPost"):
@@ -328,15 +385,15 @@ class Writer():
         filename.gmad
         """
         fn_components = self._getName(filename,'components')
+        # the element modifiers of a pybdsim.Builder.MachineVariant follow the base elements
+        components = list(machine.elements.values()) + list(getattr(machine, 'modifiers', {}).values())
         if self.Components._writeInMain:                #if _writeInMain, append strings to _mainFileLines list.
-            for element in list(machine.elements.values()):
-                self._mainFileLines.append(str(element))
+            self._mainFileLines.extend(map(str, components))
             self._mainFileLines.append('\r\n')
         elif self.Components._isWrittenSeparately:      #if _isWrittenSeparately, write directly to file here.
-            with open(fn_components, 'w') as f:
+            with self._open(fn_components) as f:
                 self._writeFileheader(f, ['! COMPONENT DEFINITION'])
-                for element in list(machine.elements.values()):
-                    f.write(str(element))
+                self._writeItems(f, components)
             self._sectionsToBeWritten.append('Components')
             self.Components._filePath = fn_components   #update FileSection path
         elif self.Components._isUserDefined:
@@ -353,14 +410,12 @@ class Writer():
         #write bias if it exists
         if len(machine.bias) > 0:
             if self.Bias._writeInMain:
-                for bias in machine.bias:
-                    self._mainFileLines.append(str(bias))
+                self._mainFileLines.extend(map(str, machine.bias))
                 self._mainFileLines.append('\r\n')
             elif self.Bias._isWrittenSeparately:
-                with open(fn_bias, 'w') as f:
+                with self._open(fn_bias) as f:
                     self._writeFileheader(f, ["! BIAS DEFINITION"])
-                    for bias in machine.bias:
-                        f.write(str(bias))
+                    self._writeItems(f, machine.bias)
                 self.Bias._filePath = fn_bias
                 self._sectionsToBeWritten.append('Bias')
         elif self.Bias._isUserDefined:
@@ -377,14 +432,12 @@ class Writer():
         #write matrial if it exists
         if len(machine.material) > 0:
             if self.Material._writeInMain:
-                for material in machine.material:
-                    self._mainFileLines.append(str(material))
+                self._mainFileLines.extend(map(str, machine.material))
                 self._mainFileLines.append('\r\n')
             elif self.Material._isWrittenSeparately:
-                with open(fn_material, 'w') as f:
+                with self._open(fn_material) as f:
                     self._writeFileheader(f, ["! MATERIAL DEFINITION"])
-                    for material in machine.material:
-                        f.write(str(material))
+                    self._writeItems(f, machine.material)
                 self.Material._filePath = fn_material
                 self._sectionsToBeWritten.append('Material')
         elif self.Material._isUserDefined:
@@ -411,7 +464,7 @@ class Writer():
             self._mainFileLines.append(object.ReturnBeamString())
             self._mainFileLines.append('\r\n')
         elif self.Beam._isWrittenSeparately:
-            with open(fn_beam, 'w') as f:
+            with self._open(fn_beam) as f:
                 self._writeFileheader(f, ["! BEAM DEFINITION"])
                 f.write(object.ReturnBeamString())
             self.Beam._filePath = fn_beam
@@ -431,14 +484,12 @@ class Writer():
         # if less than 10 samplers, just put in main file
         if len(machine.samplers) > 10:
             if self.Samplers._writeInMain:
-                for sampler in machine.samplers:
-                    self._mainFileLines.append(str(sampler))
+                self._mainFileLines.extend(map(str, machine.samplers))
                 self._mainFileLines.append('\r\n')
             elif self.Samplers._isWrittenSeparately:
-                with open(fn_samplers, 'w') as f:
+                with self._open(fn_samplers) as f:
                     self._writeFileheader(f, ["! SAMPLER DEFINITION"])
-                    for sampler in machine.samplers:
-                        f.write(str(sampler))
+                    self._writeItems(f, machine.samplers)
                 self.Samplers._filePath = fn_samplers
                 self._sectionsToBeWritten.append('Samplers')
         elif self.Samplers._isUserDefined:
@@ -453,14 +504,12 @@ class Writer():
         fn_objects = self._getName(filename,'objects')
 
         if self.Objects._writeInMain:
-            for obj in machine.objects:
-                self._mainFileLines.append(str(obj))
+            self._mainFileLines.extend(map(str, machine.objects))
             self._mainFileLines.append('\r\n')
         else:
-            with open(fn_objects, 'w') as f:
+            with self._open(fn_objects) as f:
                 self._writeFileheader(f, ["! OBJECTS DEFINITION"])
-                for obj in machine.objects:
-                    f.write(str(obj))
+                self._writeItems(f, machine.objects)
             self.Objects._filePath = fn_objects
             self._sectionsToBeWritten.append('Objects')
         self.Objects._hasBeenWritten = True
@@ -487,7 +536,7 @@ class Writer():
                 self._mainFileLines.append(object.ReturnOptionsString())
                 self._mainFileLines.append('\r\n')
             elif self.Options._isWrittenSeparately:
-                with open(fn_options, 'w') as f:
+                with self._open(fn_options) as f:
                     self._writeFileheader(f, ['! OPTIONS DEFINITION'])
                     f.write(object.ReturnOptionsString())
                 self.Options._filePath = fn_options
@@ -503,42 +552,54 @@ class Writer():
         """
         fn_sequence = self._getName(filename,'sequence')
 
-        # need to define the period before making sampler planes
-        sequencechunks = _General.Chunks(machine.sequence,self._elementsperline)
-        linelist = []
-        ti = 0
-
         #write lattice sequence
         if self.Sequence._writeInMain:
-            for line in _General.Chunks(machine.sequence,self._elementsperline):
-                # Use _textwrap.wrap to wrap very long lines
-                linetxt = '\n\t'.join(_textwrap.wrap(
-                    "l{}: line = ({});".format(ti, ', '.join(line))))
-                self._mainFileLines.append("{}\n".format(linetxt))
-                linelist.append('l'+str(ti))
-                ti += 1
-            self._mainFileLines.append('lattice: line = ('+', '.join(linelist)+');\n')
-            self._mainFileLines.append('use, period=lattice;\n')
+            self._mainFileLines.extend(self._sequenceLines(machine))
             self._mainFileLines.append('\r\n')
         elif self.Sequence._isWrittenSeparately:
-            with open(fn_sequence, 'w') as f:
+            with self._open(fn_sequence) as f:
                 self._writeFileheader(f, ["! LATTICE SEQUENCE DEFINITION"])
-                for line in _General.Chunks(machine.sequence,self._elementsperline):
-                    # Use _textwrap.wrap to wrap very long lines
-                    linetxt = '\n\t'.join(_textwrap.wrap(
-                        "l{}: line = ({});".format(ti, ', '.join(line))))
-                    f.write("{}\n".format(linetxt))
-                    linelist.append('l'+str(ti))
-                    ti += 1
-
-                f.write('lattice: line = ('+', '.join(linelist)+');\n')
-                f.write('use, period=lattice;\n')
+                self._writeItems(f, self._sequenceLines(machine))
             self.Sequence._filePath = fn_sequence
             self._sectionsToBeWritten.append('Sequence')
         elif self.Sequence._isUserDefined:
             self._sectionsToBeWritten.append('Sequence')
         self.Sequence._hasBeenWritten = True
 
+    def _sequenceLines(self, machine):
+        """
+        Return a list of the text lines of the sequence definition. The sequence is
+        split into bdsim lines of self._elementsperline elements that are wrapped
+        to text lines of at most 70 characters.
+        """
+        lines    = []
+        linelist = []
+        for ti, line in enumerate(_General.Chunks(machine.sequence,self._elementsperline)):
+            # wrap very long lines
+            linetxt = '\n\t'.join(_Wrap("l{}: line = ({});".format(ti, ', '.join(line))))
+            lines.append("{}\n".format(linetxt))
+            linelist.append('l'+str(ti))
+        lines.append('lattice: line = ('+', '.join(linelist)+');\n')
+        lines.append('use, period=lattice;\n')
+        return lines
+
+    def _open(self, filename):
+        """
+        Open a file to write text to, compressed with gzip if the name ends in '.gz'.
+        """
+        if filename.endswith('.gz'):
+            return _gzip.open(filename, 'wt', compresslevel=6)
+        return open(filename, 'w')
+
+    def _writeItems(self, f, items):
+        """
+        Write the text of each item (e.g. elements) to the open file f, joining
+        self._itemsperwrite items into one string for each write.
+        """
+        n = self._itemsperwrite
+        for i in range(0, len(items), n):
+            f.write(''.join(map(str, items[i:i+n])))
+
     def _getName(self,filename,sectiontype=''):
         #check input types are strings
         if not isinstance(filename, str):
@@ -563,6 +624,9 @@ class Writer():
             else:
                 fn_name = self._checkExtensionAndPath(filename)         #override filename
 
+        if self._compress and not fn_name.endswith('.gz'):
+            fn_name += '.gz'
+
         #check for duplicate file names.
         for section in self._sectionsToBeWritten:
             sectObject = getattr(self,section)
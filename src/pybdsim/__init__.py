@@ -8,6 +8,8 @@ Copyright Royal Holloway, University of London 2023.
 +-----------------+----------------------------------------------------------+
 | Builder         | Create generic accelerators for BDSIM.                   |
 +-----------------+----------------------------------------------------------+
+| Cache           | On-disk cache of columns extracted from output files.    |
++-----------------+----------------------------------------------------------+
 | Compare         | Comparison of optics between different codes.            |
 +-----------------+----------------------------------------------------------+
 | Constants       | Constants.                                               |
@@ -61,6 +63,7 @@ except ImportError:
 from . import Analysis
 from . import Beam
 from . import Builder
+from . import Cache
 from . import Constants
 from . import Convert
 from . import Compare
@@ -85,6 +88,7 @@ except:
 
 __all__ = ['Beam',
            'Builder',
+           'Cache',
            'Constants',
            'Convert',
            'Compare',
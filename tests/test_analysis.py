@@ -0,0 +1,23 @@
+import numpy as _np
+import pybdsim
+
+
+class _FakeSamplersData(dict):
+    def __init__(self, data, samplerIndicesOrNames, params):
+        super().__init__()
+        self.requested = list(samplerIndicesOrNames)
+        for i, name in enumerate(samplerIndicesOrNames):
+            self[name.rstrip(".")] = {"n" : _np.array([2, 2]),
+                                      "energy" : _np.array([1.0, 1.0]) + 0.5 * i}
+
+def _patch_data(monkeypatch):
+    data = pybdsim.Analysis._RMatrix._Data
+    monkeypatch.setattr(data, "Load", lambda filename : None)
+    monkeypatch.setattr(data, "_SamplerNames", lambda d : ["Primary", "d1.", "e1."])
+    monkeypatch.setattr(data, "SamplersData", _FakeSamplersData)
+
+def test_energy_gain_sampler_index(monkeypatch):
+    _patch_data(monkeypatch)
+    assert pybdsim.Analysis.CalculateEnergyGain("output.root", 1, 2) == 0.5
+    assert pybdsim.Analysis.CalculateEnergyGain("output.root", "d1", "e1.") == 0.5
+    assert pybdsim.Analysis.CalculateEnergyGain("output.root", 1, "e1") == 0.5
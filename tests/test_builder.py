@@ -1,4 +1,7 @@
+import copy
+import numpy as _np
 import pybdsim
+import pytest
 
 def test_drift():
     drift = pybdsim.Builder.Drift('myd', 0.5)
@@ -272,6 +275,176 @@ def test_eventgeneratorfile_repr():
     expected = 'beam,\tdistrType="eventgeneratorfile:FORMAT",\n\tenergy=100*GeV, \n\tparticle="proton";'
     assert repr(beam) == expected
 
+def _ring(nCells):
+    machine = pybdsim.Builder.Machine()
+    for i in range(nCells):
+        machine.Append(pybdsim.Builder.Quadrupole("qf"+str(i), 0.5, 0.1))
+        machine.Append(pybdsim.Builder.Drift("d"+str(i), 2.0))
+        machine.Append(pybdsim.Builder.SBend("b"+str(i), 3.0, angle=0.01))
+        machine.Append(pybdsim.Builder.Drift("d"+str(i), 2.0))
+    return machine
+
+def test_machine_lenint_and_index():
+    machine = _ring(3)
+    assert _np.allclose(machine.lenint, _np.cumsum([0.5, 2, 3, 2]*3))
+    assert machine.IndicesOf("d1") == [5, 7]
+    assert machine.IndicesOf("nothere") == []
+    assert machine.IndexAtS(0) == 0
+    assert machine.IndexAtS(0.5) == 1
+    assert machine.IndexAtS(machine.length) == 11
+    assert machine.ElementAtS(3.0).name == "b0"
+    with pytest.raises(ValueError):
+        machine.IndexAtS(machine.length + 1)
+
+def test_machine_lenint_after_modification():
+    machine = _ring(3)
+    machine.InsertAndReplace(pybdsim.Builder.Drift("ins", 0.2), sLocation=1.5)
+    assert machine.sequence[:4] == ["qf0", "d0_split_0", "ins", "d0_split_1"]
+    machine.Insert(pybdsim.Builder.Marker("m1"), index="b1")
+    machine.ReplaceWithElement("d2", pybdsim.Builder.Drift("d2", 1.0), warnAboutLengthDifference=False)
+    expected = _np.cumsum([machine.elements[name].length for name in machine.sequence])
+    assert _np.allclose(machine.lenint, expected)
+    assert machine.length == pytest.approx(expected[-1])
+    assert machine.IndicesOf("m1") == [machine.sequence.index("m1")]
+    with pytest.raises(ValueError):
+        machine.InsertAndReplace(pybdsim.Builder.Drift("ins", 0.2), sLocation=10)
+
+def test_machine_build_large():
+    machine = _ring(50000)
+    assert len(machine.sequence) == 200000
+    assert machine.length == pytest.approx(375000)
+    assert machine.IndexAtS(machine.length/2) == 100000
+
+
+def test_machine_select_elements():
+    machine = _ring(3)
+    assert machine.SelectElements(pattern="^qf") == ["qf0", "qf1", "qf2"]
+    assert machine.SelectElements(category="sbend", pattern="[12]$") == ["b1", "b2"]
+    assert machine.SelectElements(sRange=(7.5, 10.0)) == ["qf1", "d1"]
+    assert machine.SelectElements(predicate=lambda e: e.length > 2.5) == ["b0", "b1", "b2"]
+
+def test_machine_batch_update():
+    machine = _ring(3)
+    report = machine.BatchUpdate("k1", [0.1, 0.2, 0.3], category="quadrupole")
+    assert report["qf1"] == (0.1, 0.2)
+    assert machine.elements["qf2"]["k1"] == 0.3
+    report = machine.BatchUpdate("offsetX", lambda e: e.length * 1e-3, pattern="^d")
+    assert report["d0"] == (None, 2e-3)
+    machine.BatchUpdate("l", 1.0, names=["d1"])
+    assert machine.length == pytest.approx(20.5)
+    assert _np.allclose(machine.lenint, _np.cumsum([machine.elements[n].length for n in machine.sequence]))
+    with pytest.raises(ValueError):
+        machine.BatchUpdate("k1", [0.1, 0.2], category="quadrupole")
+    with pytest.raises(ValueError):
+        machine.BatchUpdate("k1", 0.1, names=["nothere"])
+
+
+def test_machine_update_element_length():
+    machine = _ring(3)
+    machine.UpdateElement("d1", "l", 1.0)
+    machine.UpdateElement("b2", "length", 2.0)
+    assert machine.elements["d1"].length == 1.0 and machine.elements["b2"].length == 2.0
+    assert machine.length == pytest.approx(19.5)
+    machine.RegenerateLenInt()
+    assert machine.length == pytest.approx(19.5)
+    assert _np.allclose(machine.lenint, _np.cumsum([machine.elements[n].length for n in machine.sequence]))
+    with pytest.raises(ValueError):
+        machine.UpdateElement("nothere", "l", 1.0)
+
+def test_element_string_cache():
+    quad = pybdsim.Builder.Quadrupole("qf", 0.5, 0.1)
+    assert str(quad) == 'qf: quadrupole, k1=0.1, l=0.5;\n'
+    quad["k1"] = 0.2
+    assert str(quad) == 'qf: quadrupole, k1=0.2, l=0.5;\n'
+    quad.category = "sextupole"
+    assert str(quad) == 'qf: sextupole, k1=0.2, l=0.5;\n'
+    del quad["k1"]
+    assert str(quad) == 'qf: sextupole, l=0.5;\n'
+
+def test_writer_threads_and_compress(tmpdir):
+    import gzip
+    machine = _ring(300)
+    pybdsim.Writer.Writer().WriteMachine(machine, str(tmpdir.join("a.gmad")), verbose=False)
+    pybdsim.Writer.Writer().WriteMachine(machine, str(tmpdir.join("b.gmad")), verbose=False,
+                                         nThreads=3, compress=True)
+    for section in ["_components", "_sequence", "_beam"]:
+        a = tmpdir.join("a" + section + ".gmad").read().splitlines()
+        with gzip.open(str(tmpdir.join("b" + section + ".gmad.gz")), "rt") as f:
+            b = f.read().splitlines()
+        assert a[1:] == b[1:] # not the time stamp
+    with gzip.open(str(tmpdir.join("b.gmad.gz")), "rt") as f:
+        main = f.read()
+    assert main.index("include b_components.gmad;") < main.index("include b_sequence.gmad;")
+    assert ".gz" not in main
+
+
+def test_machine_variant(tmpdir):
+    machine = _ring(3)
+    variant = machine.Variant()
+    report = variant.BatchUpdate("k1", lambda e: e["k1"]*2, category="quadrupole")
+    assert report["qf0"] == (0.1, 0.2)
+    variant.UpdateElement("qf0", "k1", 0.3)
+    variant.UpdateElement("b1", "offsetX", 1e-3)
+    assert machine.elements["qf0"]["k1"] == 0.1
+    assert "offsetX" not in machine.elements["b1"]
+    assert variant.GetElement("qf0")["k1"] == 0.3
+    assert variant.ModifiedNames() == ["qf0", "qf1", "qf2", "b1"]
+    with pytest.raises(ValueError):
+        variant.UpdateElement("d0", "l", 1.0)
+    variant.Reset(["qf2"])
+    variant.Write(str(tmpdir.join("variant.gmad")))
+    components = tmpdir.join("variant_components.gmad").read()
+    assert "qf0: quadrupole, k1=0.1, l=0.5;\nd0: " in components
+    assert components.endswith("qf0: k1=0.3;\nqf1: k1=0.2;\nb1: offsetX=0.001;\n")
+
+def test_machine_variant_write_options(tmpdir, capsys):
+    variant = _ring(2).Variant()
+    variant.UpdateElement("qf0", "k1", 0.3)
+    filename = str(tmpdir.join("v.gmad"))
+    variant.Write(filename)
+    assert capsys.readouterr().out == ""
+    variant.Write(filename, verbose=True, overwrite=False)
+    assert "Lattice written to" in capsys.readouterr().out
+    # not a single file and not overwritten
+    assert tmpdir.join("v_components.gmad").check()
+    assert tmpdir.join("v_1_components.gmad").check()
+    assert "qf0: k1=0.3;" in tmpdir.join("v_1_components.gmad").read()
+
+
+def test_machine_compact():
+    machine = _ring(5)
+    compact = _ring(5)
+    table = compact.Compact()
+    assert isinstance(compact.elements, pybdsim.Builder.ElementTable)
+    for m in (machine, compact):
+        m.InsertAndReplace(pybdsim.Builder.Drift("ins", 0.2), sLocation=10.0) # splits b1
+        m.BatchUpdate("k1", lambda e: e["k1"]*2, category="quadrupole")
+        m.Insert(pybdsim.Builder.Marker("mk"), index="b3")
+        m.elements["b4"]["e1"] = 0.01
+        m.elements["d4"]["apertureType"] = "rectangular"
+    assert compact.sequence == machine.sequence
+    assert [str(e) for e in compact.elements.values()] == [str(e) for e in machine.elements.values()]
+    quad = compact.elements["qf1"]
+    assert isinstance(quad, pybdsim.Builder.Quadrupole)
+    quad["k1"] = 0.5
+    assert str(compact.elements["qf1"]) == 'qf1: quadrupole, k1=0.5, l=0.5;\n'
+    assert type(copy.deepcopy(quad)) is pybdsim.Builder.Quadrupole
+    lengths = table.LengthByCategory(compact.sequence)
+    assert lengths["sbend"] == pytest.approx(14.9)
+    assert sum(lengths.values()) == pytest.approx(compact.length)
+    assert table.Sum("angle", compact.sequence) == pytest.approx(0.0496667, rel=1e-5)
+    assert compact.GetNamesOfType("sbend") == machine.GetNamesOfType("sbend")
+
+
+def test_machine_compact_split():
+    compact = _ring(2)
+    compact.Append(pybdsim.Builder.Element("g", "drift", l=1.0))
+    compact.Compact()
+    parts = compact.elements["d1"].split([0.5])
+    assert [type(p) for p in parts] == [pybdsim.Builder.Drift]*2
+    assert [p.length for p in parts] == [0.5, 1.5]
+    with pytest.raises(TypeError, match="Only a specific element can be split."):
+        compact.elements["g"].split([0.5])
 
 #test_element_split_sbend()
 #test_drift_split()
@@ -0,0 +1,89 @@
+import os
+import numpy as _np
+import pybdsim
+
+
+def _put(cache, tmp_path, name, n=1000):
+    fn = tmp_path / (name + ".root")
+    fn.write_text(name)
+    key = cache.Key([str(fn)], "Event", ["x"])
+    cache.Put(key, {"x" : _np.arange(n, dtype=float)})
+    return key
+
+def test_cache_put_get(tmp_path):
+    cache = pybdsim.Cache.ColumnCache(str(tmp_path / "cache"))
+    data = {"x" : _np.arange(5.0), "names" : _np.array([[1, 2], [3]], dtype=object)}
+    fn = tmp_path / "a.root"
+    fn.write_text("a")
+    key = cache.Key(str(fn), "Event", ["x", "names"])
+    assert cache.Get(key) is None
+    cache.Put(key, data)
+    assert key in cache
+    result = cache.Get(key)
+    assert _np.array_equal(result["x"], data["x"])
+    assert list(result["names"][1]) == [3]
+    # writable without changing the cache
+    result["x"] -= 1
+    assert _np.array_equal(cache.Get(key)["x"], data["x"])
+
+def test_cache_object_columns(tmp_path):
+    cache = pybdsim.Cache.ColumnCache(str(tmp_path / "cache"))
+    fn = tmp_path / "a.root"
+    fn.write_text("a")
+    key = cache.Key(str(fn), "Event", ["names", "jagged"])
+    jagged = _np.empty(3, dtype=object)
+    jagged[:] = [_np.arange(3.0), _np.array([]), _np.array([7.0])]
+    cache.Put(key, {"names" : _np.array(["a", "bc"], dtype=object), "jagged" : jagged})
+    result = cache.Get(key)
+    assert result["names"].dtype == object and list(result["names"]) == ["a", "bc"]
+    assert [list(v) for v in result["jagged"]] == [[0, 1, 2], [], [7]]
+    # nothing in the cache needs unpickling
+    entry = os.path.join(cache.directory, key)
+    for name in os.listdir(entry):
+        if name.endswith(".npy"):
+            _np.load(os.path.join(entry, name), allow_pickle=False)
+    # other objects are not cached
+    key = cache.Key(str(fn), "Event", ["other"])
+    cache.Put(key, {"other" : _np.array([{"a" : 1}, None], dtype=object)})
+    assert key not in cache
+
+def test_cache_key_changes_with_file(tmp_path):
+    cache = pybdsim.Cache.ColumnCache(str(tmp_path / "cache"))
+    fn = tmp_path / "a.root"
+    fn.write_text("a")
+    key = cache.Key(str(fn), "Event", ["x"])
+    assert cache.Key(str(fn), "Event", ["x"]) == key
+    assert cache.Key(str(fn), "Event", ["y"]) != key
+    fn.write_text("longer")
+    assert cache.Key(str(fn), "Event", ["x"]) != key
+
+def test_cache_evict_lru(tmp_path):
+    cache = pybdsim.Cache.ColumnCache(str(tmp_path / "cache"))
+    keys = [_put(cache, tmp_path, name) for name in "abc"]
+    entrySize = cache.Size() / 3
+    # make 'b' the least recently used, then 'a' is used by Get
+    for i, key in enumerate(keys):
+        os.utime(os.path.join(cache.directory, key, "meta.json"), (1000 + i, 1000 + i))
+    os.utime(os.path.join(cache.directory, keys[1], "meta.json"), (10, 10))
+    cache.Get(keys[0])
+    cache.Evict(2.5 * entrySize)
+    assert keys[1] not in cache
+    assert keys[0] in cache and keys[2] in cache
+    cache.Evict(1.5 * entrySize)
+    assert [key in cache for key in keys] == [True, False, False]
+
+def test_cache_max_size(tmp_path):
+    cache = pybdsim.Cache.ColumnCache(str(tmp_path / "cache"), maxSize=1)
+    _put(cache, tmp_path, "a")
+    assert cache.Size() == 0
+    cache.Clear()
+
+def test_cache_enable_disable(tmp_path):
+    cache = pybdsim.Cache.Enable(str(tmp_path / "cache"), maxSize=1e6)
+    try:
+        assert pybdsim.Cache.GetCache() is cache
+        assert cache.maxSize == 1e6
+        assert os.path.isdir(str(tmp_path / "cache"))
+    finally:
+        pybdsim.Cache.Disable()
+    assert pybdsim.Cache.GetCache() is None
@@ -0,0 +1,42 @@
+import fnmatch
+import pybdsim
+
+
+class _FakeBranch:
+    def __init__(self, name, subBranches=()):
+        self.name = name
+        self.subBranches = [_FakeBranch(s) for s in subBranches]
+
+    def GetName(self):
+        return self.name
+
+    def GetListOfBranches(self):
+        return self.subBranches
+
+class _FakeTree:
+    def __init__(self, branches):
+        self.branches = [_FakeBranch(name, subs) for name, subs in branches.items()]
+        self.status = {n : True for name, subs in branches.items() for n in [name] + list(subs)}
+
+    def GetListOfBranches(self):
+        return self.branches
+
+    def GetBranchStatus(self, name):
+        return self.status[name]
+
+    def SetBranchStatus(self, pattern, status):
+        for name in self.status:
+            if fnmatch.fnmatch(name, pattern):
+                self.status[name] = bool(status)
+
+def test_restore_branch_statuses():
+    tree = _FakeTree({"d1." : ["d1.x", "d1.y"], "Trajectory." : ["Trajectory.n"], "Eloss." : ["Eloss.S"]})
+    tree.SetBranchStatus("Eloss*", 0)
+    before = dict(tree.status)
+    statuses = pybdsim.Data._BranchStatuses(tree)
+    assert statuses == before
+    tree.SetBranchStatus("*", 0)
+    tree.SetBranchStatus("d1.*", 1)
+    pybdsim.Data._RestoreBranchStatuses(tree, statuses)
+    # branches the caller disabled stay disabled
+    assert tree.status == before
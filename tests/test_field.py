@@ -0,0 +1,122 @@
+import numpy as _np
+import pytest
+from scipy.interpolate import RegularGridInterpolator as _RegularGridInterpolator
+
+import pybdsim
+
+
+def _field2d(function, x=_np.linspace(-2, 3, 6), y=_np.linspace(0, 4, 5)):
+    xx, yy = _np.meshgrid(x, y, indexing='ij')
+    data = _np.stack([xx, yy] + list(function(xx, yy)), axis=-1)
+    return pybdsim.Field.Field2D(data)
+
+def _linearField(x, y):
+    return 2*x + 3*y + 1, x*y, _np.full_like(x, 0.5)
+
+def _smoothField(x, y):
+    return _np.sin(x) * _np.cos(y), x**2 - y, _np.exp(-x*x)
+
+def _randomPoints(n=200, seed=1):
+    rng = _np.random.default_rng(seed)
+    return _np.column_stack([rng.uniform(-2, 3, n), rng.uniform(0, 4, n)])
+
+
+def test_interpolator_linear_exact():
+    fi = pybdsim.Field.Interpolator(_field2d(_linearField), "linear")
+    points = _randomPoints()
+    expected = _np.column_stack(_linearField(points[:, 0], points[:, 1]))
+    assert _np.allclose(fi(points), expected)
+
+@pytest.mark.parametrize("method", ["nearest", "linear"])
+def test_interpolator_matches_scipy(method):
+    field = _field2d(_smoothField)
+    fi = pybdsim.Field.Interpolator(field, method)
+    points = _randomPoints()
+    x, y = field.data[:, 0, 0], field.data[0, :, 1]
+    for i in range(3):
+        rgi = _RegularGridInterpolator((x, y), field.data[:, :, 2 + i], method=method)
+        assert _np.allclose(fi(points)[:, i], rgi(points))
+
+def test_interpolator_cubic_exact_at_nodes():
+    field = _field2d(_smoothField)
+    fi = pybdsim.Field.Interpolator(field, "cubic2d")
+    nodes = field.data[:, :, :2].reshape(-1, 2)
+    assert _np.allclose(fi(nodes), field.data[:, :, 2:].reshape(-1, 3))
+
+def test_interpolator_outside_is_zero():
+    fi = pybdsim.Field.Interpolator(_field2d(_linearField), "cubic")
+    b = fi([[-2.5, 1], [3.5, 1], [1, -0.1], [1, 4.1], [1, 1]])
+    assert _np.all(b[:4] == 0)
+    assert _np.all(b[4] != 0)
+
+def test_interpolator_reflectx():
+    fi = pybdsim.Field.Interpolator(_field2d(_smoothField, x=_np.linspace(0, 3, 7)), "linear", "reflectx")
+    points = _np.column_stack([_np.linspace(0.1, 2.9, 10), _np.linspace(0.2, 3.8, 10)])
+    mirrored = points * [-1, 1]
+    assert _np.allclose(fi(mirrored), fi(points) * [-1, 1, 1])
+
+def test_interpolator_dimension_mismatch():
+    field = _field2d(_linearField)
+    with pytest.raises(ValueError):
+        pybdsim.Field.Interpolator(field, "cubic3d")
+    with pytest.raises(ValueError):
+        pybdsim.Field.Interpolator(field, "spline")
+
+
+def _field3d():
+    x, y, z = _np.meshgrid(_np.linspace(-1, 1, 3), _np.linspace(0, 2, 4), _np.linspace(0, 1, 5), indexing='ij')
+    data = _np.stack([x, y, z, x + y, y * z, _np.cos(z) + 1 / 3], axis=-1)
+    return pybdsim.Field.Field3D(data)
+
+@pytest.mark.parametrize("dtype", [_np.float64, _np.float32])
+def test_field_binary_round_trip(tmp_path, dtype):
+    field = _field3d()
+    field.AddComment("test")
+    fileName = str(tmp_path / "field.bin")
+    field.WriteBinary(fileName, dtype)
+    loaded = pybdsim.Field.Load(fileName)
+    assert type(loaded) is pybdsim.Field.Field3D
+    assert loaded.nDimensions == 3
+    assert loaded.columns == field.columns
+    assert loaded.comments == ["test"]
+    assert loaded.header == field.header
+    assert isinstance(loaded.data, _np.memmap) and loaded.data.dtype == dtype
+    assert _np.array_equal(loaded.data, field.data.astype(dtype))
+
+    # scaling the copy-on-write memory map doesn't change the file
+    loaded.ScaleField(2)
+    assert _np.allclose(loaded.data[..., 3:], 2 * field.data[..., 3:].astype(dtype))
+    assert _np.array_equal(pybdsim.Field.Load(fileName).data, field.data.astype(dtype))
+
+
+def _shuffled(data, nDim, repeat=0, seed=2):
+    points = data.reshape(-1, data.shape[-1])
+    points = _np.concatenate([points, points[:repeat]])
+    points = points[_np.random.default_rng(seed).permutation(len(points))]
+    return points.reshape(len(points), *[1] * (nDim - 1), data.shape[-1])
+
+def test_sort_unordered_field_map_2d():
+    field = _field2d(_smoothField)
+    jumbled = pybdsim.Field.Field2D(_shuffled(field.data, 2))
+    jumbled.AddComment("jumbled")
+    result = pybdsim.Field.SortUnorderedFieldMap2D(jumbled)
+    # an [x][y] grid as made by Field2D
+    assert _np.array_equal(result.data, field.data)
+    assert result.header == field.header
+    assert result.comments == ["jumbled"]
+
+def test_sort_unordered_field_map_3d():
+    field = _field3d()
+    # duplicate points are removed
+    jumbled = pybdsim.Field.Field3D(_shuffled(field.data, 3, repeat=7))
+    result = pybdsim.Field.SortUnorderedFieldMap3D(jumbled)
+    assert _np.array_equal(result.data, field.data)
+    assert result.header == field.header
+
+def test_sort_unordered_field_map_incomplete_grid():
+    field = _field3d()
+    points = _shuffled(field.data, 3)[1:]
+    with pytest.raises(ValueError):
+        pybdsim.Field.SortUnorderedFieldMap3D(pybdsim.Field.Field3D(points))
+    with pytest.raises(ValueError):
+        pybdsim.Field.SortUnorderedFieldMap3D(pybdsim.Field.Field3D(_shuffled(field.data, 3)), "reflectw")
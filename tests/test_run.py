@@ -1,3 +1,6 @@
+import pytest
+import subprocess
+
 import pybdsim
 
 
@@ -7,3 +10,149 @@ def test_run_bdskim_custom():
 #        return event.d1.n > 2
 #
 #    pybdsim.Data.SkimBDSIMFile("samplerdata", filter)
+
+
+def _make_fake_bdsim(tmp_path):
+    # fails the first time for odd seeds, otherwise writes outfile.root
+    script = tmp_path / "fakebdsim"
+    script.write_text("#!" + __import__("sys").executable + "\n"
+                      "import os, sys\n"
+                      "args = dict(a[2:].split('=', 1) for a in sys.argv[1:] if '=' in a)\n"
+                      "marker = args['outfile'] + '.tried'\n"
+                      "if int(args['seed']) % 2 and not os.path.exists(marker):\n"
+                      "    open(marker, 'w').close()\n"
+                      "    sys.exit(1)\n"
+                      "open(args['outfile'] + '.root', 'w').write('x' * 10)\n")
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_job_scheduler_retries_and_manifest(tmp_path):
+    exe = _make_fake_bdsim(tmp_path)
+    manifest = str(tmp_path / "manifest.json")
+    outfile = str(tmp_path / "run")
+    js = pybdsim.Run.BdsimParallel("model.gmad", outfile, nJobs=4, startseed=10, bdsimExecutable=exe,
+                                   nCPUs=2, retries=1, manifest=manifest, silent=True)
+    assert len(js.Done()) == 4
+    assert [js[outfile + "_" + str(i) + ".root"].attempts for i in range(4)] == [1, 2, 1, 2]
+    assert js.OutputSize() == 40
+
+    # all jobs are done so nothing is run again
+    js2 = pybdsim.Run.JobScheduler(manifest)
+    for i in range(4):
+        js2.AddBdsim("model.gmad", outfile + "_" + str(i), seed=10 + i, bdsimExecutable=exe)
+    assert len(js2) == 4 and not js2.Pending()
+
+
+def test_job_scheduler_failure(tmp_path):
+    js = pybdsim.Run.JobScheduler()
+    js.AddJob([str(tmp_path / "doesnotexist")], name="missing")
+    js.AddJob([__import__("sys").executable, "-c", "pass"], outputs=[str(tmp_path / "none.root")])
+    failed = js.Run(nCPUs=2, retries=1, progress=False)
+    assert len(failed) == 2
+    assert all(j.attempts == 2 for j in failed)
+
+
+def test_job_scheduler_resume_failed(tmp_path):
+    manifest = str(tmp_path / "manifest.json")
+    args = [__import__("sys").executable, "-c", "pass"]
+    outputs = [str(tmp_path / "none.root")]
+    js = pybdsim.Run.JobScheduler(manifest)
+    js.AddJob(args, outputs=outputs, name="job")
+    js.Run(nCPUs=1, retries=2, progress=False)
+    assert js["job"].attempts == 3
+    # reloaded failed jobs get all their retries again
+    js2 = pybdsim.Run.JobScheduler(manifest)
+    js2.AddJob(args, outputs=outputs, name="job")
+    failed = js2.Run(nCPUs=1, retries=2, progress=False)
+    assert failed[0].attempts == 3
+
+
+def test_job_scheduler_manifest_writes(tmp_path):
+    js = pybdsim.Run.JobScheduler(str(tmp_path / "manifest.json"))
+    js.AddJob([__import__("sys").executable, "-c", "import time; time.sleep(0.5)"], name="job")
+    writes = []
+    writeManifest = js.WriteManifest
+    js.WriteManifest = lambda: writes.append(js["job"].status) or writeManifest()
+    js.Run(nCPUs=1, progress=False, pollInterval=0.01)
+    # only written when the job starts and when it finishes, not on every poll
+    assert writes == ['running', 'done']
+
+
+def _make_script(tmp_path, name, body):
+    script = tmp_path / name
+    script.write_text("#!" + __import__("sys").executable + "\nimport sys\n" + body)
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_bdsim_pipeline(tmp_path):
+    bdsim = _make_fake_bdsim(tmp_path)
+    # each analysis output holds a count of 1 and combining sums the counts
+    rebdsim = _make_script(tmp_path, "fakerebdsim", "open(sys.argv[3], 'w').write('1')\n")
+    combine = _make_script(tmp_path, "fakecombine",
+                           "open(sys.argv[1], 'w').write(str(sum(int(open(f).read()) for f in sys.argv[2:])))\n")
+    outfile = str(tmp_path / "run")
+    js = pybdsim.Run.BdsimPipeline("model.gmad", outfile, "analysis.txt", nJobs=7, startseed=2, fanIn=3,
+                                   rawFiles="delete", nCPUs=3, retries=1, progress=False,
+                                   bdsimExecutable=bdsim, rebdsimExecutable=rebdsim,
+                                   rebdsimCombineExecutable=combine)
+    assert not js.Failed()
+    assert open(outfile + "_ana.root").read() == "7"
+    files = sorted(p.name for p in tmp_path.iterdir() if p.name.endswith(".root"))
+    assert files == ["run_" + str(i) + "_ana.root" for i in range(7)] + ["run_ana.root"]
+
+
+def test_bdsim_pipeline_failed_combine(tmp_path):
+    bdsim = _make_fake_bdsim(tmp_path)
+    rebdsim = _make_script(tmp_path, "fakerebdsim", "open(sys.argv[3], 'w').write('1')\n")
+    # the first intermediate combine always fails, so its inputs go to the final combine
+    combine = _make_script(tmp_path, "fakecombine",
+                           "if sys.argv[1].endswith('_merge_1_0.root'): sys.exit(1)\n"
+                           "open(sys.argv[1], 'w').write(str(sum(int(open(f).read()) for f in sys.argv[2:])))\n")
+    outfile = str(tmp_path / "run")
+    kwargs = dict(nJobs=7, startseed=2, fanIn=3, nCPUs=1, retries=1, progress=False, bdsimExecutable=bdsim,
+                  rebdsimExecutable=rebdsim)
+    js = pybdsim.Run.BdsimPipeline("model.gmad", outfile, "analysis.txt", rebdsimCombineExecutable=combine, **kwargs)
+    assert len(js.Failed()) == 1
+    assert open(outfile + "_ana.root").read() == "7"
+
+    # the final combine fails - the intermediate merged files are kept
+    fail = _make_script(tmp_path, "fakecombinefinal",
+                        "if sys.argv[1].endswith('run2_ana.root'): sys.exit(1)\n"
+                        "open(sys.argv[1], 'w').write(str(sum(int(open(f).read()) for f in sys.argv[2:])))\n")
+    with pytest.raises(RuntimeError):
+        pybdsim.Run.BdsimPipeline("model.gmad", str(tmp_path / "run2"), "analysis.txt",
+                                  rebdsimCombineExecutable=fail, **kwargs)
+    assert len(list(tmp_path.glob("run2_ana_merge_*.root"))) == 2
+
+
+def test_tree_reduce(tmp_path):
+    combine = _make_script(tmp_path, "fakecombine",
+                           "open(sys.argv[1], 'w').write(str(sum(int(open(f).read()) for f in sys.argv[2:])))\n")
+    histomerge = _make_script(tmp_path, "fakehistomerge", "open(sys.argv[2], 'w').write(open(sys.argv[1]).read())\n")
+    for i in range(25):
+        (tmp_path / ("in_" + str(i) + ".root")).write_text("1")
+    output = str(tmp_path / "total.root")
+
+    pybdsim.Run.TreeReduce(str(tmp_path / "in_*.root"), output, fanIn=4, executable=combine, nCPUs=2)
+    assert open(output).read() == "25"
+    assert len(list(tmp_path.glob("*.root"))) == 26 # no intermediate files left
+
+    pybdsim.Run.TreeReduce(str(tmp_path / "in_*.root"), output, fanIn=3, tool="rebdsimHistoMerge",
+                           executable=histomerge, rebdsimCombineExecutable=combine)
+    assert open(output).read() == "25"
+    assert len(list(tmp_path.glob("*.root"))) == 26
+
+    pybdsim.Run.ReduceParallel(str(tmp_path / "in_*.root"), 10, str(tmp_path / "chunk"), nCPUs=2,
+                               combineExecutable=combine, outputFileName=output)
+    assert open(output).read() == "25"
+    assert len(list(tmp_path.glob("*.root"))) == 26
+
+
+def test_tree_reduce_failure(tmp_path):
+    fail = _make_script(tmp_path, "fakefail", "sys.exit(2)\n")
+    for i in range(3):
+        (tmp_path / ("in_" + str(i) + ".root")).write_text("1")
+    with pytest.raises(subprocess.CalledProcessError):
+        pybdsim.Run.TreeReduce(str(tmp_path / "in_*.root"), str(tmp_path / "total.root"), executable=fail)